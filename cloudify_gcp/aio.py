@@ -0,0 +1,103 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+asyncio API waiting for many GCP operations from one thread, e.g. in
+workflows:
+
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(
+        wait_all(responses, gcp_config, ctx.logger, timeout=600))
+
+Waiting operations sleep in the event loop. Only the polling requests run
+in a small thread pool, and the operation multiplexer shares them between
+all operations of a scope.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from . import constants
+from .utils import Operation, operation_multiplexer, response_to_operation
+
+
+async def wait(operation, semaphore, executor):
+    """
+    Wait until an operation is done, polling it with a growing delay.
+
+    :param operation: Operation object
+    :param semaphore: asyncio.Semaphore bounding the requests in flight
+    :param executor: executor running the polling requests
+    :return: last response of the operation
+    :raises GCPError: if the operation failed
+    """
+    loop = asyncio.get_event_loop()
+    delay = constants.OPERATION_POLL_MIN_DELAY
+    while True:
+        async with semaphore:
+            finished = await loop.run_in_executor(
+                executor, operation.has_finished)
+        if finished:
+            return operation.last_response
+        await asyncio.sleep(delay)
+        delay = min(delay * constants.OPERATION_POLL_FACTOR,
+                    constants.OPERATION_POLL_MAX_DELAY)
+
+
+async def wait_all(operations, config=None, logger=None, timeout=None,
+                   concurrency=constants.OPERATION_WAIT_CONCURRENCY):
+    """
+    Wait for operations concurrently.
+
+    :param operations: Operation objects, or operation responses or handles
+    :param config: gcp config of the operations given as responses
+    :param logger: logger of the operations given as responses
+    :param timeout: seconds to wait for all the operations, or None
+    :param concurrency: maximum number of polling requests in flight
+    :return: list with an entry per operation, in order: the last response
+    of the operation, or the exception it failed with. Operations not done
+    within the timeout get an asyncio.TimeoutError.
+    """
+    operations = [
+        operation if isinstance(operation, Operation)
+        else response_to_operation(operation, config, logger)
+        for operation in operations]
+    if not operations:
+        return []
+    # The first poll of every scope refreshes all of its operations
+    operation_multiplexer.track(operations)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(concurrency)
+    try:
+        tasks = [asyncio.ensure_future(wait(operation, semaphore, executor))
+                 for operation in operations]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+    finally:
+        executor.shutdown(wait=False)
+
+    results = []
+    for operation, task in zip(operations, tasks):
+        if task in pending:
+            results.append(asyncio.TimeoutError(
+                'Operation {0} not done after {1} seconds'.format(
+                    operation.name, timeout)))
+        elif task.exception():
+            results.append(task.exception())
+        else:
+            results.append(task.result())
+    return results
@@ -13,7 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import time
 from os.path import basename
 
 from cloudify import ctx
@@ -65,7 +64,7 @@ class Address(GoogleCloudPlatform):
             if self.region:
                 args['region'] = self.region
             else:
-                args['region'] = self.ZONES[self.config['zone']]['region_name']
+                args['region'] = self.get_region(self.config['zone'])
         return args
 
     @check_response
@@ -129,11 +128,3 @@ def delete(**kwargs):
                 )
 
         utils.delete_if_not_external(address)
-
-
-def get_reserved_ip_address(static_ip):
-    while True:
-        response = static_ip.get()
-        if response.get('address'):
-            return response.get('address')
-        time.sleep(2)
@@ -68,8 +68,8 @@ class BackendService(GoogleCloudPlatform):
 
     @check_response
     def list(self):
-        return self.discovery.backendServices().list(
-            project=self.project).execute()
+        return {'items': list(self.paginate(
+            self.discovery.backendServices(), project=self.project))}
 
     @utils.async_operation(get=True)
     @check_response
@@ -66,9 +66,10 @@ class Disk(GoogleCloudPlatform):
 
     @check_response
     def list(self):
-        return self.discovery.disks().list(
+        return {'items': list(self.paginate(
+            self.discovery.disks(),
             project=self.project,
-            zone=self.zone).execute()
+            zone=self.zone))}
 
     @utils.sync_operation
     @check_response
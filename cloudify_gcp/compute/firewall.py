@@ -142,8 +142,8 @@ class FirewallRule(GoogleCloudPlatform):
         self.logger.info(
             'List firewall rules in project {0}'.format(self.project))
 
-        return self.discovery.firewalls().list(
-            project=self.project).execute()
+        return {'items': list(self.paginate(
+            self.discovery.firewalls(), project=self.project))}
 
     def to_dict(self):
         self.body.update({
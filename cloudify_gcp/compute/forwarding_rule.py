@@ -94,8 +94,9 @@ class ForwardingRule(GoogleCloudPlatform):
 
     @check_response
     def list(self):
-        return self.discovery.forwardingRules().list(
-            project=self.project, region=basename(self.region)).execute()
+        return {'items': list(self.paginate(
+            self.discovery.forwardingRules(),
+            project=self.project, region=basename(self.region)))}
 
     @utils.async_operation(get=True)
     @check_response
@@ -67,7 +67,8 @@ class HealthCheck(GoogleCloudPlatform, _compat.ABC):
 
     @check_response
     def list(self):
-        return self._gcp_health_checks().list(project=self.project).execute()
+        return {'items': list(self.paginate(
+            self._gcp_health_checks(), project=self.project))}
 
     @utils.async_operation()
     @check_response
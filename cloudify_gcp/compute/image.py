@@ -81,16 +81,14 @@ class Image(GoogleCloudPlatform):
                                               image=self.name).execute()
 
     def list(self):
-        image_list = self.discovery.images().list(
-                project=self.project).execute()
-        return image_list['items']
+        return list(self.paginate(
+            self.discovery.images(), project=self.project))
 
     def list_objects(self):
         storage = self.create_discovery(discovery=constants.STORAGE_DISCOVERY,
                                         scope=constants.STORAGE_SCOPE_RW,
                                         api_version=constants.API_V1)
-        response = storage.objects().list(bucket=self.project).execute()
-        return response.get('items')
+        return list(self.paginate(storage.objects(), bucket=self.project))
 
     def to_dict(self):
         self.body.update({
@@ -19,6 +19,9 @@ import re
 from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
+from cloudify.manager import get_rest_client
+from cloudify_rest_client.exceptions import CloudifyClientError
+from googleapiclient.errors import HttpError
 from .. import _compat
 from .. import utils
 from .. import constants
@@ -33,6 +36,19 @@ PS_OPEN = '<powershell>'
 PS_CLOSE = '</powershell>'
 POWERSHELL_SCRIPTS = ['sysprep-specialize-script-ps1',
                       'windows-startup-script-ps1']
+# Fields of the instance needed to find its IP addresses
+NETWORK_FIELDS = 'name,networkInterfaces'
+# States of node instances whose create operation did not finish yet
+BULK_CREATE_STATES = ('uninitialized', 'initializing', 'creating', 'created',
+                      'configuring')
+# Runtime properties of the node instance sending a bulkInsert: the names of
+# the VMs it creates, and its operation, which is kept once it finished
+BULK_NAMES = '_bulk_names'
+BULK_OPERATION = '_bulk_operation'
+# Runtime property of the deadline of waiting for the leader of the group
+BULK_LEADER_DEADLINE = '_bulk_leader_deadline'
+# Result of waiting for a VM whose bulkInsert will not create it
+BULK_FAILED = object()
 
 
 class Instance(GoogleCloudPlatform):
@@ -91,6 +107,8 @@ class Instance(GoogleCloudPlatform):
         self.network = network
         self.subnetwork = subnetwork
         self.can_ip_forward = can_ip_forward
+        # Names of the VMs created together with this one by bulkInsert
+        self.bulk_names = None
 
     @utils.sync_operation
     @check_response
@@ -162,6 +180,19 @@ class Instance(GoogleCloudPlatform):
         if not self.disks and not self.image:
             raise NonRecoverableError("A disk image ID must be provided")
 
+        if self.bulk_names:
+            self.logger.info('Create instances {0}'.format(
+                ', '.join(self.bulk_names)))
+            props = ctx.instance.runtime_properties
+            props[BULK_NAMES] = self.bulk_names
+            props.pop(BULK_OPERATION, None)
+            response = self.discovery.instances().bulkInsert(
+                project=self.project,
+                zone=basename(self.zone),
+                body=self.to_bulk_dict(self.bulk_names)).execute()
+            props[BULK_OPERATION] = utils.operation_handle(response)
+            return response
+
         return self.discovery.instances().insert(
             project=self.project,
             zone=basename(self.zone),
@@ -232,19 +263,23 @@ class Instance(GoogleCloudPlatform):
             body={'items': self.tags, 'fingerprint': fingerprint}).execute()
 
     @check_response
-    def get(self):
+    def get(self, fields=None):
         """
         Get GCP instance details.
 
+        :param fields: optional partial response selector, e.g.
+        'name,networkInterfaces'
         :return: REST response with operation responsible for the instance
         details retrieval
         """
         self.logger.info('Get instance {0} details'.format(self.name))
+        kwargs = {'fields': fields} if fields else {}
 
         return self.discovery.instances().get(
             instance=self.name,
             project=self.project,
-            zone=basename(self.zone)).execute()
+            zone=basename(self.zone),
+            **kwargs).execute()
 
     @utils.sync_operation
     @check_response
@@ -334,9 +369,10 @@ class Instance(GoogleCloudPlatform):
         """
         self.logger.info('List instances in project {0}'.format(self.project))
 
-        return self.discovery.instances().list(
+        return {'items': list(self.paginate(
+            self.discovery.instances(),
             project=self.project,
-            zone=basename(self.zone)).execute()
+            zone=basename(self.zone)))}
 
     def to_dict(self):
         def add_key_value_to_metadata(key, value, body):
@@ -399,6 +435,37 @@ class Instance(GoogleCloudPlatform):
         ctx.logger.debug('Body that being used: {0}'.format(self.body))
         return self.body
 
+    def to_bulk_dict(self, names):
+        """
+        Body of a bulkInsert request creating VMs with the given names and
+        the properties of this instance.
+
+        :param names: names of the VMs
+        """
+        properties = dict(self.to_dict())
+        properties.pop(constants.NAME)
+        properties['machineType'] = self.machine_type
+        return {
+            'count': len(names),
+            'minCount': len(names),
+            'perInstanceProperties': {name: {} for name in names},
+            'instanceProperties': properties,
+        }
+
+    def existing_names(self, names):
+        """
+        :param names: names of VMs in the zone of this instance
+        :return: set of the names of the VMs which exist
+        """
+        name_filter = ' OR '.join(
+            '(name = "{0}")'.format(name) for name in names)
+        return set(item[constants.NAME] for item in self.paginate(
+            self.discovery.instances(),
+            filter=name_filter,
+            fields='items(name)',
+            project=self.project,
+            zone=basename(self.zone)))
+
 
 @operation(resumable=True)
 @utils.throw_cloudify_exceptions
@@ -412,6 +479,7 @@ def create(instance_type,
            zone=None,
            can_ip_forward=False,
            additional_settings=None,
+           bulk_create=False,
            **kwargs):
     if utils.resource_created(ctx, constants.RESOURCE_ID):
         return
@@ -475,9 +543,184 @@ def create(instance_type,
     ctx.instance.runtime_properties[constants.NAME] = instance.name
     ctx.instance.runtime_properties[constants.MACHINE_TYPE] = \
         instance.machine_type
+    blocker = bulk_create and get_bulk_blocker(name, disks)
+    if blocker:
+        ctx.logger.info(
+            'Not creating the instance in bulk: {0}.'.format(blocker))
+    if bulk_create and not blocker:
+        create_in_bulk(instance)
+    else:
+        utils.create(instance)
+
+
+def get_bulk_blocker(name, disks):
+    """
+    bulkInsert creates VMs which only differ by name, every per instance
+    setting prevents creating the VM in bulk.
+
+    :return: why the VM of the current node instance can not be created in
+    bulk, or None
+    """
+    props = ctx.instance.runtime_properties
+    if name:
+        return 'the instance has a name'
+    if disks or props.get(constants.DISK):
+        return 'disks are attached to the instance'
+    if ctx.agent.init_script():
+        return 'the agent is installed by the startup script'
+    if props.get(constants.SSH_KEYS):
+        return 'the instance has its own SSH keys'
+    return None
+
+
+def get_bulk_group():
+    """
+    Get the node instances of the current node which are being created, e.g.
+    by the same scale out.
+
+    :return: sorted list of node instance ids, or None if the node instances
+    can not be listed
+    """
+    try:
+        node_instances = get_rest_client().node_instances.list(
+            deployment_id=ctx.deployment.id,
+            node_id=ctx.node.id,
+            _include=['id', 'state'])
+    except Exception as e:
+        ctx.logger.warn(
+            'Unable to list node instances of {0}: {1}'.format(
+                ctx.node.id, e))
+        return None
+    return sorted(node_instance.id for node_instance in node_instances
+                  if node_instance.state in BULK_CREATE_STATES)
+
+
+def create_in_bulk(instance):
+    """
+    Create the VMs of all node instances of the node which are being created
+    with a single bulkInsert request, sent by the node instance with the
+    lowest id. The other node instances wait for their VM to exist, and
+    create it individually if that node instance fails to create it.
+    VM names are derived from the node instance ids, so every node instance
+    knows the name of its VM.
+    """
+    props = ctx.instance.runtime_properties
+    if props.get('_operation'):
+        # Bulk creation started by this node instance
+        return utils.create(instance)
+
+    def _get():
+        try:
+            return instance.get()
+        except HttpError as error:
+            if not utils.is_missing_resource_error(error):
+                raise
+
+    created = _get()
+    if created:
+        props.update(created)
+        return
+
+    group = get_bulk_group()
+    if group and len(group) > 1 and group[0] != ctx.instance.id and \
+            ctx.instance.id in group:
+        return wait_for_bulk_leader(instance, group[0], _get)
+    # An earlier try may have waited for another leader
+    props.pop(BULK_LEADER_DEADLINE, None)
+    if not group or len(group) < 2 or ctx.instance.id not in group:
+        return utils.create(instance)
+    create_group_in_bulk(instance, group)
+
+
+def create_group_in_bulk(instance, group):
+    """
+    Send the bulkInsert of the VMs of the group which do not exist yet.
+
+    :param group: sorted list of the ids of the node instances
+    """
+    names = [utils.get_gcp_resource_name(node_instance_id)
+             for node_instance_id in group]
+    # A retried bulkInsert, or the individual inserts of node instances
+    # whose leader failed, may have created some of the VMs
+    existing = instance.existing_names(names)
+    if existing:
+        ctx.logger.info('Instances {0} already exist.'.format(
+            ', '.join(sorted(existing))))
+    instance.bulk_names = [name for name in names if name not in existing]
+    if len(instance.bulk_names) < 2:
+        instance.bulk_names = None
+        # The node instances waiting for this one create their own VM
+        ctx.instance.runtime_properties[BULK_NAMES] = []
     utils.create(instance)
 
 
+def wait_for_bulk_leader(instance, leader_id, get):
+    """
+    Wait for the VM of the current node instance to be created in bulk by
+    the leader of its group, create it individually if the leader fails.
+
+    :param leader_id: id of the node instance sending the bulkInsert
+    :param get: callable returning the VM, or None if it does not exist
+    """
+    def _created_or_failed():
+        created = get()
+        if created:
+            return created
+        if bulk_leader_failed(leader_id, instance.name):
+            # The VM may have been created since it was looked up
+            return get() or BULK_FAILED
+
+    created = utils.wait_for(
+        _created_or_failed,
+        'Waiting for {0} to create the instance.'.format(leader_id),
+        BULK_LEADER_DEADLINE)
+    if created is BULK_FAILED:
+        ctx.logger.warn(
+            '{0} did not create the instance, creating it '
+            'individually.'.format(leader_id))
+        return utils.create(instance)
+    ctx.instance.runtime_properties.update(created)
+
+
+def bulk_leader_failed(leader_id, name):
+    """
+    Whether the node instance creating the VMs of its group in bulk will not
+    create the VM with the given name: the node instance is gone or not
+    being created anymore, its bulkInsert does not include the VM, or the
+    bulkInsert failed or finished.
+
+    :param leader_id: id of the node instance sending the bulkInsert
+    :param name: name of the VM
+    """
+    try:
+        leader = get_rest_client().node_instances.get(
+            leader_id, _include=['state', 'runtime_properties'])
+    except CloudifyClientError as e:
+        if e.status_code == 404:
+            return True
+        ctx.logger.warn(
+            'Unable to get node instance {0}: {1}'.format(leader_id, e))
+        return False
+    if leader.state not in BULK_CREATE_STATES:
+        return True
+    leader_props = leader.runtime_properties or {}
+    names = leader_props.get(BULK_NAMES)
+    if names is not None and name not in names:
+        return True
+    handle = leader_props.get(BULK_OPERATION)
+    if not handle:
+        # The bulkInsert was not sent yet
+        return False
+    operation = utils.response_to_operation(
+        handle, utils.get_gcp_config(), ctx.logger)
+    try:
+        return operation.has_finished()
+    except GCPError as e:
+        ctx.logger.warn(
+            'Creating the instances of {0} failed: {1}'.format(leader_id, e))
+        return True
+
+
 @operation(resumable=True)
 @utils.throw_cloudify_exceptions
 def start(name, **kwargs):
@@ -704,10 +947,12 @@ def set_ip(instance, relationship=False):
     else:
         props = ctx.instance.runtime_properties
 
-    instances = instance.list()
-    item = utils.get_item_from_gcp_response(constants.NAME,
-                                            instance.name,
-                                            instances)
+    try:
+        item = instance.get(fields=NETWORK_FIELDS)
+    except HttpError as error:
+        if not utils.is_missing_resource_error(error):
+            raise
+        item = None
 
     try:
         props['ip'] = item['networkInterfaces'][0]['networkIP']
@@ -718,9 +963,11 @@ def set_ip(instance, relationship=False):
             if ctx.node.properties.get('use_public_ip'):
                 props['ip'] = public
     except (TypeError, KeyError):
-        ctx.operation.retry(
+        return ctx.operation.retry(
                 'The instance has not yet created network interface', 10)
-    props.update(item)
+    # Only the fields which were read, the other runtime properties keep
+    # the full resource
+    props['networkInterfaces'] = item['networkInterfaces']
 
 
 def get_ssh_keys():
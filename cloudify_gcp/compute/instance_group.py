@@ -59,9 +59,10 @@ class InstanceGroup(GoogleCloudPlatform):
 
     @check_response
     def list(self):
-        return self.discovery.instanceGroups().list(
+        return {'items': list(self.paginate(
+            self.discovery.instanceGroups(),
             project=self.project,
-            zone=self.zone).execute()
+            zone=self.zone))}
 
     @check_response
     def list_instances(self):
@@ -100,8 +100,8 @@ class Network(GoogleCloudPlatform):
         :return: REST response with list of networks in a project
         """
         self.logger.info('List networks in project {0}'.format(self.project))
-        return self.discovery.networks().list(
-            project=self.project).execute()
+        return {'items': list(self.paginate(
+            self.discovery.networks(), project=self.project))}
 
     def to_dict(self):
         self.body.update({
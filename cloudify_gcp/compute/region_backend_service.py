@@ -72,8 +72,9 @@ class RegionBackendService(GoogleCloudPlatform):
 
     @check_response
     def list(self):
-        return self.discovery.regionBackendServices().list(
-            project=self.project, region=basename(self.region)).execute()
+        return {'items': list(self.paginate(
+            self.discovery.regionBackendServices(),
+            project=self.project, region=basename(self.region)))}
 
     @utils.async_operation(get=True)
     @check_response
@@ -126,8 +126,8 @@ class Route(GoogleCloudPlatform):
         :return: REST response with list of routes in a project
         """
         self.logger.info('List routes in project {0}'.format(self.project))
-        return self.discovery.routes().list(
-            project=self.project).execute()
+        return {'items': list(self.paginate(
+            self.discovery.routes(), project=self.project))}
 
     def to_dict(self):
         body = {
@@ -19,6 +19,7 @@ from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
 
+from .. import gcp
 from .. import utils
 from .. import constants
 from .firewall import FirewallRule
@@ -99,16 +100,20 @@ def create_rule_name(name, rule):
 @utils.throw_cloudify_exceptions
 def configure(**kwargs):
     props = ctx.instance.runtime_properties
-    props['rules'] = []
     network = utils.get_network(ctx)
-    for name, op in props['_operations'].items():
-        firewall = FirewallRule(
+    firewalls = [
+        FirewallRule(
                 utils.get_gcp_config(),
                 ctx.logger,
                 network=network,
                 name=name,
                 )
-        props['rules'].append(firewall.get())
+        for name in props['_operations']]
+    rules = []
+    if firewalls:
+        with firewalls[0].batch():
+            rules = [firewall.get() for firewall in firewalls]
+    props['rules'] = [gcp.resolve(rule) for rule in rules]
     del props['_operations']
 
 
@@ -126,20 +131,23 @@ def handle_multiple_calls(objects, call, logger):
     props.dirty = True
     operations = props.setdefault('_operations', {})
 
-    for obj in objects:
-        if obj.name in operations:
-            if operations[obj.name]['status'] == 'DONE':
-                # This one is finished
-                continue
-            else:
-                op = utils.response_to_operation(
-                        operations[obj.name],
-                        utils.get_gcp_config(),
-                        logger,
-                        )
-                operations[obj.name] = op.get()
-        else:
-            operations[obj.name] = getattr(obj, call)()
+    pending = {
+        obj.name: utils.response_to_operation(
+                operations[obj.name],
+                utils.get_gcp_config(),
+                logger,
+                )
+        for obj in objects
+        if obj.name in operations and operations[obj.name]['status'] != 'DONE'
+        }
+    new_objects = [obj for obj in objects if obj.name not in operations]
+
+    # The results of successful calls are kept before raising any error, so
+    # they are not repeated on retry
+    errors = poll_operations(pending, operations)
+    errors.extend(send_calls(new_objects, call, operations))
+    if errors:
+        raise errors[0]
 
     not_done = [k for k, v in operations.items() if v['status'] != 'DONE']
     if not_done:
@@ -148,6 +156,43 @@ def handle_multiple_calls(objects, call, logger):
                 constants.RETRY_DEFAULT_DELAY)
 
 
+def poll_operations(pending, operations):
+    """
+    Refresh pending operations together through the operation multiplexer.
+
+    :param pending: dictionary of object name: Operation
+    :return: list of errors
+    """
+    errors = []
+    utils.operation_multiplexer.track(pending.values())
+    for name, op in pending.items():
+        try:
+            operations[name] = utils.operation_handle(op.poll())
+        except Exception as e:
+            errors.append(e)
+    return errors
+
+
+def send_calls(objects, call, operations):
+    """
+    Send the call of every object in one batch.
+
+    :return: list of errors
+    """
+    errors = []
+    futures = {}
+    if objects:
+        with objects[0].batch():
+            for obj in objects:
+                futures[obj.name] = getattr(obj, call)()
+    for name, future in futures.items():
+        try:
+            operations[name] = utils.operation_handle(gcp.resolve(future))
+        except Exception as e:
+            errors.append(e)
+    return errors
+
+
 @operation(resumable=True)
 @utils.throw_cloudify_exceptions
 def delete(**kwargs):
@@ -58,8 +58,8 @@ class SslCertificate(GoogleCloudPlatform):
 
     @check_response
     def list(self):
-        return self.discovery.sslCertificates().list(
-            project=self.project).execute()
+        return {'items': list(self.paginate(
+            self.discovery.sslCertificates(), project=self.project))}
 
     @utils.async_operation(get=True)
     @check_response
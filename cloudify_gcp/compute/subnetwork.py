@@ -108,8 +108,8 @@ class SubNetwork(GoogleCloudPlatform):
         """
         self.logger.info(
                 'List subnetworks in project {0}'.format(self.project))
-        return self.discovery.subnetworks().list(
-            project=self.project).execute()
+        return {'items': list(self.paginate(
+            self.discovery.subnetworks(), project=self.project))}
 
     def to_dict(self):
         body = {
@@ -48,7 +48,8 @@ class TargetProxy(GoogleCloudPlatform, _compat.ABC):
 
     @check_response
     def list(self):
-        return self._gcp_target_proxies().list(project=self.project).execute()
+        return {'items': list(self.paginate(
+            self._gcp_target_proxies(), project=self.project))}
 
     @utils.async_operation(get=True)
     @check_response
@@ -28,7 +28,7 @@ from ...tests import TestGCP
 class TestGCPDisk(TestGCP):
 
     def test_create(self, mock_build, *args):
-        mock_build().globalOperations().get().execute.side_effect = [
+        mock_build().globalOperations().wait().execute.side_effect = [
                 {'status': 'PENDING', 'name': 'Dave'},
                 {'status': 'DONE', 'name': 'Dave'},
                 ]
@@ -86,7 +86,7 @@ class TestGCPDisk(TestGCP):
                 self.ctxmock.source.instance.runtime_properties['gcp_disk'])
 
     def test_resize(self, mock_build, *args):
-        mock_build().globalOperations().get().execute.side_effect = [
+        mock_build().globalOperations().wait().execute.side_effect = [
                 {'status': 'PENDING', 'name': 'Dave'},
                 {'status': 'DONE', 'name': 'Dave'},
         ]
@@ -20,8 +20,11 @@ from functools import partial
 from mock import patch, Mock
 
 from cloudify.exceptions import NonRecoverableError
+from googleapiclient.errors import HttpError
 
 from .. import instance
+from ... import utils
+from ...gcp import GCPError
 from ...tests import TestGCP
 
 
@@ -31,6 +34,7 @@ utils_get_ssh_keys_patch = partial(
         )
 
 
+@patch('cloudify_gcp.utils.Operation.wait_until_done')
 @patch('cloudify_gcp.gcp.service_account.Credentials.'
        'from_service_account_info')
 @patch('cloudify_gcp.utils.Operation.has_finished', return_value=True)
@@ -94,6 +98,16 @@ class TestGCPInstance(TestGCP):
                 'startup_script': {'type': 'string'},
                 })
         self.ctxmock.instance.relationships = []
+        instances = mock_build.return_value.instances.return_value
+        instances.insert.return_value.execute.return_value = {
+                'kind': 'compute#operation',
+                'name': 'operation-1',
+                'zone': 'https://www.googleapis.com/compute/v1/projects/'
+                        'not really a project/zones/zone',
+                'status': 'PENDING',
+                'progress': 0,
+                'selfLink': 'https://www.googleapis.com/compute/v1/...',
+                }
 
         instance.create(
                 'instance_type',
@@ -142,7 +156,13 @@ class TestGCPInstance(TestGCP):
                     'name': 'name',
                     'machine_type': 'instance_type',
                     'resource_id': 'name',
-                    '_operation': mock_build().instances().insert().execute(),
+                    '_operation': {
+                        'kind': 'zone',
+                        'scope': 'zone',
+                        'name': 'operation-1',
+                        'status': 'PENDING',
+                        'progress': 0,
+                        },
                 },
                 self.ctxmock.instance.runtime_properties
                 )
@@ -525,15 +545,232 @@ class TestGCPInstance(TestGCP):
                 project='not really a project', zone='zone'
                 )
 
-    @patch('cloudify_gcp.utils.get_item_from_gcp_response',
-           return_value={'networkInterfaces': [{'networkIP': 'a'}]})
-    def test_start(self, mock_getitem, mock_build, *args):
+    def create_in_bulk(self, mock_client, instance_id):
+        self.ctxmock.instance.id = instance_id
+        self.ctxmock.instance.relationships = []
+        mock_client().node_instances.list.return_value = [
+            Mock(id='vm_b', state='uninitialized'),
+            Mock(id='vm_a', state='configuring'),
+            Mock(id='vm_0', state='started'),
+        ]
+        instance.create(
+                'instance_type',
+                'image_id',
+                '',
+                zone='zone',
+                external_ip=False,
+                startup_script=None,
+                scopes='scopes',
+                tags=['tags'],
+                bulk_create=True,
+                )
+
+    @patch('cloudify_gcp.compute.instance.get_rest_client')
+    def test_create_bulk_leader(self, mock_client, mock_build, *args):
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.side_effect = [
+            HttpError(Mock(status=404), b''), {'name': 'vm-a'}]
+        instances.list_next = None
+        instances.list.return_value.execute.return_value = {}
+        instances.bulkInsert.return_value.execute.return_value = {
+            'kind': 'compute#operation',
+            'name': 'operation-1',
+            'zone': 'https://www.googleapis.com/compute/v1/projects/'
+                    'not really a project/zones/zone',
+            'status': 'PENDING',
+        }
+
+        self.create_in_bulk(mock_client, 'vm_a')
+
+        instances.insert.assert_not_called()
+        kwargs = instances.bulkInsert.call_args[1]
+        self.assertEqual('zone', kwargs['zone'])
+        self.assertEqual(2, kwargs['body']['count'])
+        self.assertEqual(2, kwargs['body']['minCount'])
+        self.assertEqual({'vm-a': {}, 'vm-b': {}},
+                         kwargs['body']['perInstanceProperties'])
+        properties = kwargs['body']['instanceProperties']
+        self.assertNotIn('name', properties)
+        self.assertEqual('instance_type', properties['machineType'])
+        props = self.ctxmock.instance.runtime_properties
+        self.assertEqual('vm-a', props['name'])
+        self.assertEqual('operation-1', props['_operation']['name'])
+        self.assertEqual(['vm-a', 'vm-b'], props[instance.BULK_NAMES])
+        self.assertEqual('operation-1',
+                         props[instance.BULK_OPERATION]['name'])
+        self.assertEqual(
+            '(name = "vm-a") OR (name = "vm-b")',
+            instances.list.call_args[1]['filter'])
+
+    @patch('cloudify_gcp.compute.instance.get_rest_client')
+    def test_create_bulk_leader_existing(self, mock_client, mock_build,
+                                         *args):
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.side_effect = [
+            HttpError(Mock(status=404), b''), {'name': 'vm-a'}]
+        instances.list_next = None
+        instances.list.return_value.execute.return_value = {
+            'items': [{'name': 'vm-b'}]}
+        instances.insert.return_value.execute.return_value = {
+            'kind': 'compute#operation',
+            'name': 'operation-1',
+            'zone': 'https://www.googleapis.com/compute/v1/projects/'
+                    'not really a project/zones/zone',
+            'status': 'PENDING',
+        }
+
+        self.create_in_bulk(mock_client, 'vm_a')
+
+        # Only the VM of this node instance is left to create
+        instances.bulkInsert.assert_not_called()
+        self.assertEqual('vm-a',
+                         instances.insert.call_args[1]['body']['name'])
+        props = self.ctxmock.instance.runtime_properties
+        self.assertEqual([], props[instance.BULK_NAMES])
+
+    @utils_get_ssh_keys_patch()
+    @patch('cloudify_gcp.compute.instance.get_rest_client')
+    def test_create_bulk_agent(self, mock_client, mock_get_keys, mock_build,
+                               *args):
+        mock_get_keys.return_value = 'agent key'
+        self.ctxmock.node.properties['install_agent'] = True
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.return_value = {'name': 'vm-a'}
+
+        self.create_in_bulk(mock_client, 'vm_a')
+
+        # The startup script of the agent is specific to the node instance
+        mock_client().node_instances.list.assert_not_called()
+        instances.bulkInsert.assert_not_called()
+        instances.insert.assert_called_once()
+
+    @patch('cloudify_gcp.utils.time.sleep')
+    @patch('cloudify_gcp.compute.instance.get_rest_client')
+    def test_create_bulk_member(self, mock_client, mock_sleep,
+                                mock_build, *args):
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.side_effect = [
+            HttpError(Mock(status=404), b''),
+            HttpError(Mock(status=404), b''),
+            {'name': 'vm-b', 'status': 'RUNNING'}]
+        mock_client().node_instances.get.return_value = Mock(
+            state='creating',
+            runtime_properties={instance.BULK_NAMES: ['vm-a', 'vm-b']})
+
+        self.create_in_bulk(mock_client, 'vm_b')
+
+        instances.insert.assert_not_called()
+        instances.bulkInsert.assert_not_called()
+        mock_sleep.assert_called_once_with(1)
+        props = self.ctxmock.instance.runtime_properties
+        self.assertEqual('vm-b', props['name'])
+        self.assertEqual('RUNNING', props['status'])
+
+    @patch('cloudify_gcp.compute.instance.get_rest_client')
+    def test_create_bulk_member_leader_failed(self, mock_client,
+                                              mock_build, *args):
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.side_effect = [
+            HttpError(Mock(status=404), b''),
+            HttpError(Mock(status=404), b''),
+            HttpError(Mock(status=404), b''),
+            {'name': 'vm-b', 'status': 'RUNNING'}]
+        instances.insert.return_value.execute.return_value = {
+            'kind': 'compute#operation',
+            'name': 'operation-2',
+            'zone': 'https://www.googleapis.com/compute/v1/projects/'
+                    'not really a project/zones/zone',
+            'status': 'PENDING',
+        }
+        mock_client().node_instances.get.return_value = Mock(
+            state='creating',
+            runtime_properties={
+                instance.BULK_NAMES: ['vm-a', 'vm-b'],
+                instance.BULK_OPERATION: utils.operation_handle({
+                    'kind': 'compute#operation',
+                    'name': 'operation-1',
+                    'zone': 'zones/zone',
+                    'status': 'DONE'})})
+
+        with patch('cloudify_gcp.utils.Operation.has_finished',
+                   side_effect=GCPError('quota exceeded')):
+            self.create_in_bulk(mock_client, 'vm_b')
+
+        instances.bulkInsert.assert_not_called()
+        self.assertEqual('vm-b',
+                         instances.insert.call_args[1]['body']['name'])
+        mock_client().node_instances.get.assert_called_with(
+            'vm_a', _include=['state', 'runtime_properties'])
+        props = self.ctxmock.instance.runtime_properties
+        self.assertEqual('operation-2', props['_operation']['name'])
+        self.assertNotIn(utils.CREATE_DEADLINE, props)
+
+    @patch('cloudify_gcp.compute.instance.get_rest_client')
+    def test_create_bulk_member_retried_alone(self, mock_client,
+                                              mock_build, *args):
+        instances = mock_build.return_value.instances.return_value
+        instances.get.return_value.execute.side_effect = [
+            HttpError(Mock(status=404), b''),
+            {'name': 'vm-b', 'status': 'RUNNING'}]
+        instances.insert.return_value.execute.return_value = {
+            'kind': 'compute#operation',
+            'name': 'operation-1',
+            'zone': 'https://www.googleapis.com/compute/v1/projects/'
+                    'not really a project/zones/zone',
+            'status': 'PENDING',
+        }
+        # An earlier try waited for a leader, which is not created anymore
+        props = self.ctxmock.instance.runtime_properties
+        props[instance.BULK_LEADER_DEADLINE] = 5
+        self.ctxmock.instance.id = 'vm_b'
+        self.ctxmock.instance.relationships = []
+        mock_client().node_instances.list.return_value = [
+            Mock(id='vm_b', state='creating'),
+            Mock(id='vm_a', state='started'),
+        ]
+        instance.create('instance_type', 'image_id', '', zone='zone',
+                        external_ip=False, startup_script=None,
+                        scopes='scopes', tags=['tags'], bulk_create=True)
+
+        self.assertEqual('vm-b',
+                         instances.insert.call_args[1]['body']['name'])
+        self.assertNotIn(instance.BULK_LEADER_DEADLINE, props)
+        self.assertEqual('operation-1', props['_operation']['name'])
+
+    def test_start(self, mock_build, *args):
+        mock_build().instances().get().execute.return_value = {
+            'networkInterfaces': [{'networkIP': 'a'}]}
         self.ctxmock.node.properties['external_ip'] = False
         self.ctxmock.instance.runtime_properties['name'] = 'name'
         instance.start('name')
         self.assertEqual(
                 self.ctxmock.instance.runtime_properties['ip'],
                 'a')
+        mock_build().instances().get.assert_called_with(
+            instance='name',
+            project='not really a project',
+            zone='a very fake zone',
+            fields='name,networkInterfaces')
+        mock_build().instances().list.assert_not_called()
+        # The partial resource only updates the network interfaces
+        props = self.ctxmock.instance.runtime_properties
+        self.assertEqual([{'networkIP': 'a'}], props['networkInterfaces'])
+        self.assertEqual('name', props['name'])
+
+    def test_start_instance_not_found(self, mock_build, *args):
+        mock_build().instances().get().execute.side_effect = HttpError(
+            Mock(status=404), b'')
+        self.ctxmock.node.properties['external_ip'] = False
+        self.ctxmock.instance.runtime_properties['name'] = 'name'
+
+        instance.set_ip(instance.Instance(
+            self.ctxmock.node.properties['gcp_config'],
+            self.ctxmock.logger,
+            name='name',
+            zone='zone'))
+
+        self.ctxmock.operation.retry.assert_called_once_with(
+            'The instance has not yet created network interface', 10)
 
     def test_resize(self, mock_build, *args):
         instance.resize('foo', 'bar', 'baz')
@@ -551,14 +788,14 @@ class TestGCPInstance(TestGCP):
             instance='foo',
             zone='bar')
 
-    @patch('cloudify_gcp.utils.get_item_from_gcp_response', return_value={
-        'networkInterfaces': [
-            {
-                'networkIP': 'a',
-                'accessConfigs': [{'natIP': '🕷'}],
-            },
-        ]})
-    def test_start_with_external_ip(self, mock_getitem, mock_build, *args):
+    def test_start_with_external_ip(self, mock_build, *args):
+        mock_build().instances().get().execute.return_value = {
+            'networkInterfaces': [
+                {
+                    'networkIP': 'a',
+                    'accessConfigs': [{'natIP': '🕷'}],
+                },
+            ]}
         self.ctxmock.node.properties['external_ip'] = True
         self.ctxmock.instance.runtime_properties['name'] = 'name'
         instance.start('name')
@@ -604,9 +841,9 @@ class TestGCPInstance(TestGCP):
 
         self.assertFalse(self.ctxmock.instance.runtime_properties)
 
-    @patch('cloudify_gcp.utils.get_item_from_gcp_response', return_value={
-                'networkInterfaces': [{'accessConfigs': [{'natIP': '🕷'}]}]})
-    def test_add_external_ip(self, mock_getitem, mock_build, *args):
+    def test_add_external_ip(self, mock_build, *args):
+        mock_build().instances().get().execute.return_value = {
+            'networkInterfaces': [{'accessConfigs': [{'natIP': '🕷'}]}]}
         self.ctxmock.target.node.type = 'cloudify.nodes.gcp.Address'
         self.ctxmock.target.node.properties = {
                 'use_external_resource': False,
@@ -629,9 +866,9 @@ class TestGCPInstance(TestGCP):
                 zone='a very fake zone',
                 )
 
-    @patch('cloudify_gcp.utils.get_item_from_gcp_response', return_value={
-                'networkInterfaces': [{'accessConfigs': [{'natIP': '🕷'}]}]})
-    def test_add_external_external_ip(self, mock_getitem, mock_build, *args):
+    def test_add_external_external_ip(self, mock_build, *args):
+        mock_build().instances().get().execute.return_value = {
+            'networkInterfaces': [{'accessConfigs': [{'natIP': '🕷'}]}]}
         self.ctxmock.target.node.properties = {
                 'use_external_resource': True,
                 }
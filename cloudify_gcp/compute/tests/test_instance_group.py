@@ -58,7 +58,7 @@ class TestInstanceGroup(TestGCP):
                 )
 
     def test_add_to_instance_group(self, mock_build, *args):
-        mock_build().globalOperations().get().execute.side_effect = [
+        mock_build().globalOperations().wait().execute.side_effect = [
                 {'status': 'PENDING', 'name': 'Dave'},
                 {'status': 'DONE', 'name': 'Dave'},
                 ]
@@ -78,7 +78,7 @@ class TestInstanceGroup(TestGCP):
         mock_build().instanceGroups().listInstances().execute().get = Mock(
             return_value=[{'instance': 'instance url'}])
 
-        mock_build().globalOperations().get().execute.side_effect = [
+        mock_build().globalOperations().wait().execute.side_effect = [
                 {'status': 'PENDING', 'name': 'Dave'},
                 {'status': 'DONE', 'name': 'Dave'},
                 ]
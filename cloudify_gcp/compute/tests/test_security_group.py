@@ -16,7 +16,9 @@
 
 from mock import patch
 
+from cloudify_gcp import utils
 from cloudify_gcp.compute import security_group
+from cloudify_gcp.compute.firewall import FirewallRule
 from ...tests import TestGCP
 
 
@@ -47,7 +49,7 @@ class TestGCPSecurityGroup(TestGCP):
                 rules,
                 )
 
-        self.assertEqual(2, mock_build.call_count)
+        self.assertEqual(1, mock_build.call_count)
         for body in [
                 {
                     'network': 'projects/not really a project/'
@@ -88,8 +90,52 @@ class TestGCPSecurityGroup(TestGCP):
 
         security_group.delete()
 
-        self.assertEqual(2, mock_build.call_count)
+        self.assertEqual(1, mock_build.call_count)
         mock_build().firewalls().delete.assert_called_with(
                 firewall='youdonottalkaboutfightclub',
                 project='not really a project',
                 )
+
+    def test_configure(self, mock_build, *args):
+        props = self.ctxmock.instance.runtime_properties
+        props['_operations'] = {
+            'rule-a': {'status': 'DONE'},
+            'rule-b': {'status': 'DONE'},
+        }
+        mock_build().firewalls().get().execute.side_effect = [
+            {'name': 'rule-a'}, {'name': 'rule-b'}]
+
+        security_group.configure()
+
+        self.assertEqual(
+            [{'name': 'rule-a'}, {'name': 'rule-b'}], props['rules'])
+        self.assertNotIn('_operations', props)
+
+    def test_create_polls_pending_operations(self, mock_build, *args):
+        props = self.ctxmock.instance.runtime_properties
+        props['_operations'] = {
+            'ctx-sg-name-from-bob-to-tcp': {
+                'name': 'op-a', 'status': 'DONE'},
+            'ctx-sg-name-from-jane-to-tcp': {
+                'name': 'op-b', 'status': 'RUNNING'},
+        }
+        operations = mock_build().globalOperations()
+        operations.list_next.return_value = None
+        operations.list().execute.return_value = {'items': [
+            {'name': 'op-b', 'status': 'DONE'}]}
+
+        security_group.handle_multiple_calls(
+            [FirewallRule(utils.get_gcp_config(), self.ctxmock.logger,
+                          name=name, network='net')
+             for name in props['_operations']],
+            'create',
+            self.ctxmock.logger)
+
+        operations.list.assert_called_with(
+            project='not really a project', filter='(name = "op-b")')
+        mock_build().firewalls().insert.assert_not_called()
+        self.assertEqual(
+            {'kind': 'global', 'scope': None, 'name': 'op-b',
+             'status': 'DONE', 'progress': None},
+            props['_operations']['ctx-sg-name-from-jane-to-tcp'])
+        self.ctxmock.operation.retry.assert_not_called()
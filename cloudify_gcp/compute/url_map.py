@@ -57,7 +57,8 @@ class UrlMap(GoogleCloudPlatform):
 
     @check_response
     def list(self):
-        return self.discovery.urlMaps().list(project=self.project).execute()
+        return {'items': list(self.paginate(
+            self.discovery.urlMaps(), project=self.project))}
 
     @utils.async_operation(get=True)
     @check_response
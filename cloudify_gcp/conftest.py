@@ -18,6 +18,10 @@ from mock import patch
 
 from cloudify.state import current_ctx
 
+from cloudify_gcp import gcp, utils
+from cloudify_gcp.discovery_store import discovery_store
+from cloudify_gcp.zones import zone_catalog
+from cloudify_gcp.inventory import inventory_store
 from cloudify_gcp.tests import ctx_mock
 
 
@@ -38,3 +42,37 @@ def patch_client():
             'from_service_account_info'
             ):
         yield
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    gcp.discovery_cache.clear()
+    gcp.credentials_cache.clear()
+    utils.operation_multiplexer.clear()
+    utils.gcp_config_cache.clear()
+    zone_catalog.clear()
+    yield
+    gcp.discovery_cache.clear()
+    gcp.credentials_cache.clear()
+    utils.operation_multiplexer.clear()
+    utils.gcp_config_cache.clear()
+    zone_catalog.clear()
+
+
+@pytest.fixture(autouse=True, scope='session')
+def discovery_store_path(tmp_path_factory):
+    with patch.object(discovery_store, 'path',
+                      str(tmp_path_factory.mktemp('discovery'))):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def zone_catalog_path(tmp_path):
+    with patch.object(zone_catalog, 'path', str(tmp_path / 'zones')):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def inventory_store_path(tmp_path):
+    with patch.object(inventory_store, 'path', str(tmp_path / 'inventory')):
+        yield
@@ -35,8 +35,44 @@ PUB_SUB_DISCOVERY = 'pubsub'
 LOGGING_DISCOVERY = 'logging'
 CLOUDRESOURCES_DISCOVERY = 'cloudresourcemanager'
 IAM_DISCOVERY = 'iam'
+DNS_DISCOVERY = 'dns'
 
 CHUNKSIZE = 2 * 1024 * 1024
+# Files of at least the threshold are uploaded to Cloud Storage in slices of
+# at least the component size, at most the compose limit, which are
+# uploaded concurrently and composed into one object
+COMPOSITE_UPLOAD_THRESHOLD = int(os.environ.get(
+    'GCP_COMPOSITE_UPLOAD_THRESHOLD', 150 * 1024 * 1024))
+COMPOSITE_UPLOAD_COMPONENT_SIZE = int(os.environ.get(
+    'GCP_COMPOSITE_UPLOAD_COMPONENT_SIZE', 50 * 1024 * 1024))
+COMPOSITE_UPLOAD_CONCURRENCY = int(os.environ.get(
+    'GCP_COMPOSITE_UPLOAD_CONCURRENCY', 8))
+COMPOSE_MAX_COMPONENTS = 32
+
+DISCOVERY_CACHE_SIZE = 32
+# Resolved client configs kept per worker process
+GCP_CONFIG_CACHE_SIZE = 128
+# Seconds before expiry at which shared access tokens are refreshed
+TOKEN_REFRESH_MARGIN = 300
+# Keep-alive connections per API host and seconds they may stay idle
+HTTP_POOL_SIZE = int(os.environ.get('GCP_HTTP_POOL_SIZE', 10))
+HTTP_POOL_IDLE_TIMEOUT = int(os.environ.get('GCP_HTTP_POOL_IDLE_TIMEOUT', 60))
+# Socket timeout of the connections in seconds, above the 120 seconds the
+# operations wait endpoint may block
+HTTP_TIMEOUT = int(os.environ.get('GCP_HTTP_TIMEOUT', 180))
+# Maximum number of calls in a single batch HTTP request
+BATCH_MAX_SIZE = 1000
+# In-process retries of requests failing with transient errors: attempts,
+# backoff base and cap in seconds, and the per API method retry budget
+RETRY_MAX_ATTEMPTS = int(os.environ.get('GCP_RETRY_MAX_ATTEMPTS', 5))
+RETRY_BASE_DELAY = float(os.environ.get('GCP_RETRY_BASE_DELAY', 0.5))
+RETRY_MAX_DELAY = float(os.environ.get('GCP_RETRY_MAX_DELAY', 32))
+RETRY_BUDGET = 10
+RETRY_BUDGET_RATIO = 0.1
+# API call statistics: 'log', a file path, or empty to disable recording,
+# and the latency histogram buckets in milliseconds
+API_METRICS = os.environ.get('GCP_API_METRICS', '')
+API_METRICS_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
 
 API_V1 = 'v1'
 API_V2 = 'v2'
@@ -84,9 +120,47 @@ NAME = 'name'
 MACHINE_TYPE = 'machine_type'
 
 GCP_OP_DONE = 'DONE'
+# Seconds between polls of an operation which can not be long-polled, the
+# delay grows by the factor up to the maximum
+OPERATION_POLL_MIN_DELAY = 1
+OPERATION_POLL_MAX_DELAY = 10
+OPERATION_POLL_FACTOR = 1.5
+# Operation names per filtered list request, and seconds after which
+# operations no waiter asked for are no longer polled
+OPERATION_LIST_CHUNK_SIZE = 25
+OPERATION_TRACK_TTL = 300
+# Polling requests in flight when waiting for operations with asyncio
+OPERATION_WAIT_CONCURRENCY = 10
+# Waiting for a resource: seconds between polls grow by the factor up to the
+# maximum, after the threshold the operation is retried by Cloudify instead
+# of holding the worker, and the wait fails after the timeout
+WAIT_MIN_INTERVAL = 1
+WAIT_MAX_INTERVAL = 15
+WAIT_FACTOR = 1.5
+WAIT_RETRY_THRESHOLD = int(os.environ.get('GCP_WAIT_RETRY_THRESHOLD', 60))
+WAIT_TIMEOUT = int(os.environ.get('GCP_WAIT_TIMEOUT', 1800))
+# List requests in flight when discovering resources in many zones
+DISCOVERY_CONCURRENCY = int(os.environ.get('GCP_DISCOVERY_CONCURRENCY', 16))
+# Child deployments of discovered resources created and installed together,
+# and chunks of them deployed at once
+DEPLOY_CHUNK_SIZE = 50
+DEPLOY_CONCURRENCY = 4
+# Polling of the install executions of a chunk, which fails after the timeout
+DEPLOY_POLL_INTERVAL = 15
+DEPLOY_INSTALL_TIMEOUT = int(
+    os.environ.get('GCP_DEPLOY_INSTALL_TIMEOUT', 3 * 3600))
+# Attempts to store the deployment checkpoint before the workflow fails
+CHECKPOINT_SAVE_ATTEMPTS = 5
+CHECKPOINT_SAVE_INTERVAL = 5
 
 MANAGER_PLUGIN_FILES = os.path.join('/etc', 'cloudify', 'gcp_plugin')
 GCP_DEFAULT_CONFIG_PATH = os.path.join(MANAGER_PLUGIN_FILES, 'gcp_config')
+DISCOVERY_STORE_PATH = os.path.join(MANAGER_PLUGIN_FILES, 'discovery')
+RATE_LIMIT_STATE_PATH = os.path.join(MANAGER_PLUGIN_FILES, 'rate_limits.json')
+ZONE_CATALOG_PATH = os.path.join(MANAGER_PLUGIN_FILES, 'zones')
+INVENTORY_STORE_PATH = os.path.join(MANAGER_PLUGIN_FILES, 'inventory')
+# Seconds the zones of a project are cached
+ZONE_CATALOG_TTL = int(os.environ.get('GCP_ZONE_CATALOG_TTL', 24 * 60 * 60))
 
 RETRY_DEFAULT_DELAY = 30
 
@@ -75,11 +75,9 @@ class Cluster(ContainerEngineBase):
 
     @check_response
     def list(self):
-        response = self.discovery_container.clusters().list(
-            projectId=self.project, zone=self.zone).execute()
-        if 'clusters' in response:
-            return response['clusters']
-        return []
+        return list(self.paginate(
+            self.discovery_container.clusters(), 'clusters',
+            projectId=self.project, zone=self.zone))
 
     @check_response
     def get(self):
@@ -79,10 +79,10 @@ class NodePool(ContainerEngineBase):
 
     @check_response
     def list(self):
-        response = self.discovery_container.nodePools().list(
+        return list(self.paginate(
+            self.discovery_container.nodePools(), 'nodePools',
             projectId=self.project, zone=self.zone,
-            clusterId=self.cluster_id).execute()
-        return response['nodePools']
+            clusterId=self.cluster_id))
 
     @check_response
     def get(self):
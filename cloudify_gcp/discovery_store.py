@@ -0,0 +1,313 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+On-disk store of pre-parsed API discovery documents.
+
+The store is passed as the discovery cache to googleapiclient's build(), so
+discovery objects are created from an already deserialized document instead
+of parsing the JSON document (or fetching it over the network) in every
+worker process.
+
+Refresh the store, or compare cold-start latency with the default loading:
+
+    python -m cloudify_gcp.discovery_store refresh [--remote] [--force]
+    python -m cloudify_gcp.discovery_store benchmark [--repeat N]
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import json
+import time
+import pickle
+import argparse
+import tempfile
+import threading
+
+import httplib2
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import DISCOVERY_URI
+from googleapiclient.discovery_cache.base import Cache
+
+from . import constants
+
+DISCOVERY_DOCUMENTS = [
+    (constants.COMPUTE_DISCOVERY, constants.API_V1),
+    (constants.COMPUTE_DISCOVERY, constants.API_BETA),
+    (constants.CONTAINER_DISCOVERY, constants.API_V1),
+    (constants.DNS_DISCOVERY, constants.API_V1),
+    (constants.PUB_SUB_DISCOVERY, constants.API_V1),
+    (constants.LOGGING_DISCOVERY, constants.API_V2),
+    (constants.MONITORING_DISCOVERY, constants.API_V3),
+    (constants.IAM_DISCOVERY, constants.API_V1),
+    (constants.STORAGE_DISCOVERY, constants.API_V1),
+    (constants.CLOUDRESOURCES_DISCOVERY, constants.API_V1),
+]
+
+# Pickle protocol readable by every supported python version
+PICKLE_PROTOCOL = 4
+
+URL_PATTERNS = [
+    re.compile(r'/discovery/v1/apis/(?P<api>[^/]+)/(?P<version>[^/]+)/rest'),
+    re.compile(r'//(?P<api>[^./]+)\.googleapis\.com/\$discovery/rest'
+               r'\?version=(?P<version>[^&]+)'),
+]
+
+
+def parse_discovery_url(url):
+    """
+    Get (api, version) tuple from a discovery document URL.
+
+    :param url: discovery document URL requested by googleapiclient
+    :return: (api, version) tuple, or None for unknown URLs
+    """
+    for pattern in URL_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group('api'), match.group('version')
+
+
+def get_static_document(api, version):
+    """
+    Get discovery document bundled with googleapiclient.
+
+    :return: JSON string of the document or None
+    """
+    return discovery_cache.get_static_doc(api, version)
+
+
+def get_remote_document(api, version):
+    """
+    Fetch discovery document from the Google API discovery service.
+
+    :return: JSON string of the document
+    """
+    url = DISCOVERY_URI.replace('{api}', api).replace('{apiVersion}', version)
+    response, content = httplib2.Http().request(url)
+    if response.status != 200:
+        raise IOError('Unable to fetch discovery document {0}: {1}'.format(
+            url, response.status))
+    return content.decode('utf-8')
+
+
+class DiscoveryStore(Cache):
+    """
+    googleapiclient discovery cache backed by pickled documents on disk.
+
+    Documents missing in the store are parsed once from the copies bundled
+    with googleapiclient and persisted, if the store directory is writable.
+    Loaded documents are kept in memory in their serialized form, so every
+    caller gets its own copy of the document.
+    """
+
+    def __init__(self, path=constants.DISCOVERY_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._blobs = {}
+        self._scopes = {}
+
+    def document_path(self, api, version):
+        return os.path.join(self.path, '{0}.{1}.pickle'.format(api, version))
+
+    def get(self, url):
+        key = parse_discovery_url(url)
+        if not key:
+            return None
+        entry = self.load(*key)
+        return entry['document'] if entry else None
+
+    def set(self, url, content):
+        key = parse_discovery_url(url)
+        if key:
+            self.save(key[0], key[1], json.loads(content))
+
+    def load(self, api, version):
+        """
+        Get stored entry for the document.
+
+        :return: dictionary with revision and document keys, or None if the
+        document is not known.
+        """
+        blob = self._blobs.get((api, version))
+        if blob is None:
+            blob = self._read(api, version)
+        if blob is None:
+            content = get_static_document(api, version)
+            if not content:
+                return None
+            blob = self.save(api, version, json.loads(content))
+        return pickle.loads(blob)
+
+    def save(self, api, version, document):
+        """
+        Store the document in memory and, when possible, on disk.
+
+        :return: serialized store entry
+        """
+        blob = pickle.dumps({'revision': document.get('revision'),
+                             'document': document},
+                            PICKLE_PROTOCOL)
+        with self._lock:
+            self._blobs[(api, version)] = blob
+        self._write(api, version, blob)
+        return blob
+
+    def scopes(self, api, version):
+        """
+        Get the OAuth scopes googleapiclient applies to credentials of the
+        API, i.e. all the scopes declared by its discovery document.
+
+        :return: sorted list of scopes, or None if the document is not known
+        """
+        if (api, version) not in self._scopes:
+            entry = self.load(api, version)
+            scopes = None
+            if entry:
+                scopes = sorted(entry['document'].get('auth', {}).get(
+                    'oauth2', {}).get('scopes', {}))
+            self._scopes[(api, version)] = scopes
+        return self._scopes[(api, version)]
+
+    def revision(self, api, version):
+        entry = self.load(api, version)
+        return entry['revision'] if entry else None
+
+    def refresh(self, fetch=get_static_document, force=False):
+        """
+        Update stored documents which have a newer revision available.
+
+        :param fetch: callable returning document JSON for (api, version)
+        :param force: replace documents even if the revision did not change
+        :return: list of (api, version, old revision, new revision) tuples
+        for replaced documents
+        """
+        updated = []
+        for api, version in DISCOVERY_DOCUMENTS:
+            content = fetch(api, version)
+            if not content:
+                continue
+            document = json.loads(content)
+            blob = self._read(api, version)
+            current = pickle.loads(blob)['revision'] if blob else None
+            if force or current is None or \
+                    document.get('revision', '') > current:
+                self.save(api, version, document)
+                updated.append(
+                    (api, version, current, document.get('revision')))
+        return updated
+
+    def clear(self):
+        with self._lock:
+            self._blobs.clear()
+
+    def _read(self, api, version):
+        try:
+            with open(self.document_path(api, version), 'rb') as f:
+                blob = f.read()
+        except (IOError, OSError):
+            return None
+        with self._lock:
+            self._blobs[(api, version)] = blob
+        return blob
+
+    def _write(self, api, version, blob):
+        # The store is only an optimization, so hosts where the plugin
+        # files directory is not writable just keep documents in memory.
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fd, temp_path = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob)
+            os.rename(temp_path, self.document_path(api, version))
+        except (IOError, OSError):
+            pass
+
+
+discovery_store = DiscoveryStore()
+
+
+def benchmark(store, repeat=5):
+    """
+    Compare cold-start time of building each discovery object with the
+    default googleapiclient loading and with the store.
+
+    :return: list of (api, version, default seconds, store seconds) tuples
+    """
+    from googleapiclient.discovery import build
+    from google.auth.credentials import AnonymousCredentials
+
+    credentials = AnonymousCredentials()
+    results = []
+    for api, version in DISCOVERY_DOCUMENTS:
+        if store.revision(api, version) is None:
+            continue
+        default_time = store_time = 0
+        for _ in range(repeat):
+            start = time.time()
+            build(api, version, credentials=credentials,
+                  cache_discovery=False)
+            default_time += time.time() - start
+            # Drop the in-memory copy to measure loading from disk
+            store.clear()
+            start = time.time()
+            build(api, version, credentials=credentials, cache=store)
+            store_time += time.time() - start
+        results.append(
+            (api, version, default_time / repeat, store_time / repeat))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Manage the GCP plugin discovery document store.')
+    parser.add_argument('--path', default=constants.DISCOVERY_STORE_PATH,
+                        help='Store directory')
+    commands = parser.add_subparsers(dest='command')
+    refresh_parser = commands.add_parser(
+        'refresh', help='Update stored discovery documents')
+    refresh_parser.add_argument(
+        '--remote', action='store_true',
+        help='Fetch documents from the discovery service instead of the '
+             'copies bundled with googleapiclient')
+    refresh_parser.add_argument(
+        '--force', action='store_true',
+        help='Replace documents even if the revision did not change')
+    benchmark_parser = commands.add_parser(
+        'benchmark', help='Compare cold-start latency')
+    benchmark_parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    store = DiscoveryStore(args.path)
+    if args.command == 'refresh':
+        fetch = get_remote_document if args.remote else get_static_document
+        for api, version, old, new in store.refresh(fetch, args.force):
+            print('{0}.{1}: {2} -> {3}'.format(api, version, old, new))
+    elif args.command == 'benchmark':
+        print('{0:<28}{1:>12}{2:>12}'.format('api', 'default ms', 'store ms'))
+        for api, version, default_time, store_time in benchmark(
+                store, args.repeat):
+            print('{0:<28}{1:>12.1f}{2:>12.1f}'.format(
+                '{0}.{1}'.format(api, version),
+                default_time * 1000,
+                store_time * 1000))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
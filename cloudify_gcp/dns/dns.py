@@ -45,7 +45,7 @@ class DNSZone(GoogleCloudPlatform):
             config,
             logger,
             utils.get_gcp_resource_name(name),
-            discovery='dns',
+            discovery=constants.DNS_DISCOVERY,
             scope='https://www.googleapis.com/auth/ndev.clouddns.readwrite',
             additional_settings=additional_settings,
             )
@@ -90,27 +90,14 @@ class DNSZone(GoogleCloudPlatform):
         return self.body
 
     def list_records(self, name=None, type=None):
-        rrsets = []
-
-        resources = self.discovery.resourceRecordSets()
-
-        request = resources.list(
+        return list(self.paginate(
+                self.discovery.resourceRecordSets(),
+                'rrsets',
                 project=self.project,
                 managedZone=self.name,
                 type=type,
                 name='.'.join([name, self.dns_name]),
-                )
-
-        while request is not None:
-            response = request.execute()
-
-            rrsets.extend(response['rrsets'])
-
-            request = resources.list_next(
-                    previous_request=request,
-                    previous_response=response)
-
-        return rrsets
+                ))
 
     def get(self):
         return self.discovery.managedZones().get(
@@ -13,8 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from time import sleep
-
 from cloudify import ctx
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
@@ -23,6 +21,10 @@ from .. import utils
 from .. import constants
 from .dns import DNSZone
 
+# Runtime properties of a change request which is not applied yet
+CHANGE_ID = '_change_id'
+CHANGE_DEADLINE = '_change_deadline'
+
 
 def get_current_records(zone, name=None, type=None):
     """Expects a DNSZone object and the DNS name and record type to filter
@@ -40,14 +42,41 @@ def generate_changes(dns_zone, action, data):
             body={action: data})
 
 
+def pending_change():
+    """
+    Change request of an earlier try of the operation, which was not applied
+    yet.
+    """
+    change_id = ctx.instance.runtime_properties.get(CHANGE_ID)
+    if change_id:
+        return {'status': 'pending', 'id': change_id}
+
+
 def wait_for_change_completion(dns_zone, response):
-    while response['status'] == 'pending':
-        sleep(3)
-        response = dns_zone.discovery.changes().get(
+    """
+    Wait until the change request is applied. The change is kept in the
+    runtime properties, so a retried operation waits for it instead of
+    sending it again.
+    """
+    if response['status'] != 'pending':
+        return response
+    props = ctx.instance.runtime_properties
+    props[CHANGE_ID] = response['id']
+
+    def _applied():
+        change = dns_zone.discovery.changes().get(
                 project=utils.get_gcp_config()['project'],
                 managedZone=dns_zone.name,
                 changeId=response['id'],
                 ).execute()
+        if change['status'] != 'pending':
+            return change
+
+    response = utils.wait_for(
+        _applied,
+        'Waiting for DNS change {0} to be applied.'.format(response['id']),
+        CHANGE_DEADLINE)
+    props.pop(CHANGE_ID, None)
     return response
 
 
@@ -148,7 +177,7 @@ def create(type, name, resources, ttl, **kwargs):
             item_path)
         resources.append(item)
 
-    response = generate_changes(dns_zone, 'additions', [{
+    response = pending_change() or generate_changes(dns_zone, 'additions', [{
             "name": '{}.{}'
                     .format(name, zone.runtime_properties['dnsName']),
             "ttl": ttl,
@@ -185,15 +214,17 @@ def delete(**_):
                 dns_name=zone.runtime_properties['dnsName'],
                 )
 
-        rrsets = get_current_records(
-                dns_zone,
-                name=ctx.instance.runtime_properties[constants.NAME],
-                type=ctx.node.properties['type'],
-                )
-
-        wait_for_change_completion(
-                dns_zone,
-                generate_changes(dns_zone, 'deletions', rrsets).execute())
+        response = pending_change()
+        if not response:
+            rrsets = get_current_records(
+                    dns_zone,
+                    name=ctx.instance.runtime_properties[constants.NAME],
+                    type=ctx.node.properties['type'],
+                    )
+            response = generate_changes(
+                    dns_zone, 'deletions', rrsets).execute()
+
+        wait_for_change_completion(dns_zone, response)
 
         ctx.instance.runtime_properties.pop('created', None)
 
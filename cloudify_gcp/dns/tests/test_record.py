@@ -20,6 +20,7 @@ from .. import record
 from ...tests import TestGCP
 
 
+@patch('cloudify_gcp.utils.time.sleep')
 @patch('cloudify_gcp.gcp.service_account.Credentials.'
        'from_service_account_info')
 @patch('cloudify_gcp.utils.get_gcp_resource_name', return_value='valid_name')
@@ -109,6 +110,23 @@ class TestGCPRecord(TestGCP):
                 project='not really a project',
                 )
 
+    def test_create_resumes_pending_change(self, mock_build, *args):
+        self.ctxmock.instance.runtime_properties[record.CHANGE_ID] = u'🛂'
+        mock_build().changes().get().execute.return_value = {
+                'status': 'done'}
+
+        record.create('type', 'name', 'resources', 'ttl')
+
+        mock_build().changes().create.assert_not_called()
+        mock_build().changes().get.assert_called_with(
+                changeId=u'🛂',
+                managedZone='target instance',
+                project='not really a project',
+                )
+        self.assertTrue(self.ctxmock.instance.runtime_properties['created'])
+        self.assertNotIn(
+                record.CHANGE_ID, self.ctxmock.instance.runtime_properties)
+
     def test_delete(self, mock_build, *args):
         self.ctxmock.node.properties['type'] = 'A'
         self.ctxmock.instance.runtime_properties = {
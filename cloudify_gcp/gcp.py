@@ -13,16 +13,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from functools import wraps
-from os.path import basename
+import json
+import time
+import hashlib
+import datetime
+import threading
+from contextlib import contextmanager
+from collections import Counter, OrderedDict
+from functools import wraps, partial
 from httplib2 import ServerNotFoundError
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
+from google.auth import credentials as google_credentials
 
 from cloudify.exceptions import OperationRetry
 
 from . import constants
+from .retry import default_policy
+from .metrics import recorder
+from .rate_limit import rate_limiter, request_class, get_project
+from .transport import default_transport
+from .discovery_store import discovery_store
+from .zones import zone_catalog
 
 
 def check_response(func):
@@ -34,23 +48,449 @@ def check_response(func):
         try:
             response = func(self, *args, **kwargs)
         except ServerNotFoundError as e:
-            raise OperationRetry(
-                    'Warning: {0}. '
-                    'If problem persists, error may be fatal.'.format(
-                        e.message))
-        if response and 'error' in response:
-            self.logger.error('Response with error {0}'
-                              .format(response['error']))
-
-            raise GCPError(response['error'])
-        return response
+            raise server_not_found_retry(e)
+
+        def _check(response):
+            if response and 'error' in response:
+                self.logger.error('Response with error {0}'
+                                  .format(response['error']))
+
+                raise GCPError(response['error'])
+            return response
+        return then(response, _check)
     return wraps(func)(_decorator)
 
 
+def server_not_found_retry(error):
+    return OperationRetry(
+        'Warning: {0}. '
+        'If problem persists, error may be fatal.'.format(error))
+
+
+class BatchFuture(object):
+    """
+    Result of a request queued in a batch, available once the batch was
+    executed.
+    """
+    def __init__(self):
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        """
+        :return: response of the request
+        :raise: the HttpError or GCPError of the request, or GCPError if the
+        batch was not executed yet
+        """
+        if not self._done:
+            raise GCPError('Batch request was not executed yet')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        return self._exception
+
+    def set_result(self, result):
+        self._resolve(result, None)
+
+    def set_exception(self, exception):
+        self._resolve(None, exception)
+
+    def then(self, func):
+        """
+        Get future of func applied to the result of this future.
+        Exceptions raised by func become the exception of the new future.
+        """
+        future = BatchFuture()
+
+        def _chain(source):
+            if source.exception() is not None:
+                future.set_exception(source.exception())
+                return
+            try:
+                future.set_result(func(source.result()))
+            except Exception as e:
+                future.set_exception(e)
+
+        if self._done:
+            _chain(self)
+        else:
+            self._callbacks.append(_chain)
+        return future
+
+    def _resolve(self, result, exception):
+        self._result = result
+        self._exception = exception
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+def then(response, func):
+    """
+    Apply func to a response, or to the result of a BatchFuture once the
+    batch is executed.
+    """
+    if isinstance(response, BatchFuture):
+        return response.then(func)
+    return func(response)
+
+
+def resolve(response):
+    """
+    Get the response itself, or the result of a BatchFuture.
+    """
+    if isinstance(response, BatchFuture):
+        return response.result()
+    return response
+
+
+_batches = threading.local()
+
+
+@contextmanager
+def recorded_call(recorder, method_id, request_size=0):
+    """
+    Record the API call made within the block. The block sets the status,
+    retries and response_size items of the yielded dictionary.
+    """
+    call = {'status': None, 'retries': 0, 'response_size': 0}
+    start = time.time()
+    try:
+        yield call
+    except HttpError as e:
+        call['status'] = e.resp.status
+        raise
+    finally:
+        recorder.record(method_id,
+                        call['status'],
+                        time.time() - start,
+                        call['retries'],
+                        request_size,
+                        call['response_size'])
+
+
+def payload_size(body):
+    return len(body) if body else 0
+
+
+def current_batch():
+    """
+    Get the innermost batch opened in the current thread, or None.
+    """
+    stack = getattr(_batches, 'stack', None)
+    return stack[-1] if stack else None
+
+
+class BatchableHttpRequest(HttpRequest):
+    """
+    HttpRequest of a discovery object, queued in the current batch instead
+    of being sent if the batch belongs to the same API.
+    Requests sent directly are paced by rate_limiter, retried on transient
+    errors according to retry_policy and recorded by recorder. Media uploads
+    are retried by googleapiclient per chunk.
+    """
+    retry_policy = default_policy
+    rate_limiter = rate_limiter
+    recorder = recorder
+
+    def __init__(self, *args, **kwargs):
+        self.api = kwargs.pop('api', None)
+        super(BatchableHttpRequest, self).__init__(*args, **kwargs)
+        self.response_status = None
+        self.response_size = 0
+        self.postproc = partial(self._postproc, self.postproc)
+
+    def _postproc(self, postproc, resp, content):
+        self.response_status = resp.status
+        self.response_size = payload_size(content)
+        return postproc(resp, content)
+
+    def execute(self, http=None, num_retries=0):
+        batch = current_batch()
+        if http is None and batch is not None and batch.accepts(self):
+            return batch.add(self)
+        execute = super(BatchableHttpRequest, self).execute
+
+        def send():
+            self.acquire()
+            return execute(http=http, num_retries=num_retries)
+
+        with recorded_call(self.recorder,
+                           self.methodId,
+                           payload_size(self.body)) as call:
+
+            def on_retry(*_):
+                call['retries'] += 1
+
+            if self.resumable:
+                result = send()
+            else:
+                result = self.retry_policy.execute(
+                    self.methodId, self.method, send, on_retry)
+            call['status'] = self.response_status
+            call['response_size'] = self.response_size
+            return result
+
+    def acquire(self, count=1):
+        """Wait for the rate limit of the request's project and API."""
+        self.rate_limiter.acquire(
+            get_project(self.uri),
+            self.api[0] if self.api else None,
+            request_class(self.method),
+            count)
+
+
+class Batch(object):
+    """
+    Requests queued within GoogleCloudPlatform.batch(), sent with
+    googleapiclient's BatchHttpRequest, at most max_size per HTTP request.
+    """
+    def __init__(self, discovery, api, max_size=constants.BATCH_MAX_SIZE):
+        self.api = api
+        self.max_size = max_size
+        self._discovery = discovery
+        self._queue = []
+
+    def accepts(self, request):
+        # Media uploads can not be sent in a batch
+        return request.api == self.api and not request.resumable
+
+    def add(self, request):
+        future = BatchFuture()
+        self._queue.append((request, future))
+        return future
+
+    def execute(self):
+        """
+        Send all queued requests and resolve their futures.
+        If sending a batch fails, futures of all unsent requests get the
+        error, which is raised.
+        """
+        queue, self._queue = self._queue, []
+        for start in range(0, len(queue), self.max_size):
+            batch = self._discovery.new_batch_http_request()
+            chunk = queue[start:start + self.max_size]
+            for request_id, (request, future) in enumerate(chunk):
+                batch.add(request,
+                          callback=partial(self._callback, future),
+                          request_id=str(request_id))
+
+            # Every call of the batch counts against the quota
+            counts = Counter(
+                (get_project(request.uri), request_class(request.method))
+                for request, _ in chunk)
+
+            def send():
+                for (project, kind), count in counts.items():
+                    rate_limiter.acquire(project, self.api[0], kind, count)
+                return batch.execute()
+
+            method_id = '{0}.batch'.format(self.api[0])
+            try:
+                with recorded_call(
+                        recorder,
+                        method_id,
+                        sum(payload_size(request.body)
+                            for request, _ in chunk)) as call:
+
+                    def on_retry(*_):
+                        call['retries'] += 1
+
+                    default_policy.execute(method_id, 'POST', send, on_retry)
+                    call['status'] = 200
+                    call['response_size'] = sum(
+                        request.response_size for request, _ in chunk)
+            except Exception as e:
+                for _, future in queue[start:]:
+                    if not future.done():
+                        future.set_exception(e)
+                raise
+
+    def __len__(self):
+        return len(self._queue)
+
+    @staticmethod
+    def _callback(future, request_id, response, exception):
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(response)
+
+
+def auth_fingerprint(auth):
+    """
+    Get a hashable identity of the credentials described by auth.
+
+    :param auth: service account info dictionary
+    :return: hex digest of the auth content, or the object id if auth can
+    not be serialized
+    """
+    try:
+        return hashlib.sha256(
+            json.dumps(auth, sort_keys=True).encode('utf-8')).hexdigest()
+    except (TypeError, ValueError):
+        return id(auth)
+
+
+class DiscoveryCache(object):
+    """
+    Process-wide, size bounded cache of built discovery Resource objects.
+
+    Building a discovery object parses the whole API discovery document, so
+    objects are shared between all GoogleCloudApi instances using the same
+    API, version and credentials. The least recently used entry is evicted
+    when the cache is full.
+    Objects sending requests through a transport which is not thread-safe
+    must be kept per thread, see GoogleCloudApi.create_discovery.
+    """
+    def __init__(self, max_size=constants.DISCOVERY_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._resources = OrderedDict()
+
+    def get(self, key, factory):
+        """
+        Get discovery object for key, building it with factory on a miss.
+
+        :param key: hashable (api, version, credentials identity) tuple
+        :param factory: callable returning a new discovery object
+        :return: discovery object
+        """
+        with self._lock:
+            if key in self._resources:
+                self._resources.move_to_end(key)
+                return self._resources[key]
+        resource = factory()
+        with self._lock:
+            self._resources[key] = resource
+            self._resources.move_to_end(key)
+            while len(self._resources) > self.max_size:
+                self._resources.popitem(last=False)
+        return resource
+
+    def clear(self):
+        with self._lock:
+            self._resources.clear()
+
+    def __len__(self):
+        return len(self._resources)
+
+
+discovery_cache = DiscoveryCache()
+
+
+class SharedCredentials(google_credentials.Scoped,
+                        google_credentials.Credentials):
+    """
+    Thread-safe wrapper of google-auth credentials shared between objects.
+
+    Tokens are refreshed under a lock once they are within the refresh
+    margin of their expiry, so concurrent users trigger a single refresh and
+    never send a token about to expire. Scoping the credentials returns the
+    shared credentials for the requested scope set from the cache.
+    """
+    def __init__(self, credentials, key, cache):
+        super(SharedCredentials, self).__init__()
+        self._credentials = credentials
+        self._key = key
+        self._cache = cache
+        self._refresh_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Delegate e.g. universe_domain or service_account_email
+        if name.startswith('__') or name == '_credentials':
+            raise AttributeError(name)
+        return getattr(self._credentials, name)
+
+    @property
+    def requires_scopes(self):
+        return bool(getattr(self._credentials, 'requires_scopes', False))
+
+    @property
+    def quota_project_id(self):
+        return getattr(self._credentials, 'quota_project_id', None)
+
+    @property
+    def expired(self):
+        if not self.expiry:
+            return False
+        return datetime.datetime.utcnow() >= \
+            self.expiry - self._cache.refresh_margin
+
+    def with_scopes(self, scopes, default_scopes=None):
+        scopes = scopes or default_scopes or []
+        return self._cache.get(
+            self._key,
+            lambda: self._credentials.with_scopes(scopes),
+            scopes)
+
+    def refresh(self, request):
+        token = self.token
+        with self._refresh_lock:
+            # Another thread refreshed the token while this one was waiting
+            if self.token != token and self.valid:
+                return
+            self._credentials.refresh(request)
+            self.token = self._credentials.token
+            self.expiry = self._credentials.expiry
+
+    def before_request(self, request, method, url, headers):
+        if not self.valid:
+            self.refresh(request)
+        self._credentials.apply(headers, token=self.token)
+
+
+class CredentialsCache(object):
+    """
+    Process-wide cache of SharedCredentials keyed by the service account
+    identity and the scope set, so all objects using the same account reuse
+    one access token.
+    """
+    def __init__(self, refresh_margin=constants.TOKEN_REFRESH_MARGIN):
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self._lock = threading.Lock()
+        self._credentials = {}
+
+    def get(self, key, factory, scopes=()):
+        """
+        Get shared credentials, creating them with factory on a miss.
+
+        :param key: hashable identity of the credentials
+        :param factory: callable returning new google-auth credentials
+        :param scopes: scopes of the credentials
+        :return: SharedCredentials object
+        """
+        cache_key = (key, tuple(sorted(scopes)))
+        with self._lock:
+            if cache_key not in self._credentials:
+                self._credentials[cache_key] = SharedCredentials(
+                    factory(), key, self)
+            return self._credentials[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._credentials.clear()
+
+
+credentials_cache = CredentialsCache()
+
+
 class GoogleCloudApi(object):
     """
     Base class for execute call by google api
     """
+    # Thread-safe transport with authorize(credentials) method, shared by all
+    # discovery objects
+    transport = default_transport
+
     def __init__(self, config, logger,
                  scope=constants.COMPUTE_SCOPE,
                  discovery=constants.COMPUTE_DISCOVERY,
@@ -70,6 +510,11 @@ class GoogleCloudApi(object):
         self.__discovery = discovery
         self.api_version = api_version
 
+    @property
+    def api(self):
+        """(discovery name, API version) tuple of the used API"""
+        return self.__discovery, self.api_version
+
     @property
     def discovery(self):
         """
@@ -86,9 +531,19 @@ class GoogleCloudApi(object):
             "Please implement {}: {}".format(__name__, repr(scope))
         )
 
+    def credentials_key(self):
+        """
+        Identity of the credentials used by this object, used as a part of
+        the discovery and credentials cache keys.
+        """
+        return auth_fingerprint(self.auth)
+
     def create_discovery(self, discovery, scope, api_version):
         """
         Create Google Cloud API discovery object and perform authentication.
+        Discovery objects are reused from the process-wide discovery cache
+        and built from the pre-parsed documents of the discovery store, with
+        credentials shared through the credentials cache.
 
         :param discovery: name of the API discovery to be created
         :param scope: scope the API discovery will have
@@ -98,12 +553,44 @@ class GoogleCloudApi(object):
         e.g. the file is not under the given path or it has wrong permissions
         """
         try:
-            credentials = self.get_credentials()
-            return build(discovery, api_version, credentials=credentials)
+            credentials = credentials_cache.get(
+                self.credentials_key(), self.get_credentials)
+            return self.build_discovery(discovery, api_version, credentials)
         except IOError as e:
             self.logger.error(str(e))
             raise GCPError(str(e))
 
+    def build_discovery(self, discovery, api_version, credentials):
+        """
+        Get discovery object sending requests through the shared transport.
+
+        Credentials are scoped the way googleapiclient would scope them, so
+        the authorized http object can be passed to build() directly.
+        If the API is not known to the discovery store, the object gets its
+        own http connection and is only shared within the current thread.
+        """
+        key = (discovery, api_version, self.credentials_key())
+        request_builder = partial(BatchableHttpRequest,
+                                  api=(discovery, api_version))
+        scopes = discovery_store.scopes(discovery, api_version)
+        if scopes is None:
+            return discovery_cache.get(
+                key + (threading.current_thread().ident,),
+                lambda: build(discovery, api_version,
+                              credentials=credentials,
+                              cache=discovery_store,
+                              requestBuilder=request_builder))
+
+        def _build():
+            http = self.transport.authorize(
+                google_credentials.with_scopes_if_required(
+                    credentials, scopes))
+            return build(discovery, api_version, http=http,
+                         cache=discovery_store,
+                         requestBuilder=request_builder)
+
+        return discovery_cache.get(key, _build)
+
 
 class GoogleCloudPlatform(GoogleCloudApi):
     """
@@ -154,24 +641,115 @@ class GoogleCloudPlatform(GoogleCloudApi):
             project=self.project).execute()
         return metadata['commonInstanceMetadata']
 
+    def paginate(self, collection, items_key='items', method='list',
+                 max_results=None, filter=None, fields=None,
+                 page_size_param='maxResults', **kwargs):
+        """
+        Iterate over the items of all pages of a list method.
+
+        Pages are requested one at a time while the caller iterates, so only
+        one page is held in memory. Pages depend on each other, so the
+        items can not be listed within a batch() block.
+
+        :param collection: API collection, e.g. self.discovery.instances()
+        :param items_key: key of the items in a page, e.g. items or clusters
+        :param method: name of the list method of the collection
+        :param max_results: items per page, or None for the API default
+        :param filter: server-side filter expression
+        :param fields: partial response selector, e.g. 'items(name,zone)',
+        the page token is always requested
+        :param page_size_param: name of the page size parameter of the API
+        :param kwargs: parameters of the list method
+        :return: generator of items
+        """
+        if max_results:
+            kwargs[page_size_param] = max_results
+        if filter:
+            kwargs['filter'] = filter
+        if fields:
+            kwargs['fields'] = 'nextPageToken,{0}'.format(fields)
+        for response in self.pages(collection, method, **kwargs):
+            for item in response.get(items_key, []):
+                yield item
+
+    def pages(self, collection, method='list', **kwargs):
+        """
+        Iterate over the responses of all pages of a list method, e.g. of
+        aggregatedList, whose items are grouped by location.
+
+        :param collection: API collection, e.g. self.discovery.instances()
+        :param method: name of the list method of the collection
+        :param kwargs: parameters of the list method
+        :return: generator of responses
+        """
+        list_next = getattr(collection, '{0}_next'.format(method), None)
+        request = getattr(collection, method)(**kwargs)
+        while request is not None:
+            response = request.execute()
+            yield response
+            if not list_next or not response.get('nextPageToken'):
+                break
+            request = list_next(
+                previous_request=request,
+                previous_response=response)
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue requests of this object's API executed within the block and
+        send them in batch HTTP requests when the block exits.
+
+        Within the block, methods decorated with check_response return a
+        BatchFuture instead of the response. Its result() is the response,
+        or raises the HttpError or GCPError the method would have raised:
+
+            with firewall.batch():
+                futures = [rule.get() for rule in rules]
+            responses = [future.result() for future in futures]
+
+        Only requests which do not depend on other responses of the block
+        can be queued.
+
+        :return: Batch object
+        """
+        batch = Batch(self.discovery, self.api)
+        stack = _batches.__dict__.setdefault('stack', [])
+        stack.append(batch)
+        try:
+            yield batch
+        finally:
+            stack.pop()
+        try:
+            batch.execute()
+        except ServerNotFoundError as e:
+            raise server_not_found_retry(e)
+
     @property
     def ZONES(self):
-        if not hasattr(self, '_ZONES'):
-            zones = {}
-            request = self.discovery.zones().list(project=self.project)
-            while request is not None:
-                response = request.execute()
-
-                for zone in response['items']:
-                    zones[zone['name']] = zone
-                    zone['region_name'] = basename(zone['region'])
-
-                request = self.discovery.zones().list_next(
-                    previous_request=request,
-                    previous_response=response)
-
-        self._ZONES = zones
-        return self._ZONES
+        """Zones of the project by name, from the zone catalog"""
+        return zone_catalog.zones(self.project, self.list_zones)
+
+    def list_zones(self):
+        return list(self.paginate(self.discovery.zones(),
+                                  project=self.project))
+
+    def get_region(self, zone=None):
+        """
+        Get the region of a zone of the project.
+
+        :param zone: zone name, defaults to the zone of the object
+        :return: region name
+        """
+        zone = zone or self.zone
+        zones = self.ZONES
+        if zone not in zones:
+            # The zone may be newer than the cached catalog
+            zones = zone_catalog.zones(self.project, self.list_zones,
+                                       refresh=True)
+        if zone not in zones:
+            raise GCPError('Unknown zone {0} of project {1}'.format(
+                zone, self.project))
+        return zones[zone]['region_name']
 
 
 class GCPError(Exception):
@@ -17,7 +17,6 @@ from copy import deepcopy
 
 from cloudify import ctx
 from cloudify.decorators import operation
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from google.oauth2 import service_account
 
@@ -49,6 +48,9 @@ class PolicyBinding(gcp.GoogleCloudPlatform):
         return service_account.Credentials. \
             from_service_account_info(self.auth, always_use_jwt_access=True)
 
+    def credentials_key(self):
+        return 'jwt', super(PolicyBinding, self).credentials_key()
+
     def create_discovery(self, discovery, scope, api_version):
         """
         Create Google Cloud API discovery object and perform authentication.
@@ -61,8 +63,9 @@ class PolicyBinding(gcp.GoogleCloudPlatform):
         e.g. the file is not under the given path or it has wrong permissions
         """
         try:
-            credentials = self.get_credentials(scope)
-            return build(discovery, api_version, credentials=credentials)
+            credentials = gcp.credentials_cache.get(
+                self.credentials_key(), lambda: self.get_credentials(scope))
+            return self.build_discovery(discovery, api_version, credentials)
         except IOError as e:
             self.logger.error(str(e))
             raise gcp.GCPError(str(e))
@@ -81,9 +81,9 @@ class Role(IAMBase):
 
     @check_response
     def list(self):
-        response = self.discovery.projects().roles().list(
-            parent=self.parent).execute()
-        return response['roles']
+        return list(self.paginate(
+            self.discovery.projects().roles(), 'roles',
+            page_size_param='pageSize', parent=self.parent))
 
     @check_response
     def get(self):
@@ -0,0 +1,147 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Local store of discovered resources.
+
+Every discovery is streamed into a newline delimited JSON file, one
+resource per line:
+
+    {"location": "us-east1-b", "type": "projects.zones.clusters",
+     "id": "cluster", "resource": {...}}
+
+Runtime properties keep only a compact index of the resources, with the
+offset of every resource in the file, so a resource is read without
+scanning the file. Resources of locations which could not be listed are
+copied from the previous inventory into the new one.
+"""
+
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+
+from . import constants
+
+
+class InventoryWriter(object):
+    """
+    Writes the records of a discovery into a temporary file, which replaces
+    the inventory when the discovery completes. Without a file, e.g. if the
+    store directory is not writable, records are dropped.
+    """
+    def __init__(self, f, logger=None):
+        self._file = f
+        self._offset = 0
+        self._logger = logger
+
+    def add(self, location, resource_type, resource_id, resource):
+        """
+        :return: offset of the record in the inventory, or None if the
+        record is not stored
+        """
+        if self._file is None:
+            return None
+        line = json.dumps({'location': location,
+                           'type': resource_type,
+                           'id': resource_id,
+                           'resource': resource},
+                          sort_keys=True, default=str) + '\n'
+        line = line.encode('utf-8')
+        offset = self._offset
+        try:
+            self._file.write(line)
+        except (IOError, OSError) as e:
+            # The records written so far keep their offsets
+            warn(self._logger,
+                 'Unable to write the inventory, the resources from {0} on '
+                 'are not stored: {1}'.format(resource_id, e))
+            self._file = None
+            return None
+        self._offset += len(line)
+        return offset
+
+
+class InventoryStore(object):
+    """
+    Inventories of discovered resources, a file per name.
+    """
+    def __init__(self, path=constants.INVENTORY_STORE_PATH):
+        self.path = path
+
+    def inventory_path(self, name):
+        return os.path.join(self.path, '{0}.ndjson'.format(name))
+
+    @contextmanager
+    def writer(self, name, logger=None):
+        """
+        Write a new inventory. The previous inventory is only replaced if the
+        block completes, it can be read with get until then.
+
+        :param logger: logger warned about records which are not stored
+        :return: InventoryWriter
+        """
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fd, temp_path = tempfile.mkstemp(dir=self.path)
+        except (IOError, OSError) as e:
+            warn(logger,
+                 'Unable to write the inventory {0}, the resources are not '
+                 'stored: {1}'.format(self.inventory_path(name), e))
+            yield InventoryWriter(None)
+            return
+        replaced = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                yield InventoryWriter(f, logger)
+            os.rename(temp_path, self.inventory_path(name))
+            replaced = True
+        finally:
+            if not replaced:
+                os.remove(temp_path)
+
+    def get(self, name, offset):
+        """
+        Get a resource from an inventory.
+
+        :param offset: offset of the resource from the index
+        :return: resource, or None if it is not stored
+        """
+        if offset is None:
+            return None
+        try:
+            with open(self.inventory_path(name), 'rb') as f:
+                f.seek(offset)
+                line = f.readline()
+        except (IOError, OSError):
+            return None
+        if not line:
+            return None
+        return json.loads(line.decode('utf-8'))['resource']
+
+    def delete(self, name):
+        try:
+            os.remove(self.inventory_path(name))
+        except (IOError, OSError):
+            pass
+
+
+def warn(logger, message):
+    if logger:
+        logger.warn(message)
+
+
+inventory_store = InventoryStore()
@@ -0,0 +1,206 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per operation statistics of the API calls made by the plugin.
+
+Recording is enabled with the GCP_API_METRICS environment variable of the
+worker: 'log' writes the statistics of every operation as JSON to the
+operation log, any other value is a file the statistics are appended to as
+JSON lines.
+"""
+
+import json
+import threading
+from contextlib import contextmanager
+from collections import Counter
+
+from . import constants
+
+UNSCOPED = 'unscoped'
+
+
+class Histogram(object):
+    """
+    Cumulative histogram of values, e.g. latencies in milliseconds.
+    """
+    def __init__(self, buckets=constants.API_METRICS_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self):
+        bounds = ['le_{0}'.format(bound) for bound in self.buckets] + ['inf']
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'min': self.min,
+            'max': self.max,
+            'buckets': dict(zip(bounds, self.counts)),
+        }
+
+
+class MethodStats(object):
+    """
+    Statistics of the calls of one API method.
+    """
+    def __init__(self):
+        self.statuses = Counter()
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency = Histogram()
+
+    def add(self, status, latency, retries, request_size, response_size):
+        self.statuses[str(status)] += 1
+        self.retries += retries
+        self.request_bytes += request_size
+        self.response_bytes += response_size
+        self.latency.add(round(latency * 1000, 3))
+
+    def to_dict(self):
+        return {
+            'calls': self.latency.count,
+            'statuses': dict(self.statuses),
+            'retries': self.retries,
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'latency_ms': self.latency.to_dict(),
+        }
+
+
+class OperationStats(object):
+    """
+    Statistics of the API calls of an operation, per API method.
+    """
+    def __init__(self):
+        self.methods = {}
+
+    def add(self, method_id, *args):
+        if method_id not in self.methods:
+            self.methods[method_id] = MethodStats()
+        self.methods[method_id].add(*args)
+
+    def to_dict(self):
+        return {method_id: stats.to_dict()
+                for method_id, stats in sorted(self.methods.items())}
+
+
+class Recorder(object):
+    """
+    Collects the API calls of the operation running in the current thread,
+    and the totals per operation name in the process.
+    """
+    def __init__(self, target=constants.API_METRICS):
+        self.target = target
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.totals = {}
+
+    @property
+    def enabled(self):
+        return bool(self.target)
+
+    @contextmanager
+    def operation(self, name, logger=None, **labels):
+        """
+        Collect the calls made within the block as the calls of the named
+        operation, and dump them when the block exits.
+
+        :param name: operation name, e.g. cloudify.interfaces.lifecycle.create
+        :param logger: logger of the operation
+        :param labels: additional values of the dump, e.g. node instance id
+        """
+        if not self.enabled:
+            yield
+            return
+        previous = getattr(self._local, 'scope', None)
+        stats = OperationStats()
+        self._local.scope = (name, stats)
+        try:
+            yield
+        finally:
+            self._local.scope = previous
+            if stats.methods:
+                self.dump(dict(labels, operation=name, calls=stats.to_dict()),
+                          logger)
+
+    def record(self, method_id, status, latency,
+               retries=0, request_size=0, response_size=0):
+        """
+        Record an API call.
+
+        :param method_id: API method, e.g. compute.instances.insert
+        :param status: HTTP status, or None if no response was received
+        :param latency: seconds spent in the call, including retries
+        :param retries: number of retries of the call
+        :param request_size: bytes of the request body
+        :param response_size: bytes of the response body
+        """
+        if not self.enabled:
+            return
+        name, stats = getattr(self._local, 'scope', None) or (UNSCOPED, None)
+        args = (status, latency, retries, request_size, response_size)
+        with self._lock:
+            if stats is not None:
+                stats.add(method_id, *args)
+            if name not in self.totals:
+                self.totals[name] = OperationStats()
+            self.totals[name].add(method_id, *args)
+
+    def summary(self):
+        """
+        :return: totals of all calls of the process per operation name
+        """
+        with self._lock:
+            return {name: stats.to_dict()
+                    for name, stats in self.totals.items()}
+
+    def dump(self, data, logger=None):
+        content = json.dumps(data, sort_keys=True)
+        if self.target == 'log':
+            if logger:
+                logger.info('GCP API calls: {0}'.format(content))
+            return
+        try:
+            with open(self.target, 'a') as f:
+                f.write(content + '\n')
+        except (IOError, OSError) as e:
+            if logger:
+                logger.debug(
+                    'Unable to write API metrics to {0}: {1}'.format(
+                        self.target, e))
+
+    def reset(self):
+        with self._lock:
+            self.totals = {}
+
+
+recorder = Recorder()
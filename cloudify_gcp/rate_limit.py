@@ -0,0 +1,215 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Client-side pacing of API requests, per project, API and request class.
+
+Requests are only paced when a rate is configured. Rates are requests per
+second, configured per project with the rate_limits key of the
+client_config (or plugin properties), e.g.:
+
+    rate_limits:
+      compute: {read: 20, write: 10}
+      default: {read: 20, write: 10}
+    rate_limit_backend: file
+
+The file backend keeps the buckets in a locked file, so all worker
+processes of a host share them.
+"""
+
+import os
+import re
+import json
+import time
+import fcntl
+import threading
+
+from cloudify.exceptions import NonRecoverableError
+
+from . import constants
+
+READ = 'read'
+WRITE = 'write'
+READ_METHODS = ('GET', 'HEAD')
+DEFAULT_RATES = 'default'
+
+PROJECT_PATTERN = re.compile(r'/projects/(?P<project>[^/?]+)')
+
+
+def request_class(method):
+    return READ if method in READ_METHODS else WRITE
+
+
+def get_project(uri):
+    """
+    :return: project of an API request URI, or None
+    """
+    match = PROJECT_PATTERN.search(uri or '')
+    return match.group('project') if match else None
+
+
+def take(bucket, rate, burst, count, now):
+    """
+    Take count tokens from a token bucket, refilled with rate tokens per
+    second up to burst. The bucket may go into debt, so callers reserve
+    their turn and wait until the debt is repaid.
+
+    :param bucket: (tokens, last update) tuple, or None for a full bucket
+    :return: (updated bucket, seconds to wait)
+    """
+    tokens, updated = bucket or (burst, now)
+    tokens = min(burst, tokens + (now - updated) * rate) - count
+    wait = -tokens / rate if tokens < 0 else 0
+    return (tokens, now), wait
+
+
+class MemoryBackend(object):
+    """
+    Token buckets shared by the threads of the current process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def reserve(self, key, rate, burst, count, now):
+        with self._lock:
+            self._buckets[key], wait = take(
+                self._buckets.get(key), rate, burst, count, now)
+        return wait
+
+
+class FileBackend(object):
+    """
+    Token buckets stored in a file, shared by all processes of the host.
+    Falls back to in-process buckets if the file can not be used.
+    """
+    def __init__(self, path=constants.RATE_LIMIT_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fallback = MemoryBackend()
+
+    def reserve(self, key, rate, burst, count, now):
+        try:
+            with self._lock, self._open() as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    buckets = json.loads(f.read() or '{}')
+                except ValueError:
+                    buckets = {}
+                name = '/'.join(str(part) for part in key)
+                buckets[name], wait = take(
+                    buckets.get(name), rate, burst, count, now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(buckets))
+            return wait
+        except (IOError, OSError):
+            return self._fallback.reserve(key, rate, burst, count, now)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT), 'r+')
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'file': FileBackend,
+}
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter keyed by (project, API, request class).
+
+    acquire() blocks the caller until its request fits into the rate
+    configured for its project. Bursts of up to one second worth of
+    requests are sent at once. Projects which are not configured use the
+    rates and the backend the limiter was created with, by default requests
+    are not limited.
+    """
+    def __init__(self, rates=None, backend=None,
+                 clock=time.time, sleep=time.sleep):
+        self.rates = rates or {}
+        self.backend = backend or MemoryBackend()
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        # {project: (rates, backend)}
+        self._projects = {}
+        # Backends by name, shared by the projects using them
+        self._backends = {}
+
+    def configure(self, project, rates=None, backend=None):
+        """
+        Set the rates and the backend of a project from its client config.
+
+        :param project: project the config belongs to
+        :param rates: dictionary of {API name: {'read': rps, 'write': rps}},
+        the 'default' entry applies to APIs which are not listed, None for
+        the rates of the limiter
+        :param backend: backend name, memory or file, None for the default
+        backend
+        :raise NonRecoverableError: if the backend is unknown
+        """
+        if backend and backend not in BACKENDS:
+            raise NonRecoverableError(
+                'Unknown rate_limit_backend {0}, expected one of: {1}.'.format(
+                    backend, ', '.join(sorted(BACKENDS))))
+        with self._lock:
+            if not backend:
+                project_backend = self.backend
+            elif isinstance(self.backend, BACKENDS[backend]):
+                project_backend = self.backend
+            else:
+                project_backend = self._backends.setdefault(
+                    backend, BACKENDS[backend]())
+            self._projects[project or ''] = (rates or self.rates,
+                                             project_backend)
+
+    def limits(self, project):
+        """
+        :return: (rates, backend) tuple of the project
+        """
+        return self._projects.get(project or '', (self.rates, self.backend))
+
+    def rate(self, api, kind, project=None):
+        """
+        :return: requests per second, or None for unlimited requests
+        """
+        rates = self.limits(project)[0]
+        rates = rates.get(api, rates.get(DEFAULT_RATES, {}))
+        rate = rates.get(kind)
+        return rate if rate and rate > 0 else None
+
+    def acquire(self, project, api, kind, count=1):
+        """
+        Wait until count requests of the kind may be sent.
+
+        :return: seconds waited
+        """
+        rate = self.rate(api, kind, project)
+        if not rate:
+            return 0
+        wait = self.limits(project)[1].reserve(
+            (project or '', api, kind), rate, max(rate, 1), count,
+            self._clock())
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,178 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-process retries of API requests failing with transient errors.
+"""
+
+import time
+import random
+import datetime
+import threading
+from email.utils import parsedate_to_datetime
+
+from googleapiclient.errors import HttpError
+
+from . import constants
+
+# Statuses of requests which were not processed, safe to retry for any method
+THROTTLED_STATUSES = (429, 503)
+# Server errors, retried only for methods which can be safely repeated
+SERVER_ERROR_STATUSES = (500, 502, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+
+def get_retry_after(response):
+    """
+    Get delay requested by the Retry-After header of a response.
+
+    :param response: httplib2 response
+    :return: seconds to wait, or None if the header is missing or invalid
+    """
+    value = response.get('retry-after') if response else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(date.tzinfo)
+    return max(0.0, (date - now).total_seconds())
+
+
+def is_retryable(error, method):
+    """
+    :param error: exception raised by the request
+    :param method: HTTP method of the request
+    :return: True if the request failed with a transient error
+    """
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    return status in THROTTLED_STATUSES or (
+        status in SERVER_ERROR_STATUSES and method in IDEMPOTENT_METHODS)
+
+
+class RetryBudget(object):
+    """
+    Token bucket limiting retries of every API method.
+
+    Each retry takes a token and each successful request returns
+    token_ratio of a token, up to max_tokens. When an API method keeps
+    failing, its budget runs out and errors are raised immediately instead
+    of every caller retrying against an overloaded API.
+    """
+    def __init__(self,
+                 max_tokens=constants.RETRY_BUDGET,
+                 token_ratio=constants.RETRY_BUDGET_RATIO):
+        self.max_tokens = max_tokens
+        self.token_ratio = token_ratio
+        self._lock = threading.Lock()
+        self._tokens = {}
+
+    def tokens(self, method_id):
+        return self._tokens.get(method_id, self.max_tokens)
+
+    def withdraw(self, method_id):
+        """
+        Take a token for a retry of method_id.
+
+        :return: True if the retry is within the budget
+        """
+        with self._lock:
+            tokens = self.tokens(method_id)
+            if tokens < 1:
+                return False
+            self._tokens[method_id] = tokens - 1
+            return True
+
+    def deposit(self, method_id):
+        with self._lock:
+            self._tokens[method_id] = min(
+                self.max_tokens, self.tokens(method_id) + self.token_ratio)
+
+
+class RetryPolicy(object):
+    """
+    Capped exponential backoff with full jitter.
+
+    The n-th retry waits a random time between 0 and
+    min(max_delay, base_delay * 2 ** n) seconds, or the time requested by
+    the Retry-After header. Errors asking to wait longer than max_delay are
+    raised, so the operation is retried by Cloudify instead.
+    """
+    def __init__(self,
+                 max_attempts=constants.RETRY_MAX_ATTEMPTS,
+                 base_delay=constants.RETRY_BASE_DELAY,
+                 max_delay=constants.RETRY_MAX_DELAY,
+                 budget=None,
+                 sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self._sleep = sleep
+
+    def backoff(self, retry):
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def delay(self, error, retry):
+        """
+        :return: seconds to wait before the retry, or None to give up
+        """
+        retry_after = get_retry_after(error.resp)
+        if retry_after is None:
+            return self.backoff(retry)
+        if retry_after > self.max_delay:
+            return None
+        return retry_after
+
+    def execute(self, method_id, method, send, on_retry=None):
+        """
+        Call send, retrying it while it fails with a transient error.
+
+        :param method_id: API method name, e.g. compute.instances.insert
+        :param method: HTTP method of the request
+        :param send: callable sending the request
+        :param on_retry: optional callable(error, delay) called before
+        every retry
+        :return: result of send
+        """
+        retry = 0
+        while True:
+            try:
+                result = send()
+            except Exception as error:
+                if retry + 1 >= self.max_attempts or \
+                        not is_retryable(error, method):
+                    raise
+                delay = self.delay(error, retry)
+                if delay is None or not self.budget.withdraw(method_id):
+                    raise
+                if on_retry:
+                    on_retry(error, delay)
+                self._sleep(delay)
+                retry += 1
+            else:
+                self.budget.deposit(method_id)
+                return result
+
+
+default_policy = RetryPolicy()
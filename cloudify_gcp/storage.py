@@ -12,7 +12,15 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
+import base64
+import struct
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+
+import google_crc32c
 from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaIoBaseUpload
 from googleapiclient.http import HttpError
 
 from . import constants
@@ -20,6 +28,143 @@ from .gcp import check_response
 from .gcp import GoogleCloudPlatform
 from .gcp import GCPError
 
+# Reversed Castagnoli polynomial of CRC32C, the checksum of Cloud Storage
+CRC32C_POLY = 0x82F63B78
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+# Whether google-crc32c computes CRC32Cs in C. Its pure Python fallback is
+# too slow for verifying the slices of large files.
+NATIVE_CRC32C = google_crc32c.implementation == 'c'
+
+
+def crc32c(data, crc=0):
+    """
+    Extend the CRC32C of preceding data with data.
+
+    :param data: bytes
+    :param crc: CRC32C of the preceding data
+    :return: CRC32C as an integer
+    """
+    return google_crc32c.extend(crc, data)
+
+
+def _gf2_matrix_times(matrix, vector):
+    result = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return result
+
+
+def _gf2_matrix_square(matrix):
+    return [_gf2_matrix_times(matrix, row) for row in matrix]
+
+
+def crc32c_combine(crc1, crc2, length2):
+    """
+    Get the CRC32C of two concatenated blocks of data from their CRC32Cs,
+    like zlib's crc32_combine.
+
+    :param crc1: CRC32C of the first block
+    :param crc2: CRC32C of the second block
+    :param length2: length of the second block
+    :return: CRC32C of the concatenated blocks
+    """
+    if length2 == 0:
+        return crc1
+    # Operator of a zero bit, then of two and four zero bits
+    odd = [CRC32C_POLY] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+    # Apply the operators of the bits of length2 zero bytes to crc1
+    while length2:
+        even = _gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = _gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+    return crc1 ^ crc2
+
+
+def encode_crc32c(crc):
+    """
+    :return: CRC32C in the format of Cloud Storage, base64 of its big-endian
+    bytes
+    """
+    return base64.b64encode(struct.pack('>I', crc)).decode('ascii')
+
+
+def file_crc32c(path, offset=0, length=None):
+    """
+    :return: CRC32C of length bytes of a file from offset, or of the rest
+    of the file
+    """
+    crc = 0
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while length is None or length > 0:
+            size = constants.CHUNKSIZE
+            if length is not None:
+                size = min(size, length)
+                length -= size
+            data = f.read(size)
+            if not data:
+                break
+            crc = crc32c(data, crc)
+    return crc
+
+
+class FileSlice(object):
+    """
+    Read-only file object of a byte range of a file, to upload the range.
+    """
+    def __init__(self, f, offset, length):
+        self._file = f
+        self.offset = offset
+        self.length = length
+        self._position = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.length
+        self._position = max(0, min(offset, self.length))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        remaining = self.length - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self._file.seek(self.offset + self._position)
+        data = self._file.read(size)
+        self._position += len(data)
+        return data
+
+
+def get_slices(size, component_size=constants.COMPOSITE_UPLOAD_COMPONENT_SIZE,
+               max_components=constants.COMPOSE_MAX_COMPONENTS):
+    """
+    Split a file into the slices of a composite upload, of at least
+    component_size bytes, and at most max_components slices.
+
+    :return: list of (offset, length) tuples
+    """
+    count = max(1, min(max_components, -(-size // component_size)))
+    length = max(1, -(-size // count))
+    return [(offset, min(length, size - offset))
+            for offset in range(0, size, length)] or [(0, 0)]
+
 
 class Object(GoogleCloudPlatform):
     def __init__(self,
@@ -44,20 +189,126 @@ class Object(GoogleCloudPlatform):
         self.config = config
         self.bucket = bucket if bucket else self.project
 
-    def upload_to_bucket(self, path):
+    def upload_to_bucket(self, path,
+                         threshold=constants.COMPOSITE_UPLOAD_THRESHOLD):
+        """
+        Upload a file as the Object. Files of at least threshold bytes are
+        uploaded in slices concurrently, see composite_upload, if the
+        google-crc32c package computes CRC32Cs natively.
+
+        :param path: path of the file
+        :param threshold: size from which files are uploaded in slices,
+        0 to always upload a single stream
+        :return: selfLink of the Object
+        """
+        if threshold and os.path.getsize(path) >= threshold:
+            if NATIVE_CRC32C:
+                return self.composite_upload(path)
+            self.logger.warn(
+                'Uploading {0} in a single stream instead of in slices, '
+                'google-crc32c is installed without its C extension.'.format(
+                    path))
         media = MediaFileUpload(path,
                                 chunksize=constants.CHUNKSIZE,
                                 resumable=True)
         request = self.discovery.objects().insert(bucket=self.bucket,
                                                   name=self.name,
                                                   media_body=media)
+        return self._upload(request)['selfLink']
+
+    def composite_upload(self, path,
+                         concurrency=constants.COMPOSITE_UPLOAD_CONCURRENCY):
+        """
+        Upload the slices of a file as temporary objects concurrently, and
+        compose them into the Object. The CRC32C of every slice, and of the
+        Object, is compared with the CRC32C of the file. The temporary
+        objects are deleted when the upload completes or fails.
+
+        :param path: path of the file
+        :param concurrency: maximum number of slices uploaded at once
+        :return: selfLink of the Object
+        """
+        slices = get_slices(os.path.getsize(path))
+        content_type = mimetypes.guess_type(path)[0] or DEFAULT_CONTENT_TYPE
+        names = ['{0}.slice-{1}-of-{2}'.format(self.name, index, len(slices))
+                 for index in range(len(slices))]
+        self.logger.info(
+            'Uploading {0} in {1} slices to {2}/{3}'.format(
+                path, len(slices), self.bucket, self.name))
+        # Build the discovery object before the threads need it
+        self.discovery
+        try:
+            with ThreadPoolExecutor(
+                    max_workers=max(1, min(concurrency, len(slices)))) \
+                    as executor:
+                crcs = list(executor.map(
+                    lambda args: self.upload_slice(path, content_type, *args),
+                    [(name, offset, length) for name, (offset, length)
+                     in zip(names, slices)]))
+            crc = crcs[0]
+            for slice_crc, (_, length) in zip(crcs[1:], slices[1:]):
+                crc = crc32c_combine(crc, slice_crc, length)
+            response = self._compose(names, content_type)
+        finally:
+            self._delete_objects(names)
+        if response.get('crc32c') != encode_crc32c(crc):
+            self._delete_objects([self.name])
+            raise GCPError(
+                'CRC32C of {0}/{1} does not match {2}'.format(
+                    self.bucket, self.name, path))
+        return response['selfLink']
+
+    def upload_slice(self, path, content_type, name, offset, length):
+        """
+        Upload a byte range of a file as a temporary object.
+
+        :return: CRC32C of the byte range
+        """
+        crc = file_crc32c(path, offset, length)
+        with open(path, 'rb') as f:
+            media = MediaIoBaseUpload(FileSlice(f, offset, length),
+                                      content_type,
+                                      chunksize=constants.CHUNKSIZE,
+                                      resumable=True)
+            request = self.discovery.objects().insert(bucket=self.bucket,
+                                                      name=name,
+                                                      media_body=media)
+            response = self._upload(request)
+        if response.get('crc32c') != encode_crc32c(crc):
+            raise GCPError(
+                'CRC32C of {0}/{1} does not match bytes {2}-{3} of {4}'.format(
+                    self.bucket, name, offset, offset + length, path))
+        return crc
+
+    @check_response
+    def _compose(self, names, content_type):
+        return self.discovery.objects().compose(
+            destinationBucket=self.bucket,
+            destinationObject=self.name,
+            body={'sourceObjects': [{'name': name} for name in names],
+                  'destination': {'contentType': content_type}}).execute()
+
+    def _delete_objects(self, names):
+        # Called while an upload error may be raised, which failing
+        # deletions must not replace
+        for name in names:
+            try:
+                self.discovery.objects().delete(bucket=self.bucket,
+                                                name=name).execute()
+            except Exception as e:
+                self.logger.warn(
+                    'Unable to delete {0}/{1}: {2}'.format(
+                        self.bucket, name, e))
+
+    @staticmethod
+    def _upload(request):
         response = None
         while response is None:
             try:
                 _, response = request.next_chunk()
             except HttpError as e:
                 raise GCPError(str(e))
-        return response['selfLink']
+        return response
 
     def delete(self):
         return self.discovery.objects().delete(bucket=self.bucket,
@@ -95,6 +346,5 @@ class Bucket(GoogleCloudPlatform):
 
     @check_response
     def list(self):
-        response = self.discovery.buckets().list(
-            project=self.project).execute()
-        return response['items']
+        return list(self.paginate(
+            self.discovery.buckets(), project=self.project))
@@ -0,0 +1,82 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import unittest
+from mock import MagicMock, patch
+
+from cloudify_gcp import aio, utils
+from cloudify_gcp.gcp import GCPError
+
+
+@patch('cloudify_gcp.aio.constants.OPERATION_POLL_MIN_DELAY', 0.01)
+@patch('cloudify_gcp.gcp.build')
+class TestWaitAll(unittest.TestCase):
+
+    def setUp(self):
+        super(TestWaitAll, self).setUp()
+        self.config = {'auth': {}, 'project': 'p', 'zone': 'z'}
+        self.loop = asyncio.new_event_loop()
+        # Number of polls until each operation is done
+        self.polls = {}
+
+    def tearDown(self):
+        self.loop.close()
+
+    def poll(self, operation):
+        self.polls[operation.name] -= 1
+        if self.polls[operation.name] > 0:
+            return {'name': operation.name, 'status': 'RUNNING'}
+        if operation.name == 'failed':
+            return {'name': operation.name, 'status': 'DONE',
+                    'error': {'errors': [{'code': 'FAILED'}]}}
+        return {'name': operation.name, 'status': 'DONE'}
+
+    def wait_all(self, operations, **kwargs):
+        with patch.object(utils.operation_multiplexer, 'poll',
+                          side_effect=self.poll):
+            return self.loop.run_until_complete(aio.wait_all(
+                operations, self.config, MagicMock(), **kwargs))
+
+    def test_wait_all(self, *args):
+        self.polls = {'op-{0}'.format(i): i % 3 + 1 for i in range(100)}
+        responses = [{'name': name, 'zone': 'zones/z'}
+                     for name in sorted(self.polls)]
+
+        results = self.wait_all(responses, concurrency=5)
+
+        self.assertEqual(
+            [{'name': name, 'status': 'DONE'} for name in sorted(self.polls)],
+            results)
+        self.assertEqual({0}, set(self.polls.values()))
+
+    def test_wait_all_results_per_operation(self, *args):
+        self.polls = {'done': 1, 'failed': 2, 'slow': 1000}
+        operations = [
+            utils.response_to_operation(
+                {'name': 'done', 'region': 'regions/r'},
+                self.config, MagicMock()),
+            {'name': 'failed'},
+            {'name': 'slow', 'zone': 'zones/z'},
+        ]
+
+        done, failed, slow = self.wait_all(operations, timeout=0.2)
+
+        self.assertEqual({'name': 'done', 'status': 'DONE'}, done)
+        self.assertIsInstance(failed, GCPError)
+        self.assertIsInstance(slow, asyncio.TimeoutError)
+
+    def test_wait_all_empty(self, *args):
+        self.assertEqual([], self.wait_all([]))
@@ -0,0 +1,105 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from cloudify_gcp import discovery_store
+
+DOCUMENT = {'revision': '20200101', 'name': 'compute', 'version': 'v1'}
+
+
+class TestDiscoveryStore(unittest.TestCase):
+
+    def setUp(self):
+        super(TestDiscoveryStore, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.store = discovery_store.DiscoveryStore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(TestDiscoveryStore, self).tearDown()
+
+    def test_parse_discovery_url(self):
+        self.assertEqual(
+            ('compute', 'v1'),
+            discovery_store.parse_discovery_url(
+                'https://www.googleapis.com/discovery/v1/apis/'
+                'compute/v1/rest'))
+        self.assertEqual(
+            ('dns', 'v1'),
+            discovery_store.parse_discovery_url(
+                'https://dns.googleapis.com/$discovery/rest?version=v1'))
+        self.assertIsNone(
+            discovery_store.parse_discovery_url('https://example.com'))
+
+    @patch('cloudify_gcp.discovery_store.get_static_document',
+           return_value=json.dumps(DOCUMENT))
+    def test_get_persists_static_document(self, mock_static):
+        url = 'https://www.googleapis.com/discovery/v1/apis/compute/v1/rest'
+
+        self.assertEqual(DOCUMENT, self.store.get(url))
+        self.assertTrue(
+            os.path.isfile(self.store.document_path('compute', 'v1')))
+
+        # A new process loads the pre-parsed document from disk
+        self.assertEqual(
+            DOCUMENT, discovery_store.DiscoveryStore(self.path).get(url))
+        mock_static.assert_called_once_with('compute', 'v1')
+
+    def test_get_returns_copies(self):
+        self.store.save('compute', 'v1', DOCUMENT)
+        url = 'https://www.googleapis.com/discovery/v1/apis/compute/v1/rest'
+
+        self.store.get(url)['name'] = 'changed'
+
+        self.assertEqual('compute', self.store.get(url)['name'])
+
+    @patch('cloudify_gcp.discovery_store.get_static_document',
+           return_value=None)
+    def test_get_unknown_document(self, *_):
+        self.assertIsNone(self.store.load('nothing', 'v1'))
+
+    def test_refresh_versions(self):
+        self.store.save('compute', 'v1', DOCUMENT)
+        newer = dict(DOCUMENT, revision='20210101')
+
+        def fetch(api, version):
+            if (api, version) == ('compute', 'v1'):
+                return json.dumps(newer)
+
+        self.assertEqual(
+            [('compute', 'v1', '20200101', '20210101')],
+            self.store.refresh(fetch))
+        self.assertEqual([], self.store.refresh(fetch))
+        self.assertEqual(1, len(self.store.refresh(fetch, force=True)))
+        self.assertEqual(
+            '20210101',
+            discovery_store.DiscoveryStore(self.path).revision(
+                'compute', 'v1'))
+
+    def test_unwritable_store_keeps_documents_in_memory(self):
+        store = discovery_store.DiscoveryStore(
+            os.path.join(self.path, 'file', 'store'))
+        open(os.path.join(self.path, 'file'), 'w').close()
+
+        store.save('compute', 'v1', DOCUMENT)
+
+        self.assertEqual(DOCUMENT, store.load('compute', 'v1')['document'])
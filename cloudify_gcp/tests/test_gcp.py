@@ -15,13 +15,18 @@
 
 from __future__ import print_function
 
+import json
+import datetime
+import threading
 import unittest
 from mock import MagicMock, patch
 
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+from google.auth.credentials import AnonymousCredentials
 
 from cloudify_gcp.tests.test_utils import NS
-from cloudify_gcp import gcp
+from cloudify_gcp import gcp, metrics, retry, utils
 
 
 class TestGCP(unittest.TestCase):
@@ -99,6 +104,7 @@ class TestGCPWithPatches(unittest.TestCase):
                         'region': 'http://some.place/stuff/things/Sarah',
                         },
                     ],
+                'nextPageToken': 'last page',
                 }
         mock_discovery().zones().list_next.return_value = None
         config = {
@@ -133,3 +139,346 @@ class TestGCPWithPatches(unittest.TestCase):
                     'region_name': 'Sarah',
                     },
                 }
+
+        # Zones are listed once for all objects of the project
+        mock_discovery().zones().list.reset_mock()
+        other = gcp.GoogleCloudPlatform(
+                config=config,
+                logger=MagicMock(),
+                name='george')
+        self.assertEqual(other.ZONES, zones)
+        self.assertEqual(other.get_region('Sarah'), 'Sarah')
+        mock_discovery().zones().list.assert_not_called()
+
+        # Unknown zones refresh the catalog
+        with self.assertRaises(gcp.GCPError):
+            other.get_region('Alice')
+        mock_discovery().zones().list.assert_called_once_with(project='proj')
+
+    def test_paginate(self, mock_build, mock_discovery):
+        instance = gcp.GoogleCloudPlatform(
+                config={'auth': {}, 'project': 'proj', 'zone': 'zn'},
+                logger=MagicMock(),
+                name='fred')
+        collection = MagicMock()
+        pages = [MagicMock(), MagicMock()]
+        pages[0].execute.return_value = {
+            'items': [{'name': 'a'}, {'name': 'b'}], 'nextPageToken': 't'}
+        pages[1].execute.return_value = {'items': [{'name': 'c'}]}
+        collection.list.return_value = pages[0]
+        collection.list_next.return_value = pages[1]
+
+        items = instance.paginate(
+            collection, project='proj', max_results=2,
+            filter='status = RUNNING', fields='items(name)')
+
+        self.assertEqual({'name': 'a'}, next(items))
+        # The next page is requested when the first one was consumed
+        collection.list_next.assert_not_called()
+        self.assertEqual([{'name': 'b'}, {'name': 'c'}], list(items))
+        collection.list.assert_called_once_with(
+            project='proj', maxResults=2, filter='status = RUNNING',
+            fields='nextPageToken,items(name)')
+        collection.list_next.assert_called_once_with(
+            previous_request=pages[0],
+            previous_response=pages[0].execute.return_value)
+
+    def test_paginate_without_list_next(self, mock_build, mock_discovery):
+        instance = gcp.GoogleCloudPlatform(
+                config={'auth': {}, 'project': 'proj', 'zone': 'zn'},
+                logger=MagicMock(),
+                name='fred')
+        collection = MagicMock(spec=['list'])
+        collection.list().execute.return_value = {
+            'clusters': [{'name': 'a'}], 'nextPageToken': 't'}
+
+        self.assertEqual(
+            [{'name': 'a'}],
+            list(instance.paginate(collection, 'clusters')))
+
+
+class TestDiscoveryCache(unittest.TestCase):
+
+    def test_get_reuses_built_resource(self):
+        cache = gcp.DiscoveryCache(max_size=2)
+        factory = MagicMock()
+
+        first = cache.get(('compute', 'v1', 'sa'), factory)
+        second = cache.get(('compute', 'v1', 'sa'), factory)
+
+        factory.assert_called_once_with()
+        self.assertIs(first, second)
+
+    def test_get_evicts_least_recently_used(self):
+        cache = gcp.DiscoveryCache(max_size=2)
+        factory = MagicMock(side_effect=lambda: object())
+
+        compute = cache.get(('compute', 'v1', 'sa'), factory)
+        cache.get(('dns', 'v1', 'sa'), factory)
+        cache.get(('compute', 'v1', 'sa'), factory)
+        cache.get(('iam', 'v1', 'sa'), factory)
+
+        self.assertEqual(2, len(cache))
+        self.assertIs(compute, cache.get(('compute', 'v1', 'sa'), factory))
+        cache.get(('dns', 'v1', 'sa'), factory)
+        self.assertEqual(4, factory.call_count)
+
+    def test_auth_fingerprint(self):
+        self.assertEqual(
+            gcp.auth_fingerprint({'client_email': 'a', 'project_id': 'b'}),
+            gcp.auth_fingerprint({'project_id': 'b', 'client_email': 'a'}))
+        self.assertNotEqual(
+            gcp.auth_fingerprint({'client_email': 'a'}),
+            gcp.auth_fingerprint({'client_email': 'b'}))
+
+    @patch('cloudify_gcp.gcp.service_account.Credentials.'
+           'from_service_account_info')
+    @patch('cloudify_gcp.gcp.build')
+    def test_create_discovery_shared_between_objects(self, mock_build, *_):
+        config = {'auth': {'client_email': 'a'}, 'project': 'p', 'zone': 'z'}
+        first = gcp.GoogleCloudPlatform(config, MagicMock(), 'first')
+        second = gcp.GoogleCloudPlatform(config, MagicMock(), 'second')
+
+        self.assertIs(first.discovery, second.discovery)
+        mock_build.assert_called_once()
+
+        other = gcp.GoogleCloudPlatform(
+            dict(config, auth={'client_email': 'b'}), MagicMock(), 'other')
+        other.discovery
+        self.assertEqual(2, mock_build.call_count)
+
+
+class FakeCredentials(object):
+    requires_scopes = True
+
+    def __init__(self, lifetime=3600):
+        self.lifetime = lifetime
+        self.token = None
+        self.expiry = None
+        self.refreshes = 0
+        self.with_scopes = MagicMock(
+            side_effect=lambda scopes: FakeCredentials(self.lifetime))
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = 'token{0}'.format(self.refreshes)
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=self.lifetime)
+
+    def apply(self, headers, token=None):
+        headers['authorization'] = 'Bearer {0}'.format(token or self.token)
+
+
+class TestCredentialsCache(unittest.TestCase):
+
+    def test_get_shares_credentials_per_identity_and_scopes(self):
+        cache = gcp.CredentialsCache()
+        factory = MagicMock(side_effect=FakeCredentials)
+
+        credentials = cache.get('sa', factory)
+        self.assertIs(credentials, cache.get('sa', factory))
+        self.assertIsNot(credentials, cache.get('other', factory))
+        self.assertEqual(2, factory.call_count)
+
+        scoped = credentials.with_scopes(['b', 'a'])
+        self.assertIs(scoped, credentials.with_scopes(['a', 'b']))
+        self.assertIsNot(scoped, credentials.with_scopes(['a']))
+        self.assertTrue(scoped.requires_scopes)
+
+    def test_refresh_before_expiry(self):
+        cache = gcp.CredentialsCache(refresh_margin=300)
+        credentials = cache.get('sa', lambda: FakeCredentials(lifetime=3600))
+        headers = {}
+
+        credentials.before_request(None, 'GET', 'url', headers)
+        credentials.before_request(None, 'GET', 'url', headers)
+        self.assertEqual('Bearer token1', headers['authorization'])
+
+        credentials.expiry = datetime.datetime.utcnow() + \
+            datetime.timedelta(seconds=60)
+        credentials.before_request(None, 'GET', 'url', headers)
+        self.assertEqual('Bearer token2', headers['authorization'])
+
+    def test_concurrent_refresh(self):
+        cache = gcp.CredentialsCache()
+        inner = FakeCredentials()
+        credentials = cache.get('sa', lambda: inner)
+
+        threads = [
+            threading.Thread(
+                target=credentials.before_request,
+                args=(None, 'GET', 'url', {}))
+            for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, inner.refreshes)
+
+    @patch('cloudify_gcp.gcp.build')
+    def test_create_discovery_shares_credentials(self, mock_build, *_):
+        config = {'auth': {'client_email': 'a'}, 'project': 'p', 'zone': 'z'}
+        compute = gcp.GoogleCloudPlatform(config, MagicMock(), 'compute')
+
+        compute.discovery
+
+        http = mock_build.call_args[1]['http']
+        self.assertIs(compute.transport, http.http)
+        self.assertIs(
+            gcp.credentials_cache.get(
+                compute.credentials_key(),
+                None,
+                gcp.discovery_store.scopes('compute', 'v1')),
+            http.credentials)
+
+
+BATCH_RESPONSE = """--batch_boundary
+Content-Type: application/http
+Content-ID: <response-a + 0>
+
+HTTP/1.1 200 OK
+Content-Type: application/json
+
+{0}
+--batch_boundary
+Content-Type: application/http
+Content-ID: <response-a + 1>
+
+HTTP/1.1 404 Not Found
+Content-Type: application/json
+
+{{"error": {{"code": 404, "message": "not found"}}}}
+--batch_boundary--
+"""
+
+
+class FakeTransport(object):
+
+    def __init__(self, responses):
+        self.http = HttpMockSequence(responses)
+
+    def authorize(self, credentials):
+        return self.http
+
+
+@patch('cloudify_gcp.gcp.service_account.Credentials.'
+       'from_service_account_info', return_value=AnonymousCredentials())
+class TestBatch(unittest.TestCase):
+
+    def platform(self, transport, name='op'):
+        platform = gcp.GoogleCloudPlatform(
+            {'auth': {'client_email': 'a'}, 'project': 'p', 'zone': 'z'},
+            MagicMock(), name)
+        platform.transport = transport
+        return platform
+
+    def batch_transport(self, first_response):
+        return FakeTransport([
+            ({'status': '200',
+              'content-type': 'multipart/mixed; boundary="batch_boundary"'},
+             BATCH_RESPONSE.format(
+                 json.dumps(first_response)).replace('\n', '\r\n'))])
+
+    def test_batch_resolves_futures(self, *_):
+        transport = self.batch_transport({'name': 'first', 'status': 'DONE'})
+        first = utils.GlobalOperation(
+            self.platform(transport).config, MagicMock(), {'name': 'first'})
+        second = utils.GlobalOperation(
+            self.platform(transport).config, MagicMock(), {'name': 'second'})
+        first.transport = second.transport = transport
+
+        with first.batch() as batch:
+            futures = [first.get(), second.get()]
+            self.assertEqual(2, len(batch))
+            self.assertFalse(futures[0].done())
+            self.assertRaises(gcp.GCPError, futures[0].result)
+
+        self.assertEqual('DONE', futures[0].result()['status'])
+        self.assertEqual('DONE', first.last_status)
+        self.assertTrue(first.has_finished())
+        self.assertIsInstance(futures[1].exception(), HttpError)
+        self.assertTrue(gcp.is_missing_resource_error(futures[1].exception()))
+        self.assertEqual(1, len(transport.http.request_sequence))
+
+    def test_batch_maps_error_responses(self, *_):
+        transport = self.batch_transport({'error': 'quota exceeded'})
+        platform = self.platform(transport)
+
+        @gcp.check_response
+        def get(self):
+            return self.discovery.firewalls().get(
+                project='p', firewall='f').execute()
+
+        with platform.batch():
+            future = get(platform)
+
+        self.assertRaises(gcp.GCPError, future.result)
+
+    def test_batch_splits_requests(self, *_):
+        transport = self.batch_transport({'name': 'first'})
+        platform = self.platform(transport)
+
+        with patch.object(gcp.Batch, 'execute') as mock_execute:
+            with platform.batch() as batch:
+                # Requests sent with an explicit http object are not queued
+                self.assertEqual({}, platform.discovery.firewalls().get(
+                    project='p', firewall='f').execute(
+                        http=HttpMockSequence([({'status': '200'}, '{}')])))
+        mock_execute.assert_called_once_with()
+        self.assertEqual(0, len(batch))
+
+        batch = gcp.Batch(platform.discovery, platform.api, max_size=1)
+        batch.add(platform.discovery.firewalls().get(
+            project='p', firewall='f'))
+        batch.add(platform.discovery.firewalls().get(
+            project='p', firewall='g'))
+        with patch.object(platform.discovery, 'new_batch_http_request') \
+                as mock_batch:
+            batch.execute()
+        self.assertEqual(2, mock_batch().execute.call_count)
+
+    def test_requests_of_other_apis_are_executed(self, *_):
+        platform = self.platform(self.batch_transport({}))
+        request = MagicMock(api=('dns', 'v1'), resumable=None)
+
+        with platform.batch() as batch:
+            self.assertFalse(batch.accepts(request))
+            self.assertIs(batch, gcp.current_batch())
+        self.assertIsNone(gcp.current_batch())
+
+    @patch('cloudify_gcp.retry.time.sleep')
+    def test_requests_are_retried(self, mock_sleep, *_):
+        platform = self.platform(FakeTransport([
+            ({'status': '503'}, '{}'),
+            ({'status': '200'}, '{"name": "f"}')]))
+
+        with patch.object(gcp.BatchableHttpRequest, 'retry_policy',
+                          retry.RetryPolicy(sleep=mock_sleep)):
+            self.assertEqual({'name': 'f'}, platform.discovery.firewalls().get(
+                project='p', firewall='f').execute())
+        mock_sleep.assert_called_once()
+
+    def test_requests_are_recorded(self, *_):
+        transport = FakeTransport([
+            ({'status': '404'}, '{}'),
+            ({'status': '200'}, '{"name": "f"}')])
+        platform = self.platform(transport)
+        recorder = metrics.Recorder('log')
+
+        with patch.object(gcp.BatchableHttpRequest, 'recorder', recorder):
+            firewalls = platform.discovery.firewalls()
+            self.assertRaises(
+                HttpError,
+                firewalls.get(project='p', firewall='f').execute)
+            firewalls.insert(project='p', body={'name': 'f'}).execute()
+
+        summary = recorder.summary()[metrics.UNSCOPED]
+        self.assertEqual({'404': 1}, summary['compute.firewalls.get'][
+            'statuses'])
+        self.assertEqual({'200': 1}, summary['compute.firewalls.insert'][
+            'statuses'])
+        self.assertEqual(13, summary['compute.firewalls.insert'][
+            'response_bytes'])
+        self.assertLess(0, summary['compute.firewalls.insert'][
+            'request_bytes'])
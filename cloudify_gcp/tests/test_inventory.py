@@ -0,0 +1,85 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+
+from cloudify_gcp import inventory
+
+
+class TestInventoryStore(unittest.TestCase):
+
+    def setUp(self):
+        super(TestInventoryStore, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.store = inventory.InventoryStore(
+            os.path.join(self.path, 'inventory'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(TestInventoryStore, self).tearDown()
+
+    def test_write_and_get(self):
+        with self.store.writer('account') as writer:
+            first = writer.add('zone', 'type', 'a', {'name': 'a'})
+            second = writer.add('zone', 'type', 'b', {'name': u'bé'})
+
+        self.assertEqual(self.store.get('account', first), {'name': 'a'})
+        self.assertEqual(self.store.get('account', second),
+                         {'name': u'bé'})
+        self.assertIsNone(self.store.get('account', None))
+
+        self.store.delete('account')
+        self.assertIsNone(self.store.get('account', first))
+
+    def test_failed_write_keeps_inventory(self):
+        with self.store.writer('account') as writer:
+            offset = writer.add('zone', 'type', 'a', {'name': 'a'})
+
+        with self.assertRaises(ValueError):
+            with self.store.writer('account') as writer:
+                # The previous inventory is readable while writing
+                self.assertEqual(self.store.get('account', offset),
+                                 {'name': 'a'})
+                writer.add('zone', 'type', 'b', {'name': 'b'})
+                raise ValueError()
+
+        self.assertEqual(self.store.get('account', offset), {'name': 'a'})
+        self.assertEqual(os.listdir(self.store.path), ['account.ndjson'])
+
+    def test_unwritable_store_drops_records(self):
+        with open(os.path.join(self.path, 'file'), 'w'):
+            pass
+        store = inventory.InventoryStore(
+            os.path.join(self.path, 'file', 'inventory'))
+        logger = MagicMock()
+        with store.writer('account', logger) as writer:
+            self.assertIsNone(writer.add('zone', 'type', 'a', {}))
+        self.assertIsNone(store.get('account', 0))
+        logger.warn.assert_called_once()
+
+    def test_failed_record_write_drops_records(self):
+        f = MagicMock()
+        f.write.side_effect = [None, IOError('No space left on device')]
+        logger = MagicMock()
+        writer = inventory.InventoryWriter(f, logger)
+        self.assertEqual(0, writer.add('zone', 'type', 'a', {}))
+        self.assertIsNone(writer.add('zone', 'type', 'b', {}))
+        self.assertIsNone(writer.add('zone', 'type', 'c', {}))
+        self.assertEqual(2, f.write.call_count)
+        logger.warn.assert_called_once()
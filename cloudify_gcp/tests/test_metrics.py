@@ -0,0 +1,91 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+
+from cloudify_gcp import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = metrics.Histogram(buckets=(10, 100))
+        for value in (5, 10, 50, 500):
+            histogram.add(value)
+
+        self.assertEqual({
+            'count': 4,
+            'sum': 565,
+            'min': 5,
+            'max': 500,
+            'buckets': {'le_10': 2, 'le_100': 1, 'inf': 1},
+        }, histogram.to_dict())
+
+    def test_disabled(self):
+        recorder = metrics.Recorder('')
+        logger = MagicMock()
+        with recorder.operation('create', logger):
+            recorder.record('compute.instances.get', 200, 0.1)
+
+        self.assertEqual({}, recorder.summary())
+        logger.info.assert_not_called()
+
+    def test_operation_dumped_to_log(self):
+        recorder = metrics.Recorder('log')
+        logger = MagicMock()
+        recorder.record('compute.zones.list', 200, 0.01)
+        with recorder.operation('create', logger, node_instance='vm_1'):
+            recorder.record('compute.instances.insert', 200, 0.2,
+                            retries=1, request_size=100, response_size=10)
+            recorder.record('compute.instances.insert', 503, 0.3)
+
+        message = logger.info.call_args[0][0]
+        self.assertTrue(message.startswith('GCP API calls: '))
+        data = json.loads(message[len('GCP API calls: '):])
+        self.assertEqual('create', data['operation'])
+        self.assertEqual('vm_1', data['node_instance'])
+        calls = data['calls']['compute.instances.insert']
+        self.assertEqual(2, calls['calls'])
+        self.assertEqual({'200': 1, '503': 1}, calls['statuses'])
+        self.assertEqual(1, calls['retries'])
+        self.assertEqual(100, calls['request_bytes'])
+        self.assertEqual(500, calls['latency_ms']['sum'])
+
+        summary = recorder.summary()
+        self.assertEqual(['create', metrics.UNSCOPED], sorted(summary))
+        self.assertEqual(
+            1, summary[metrics.UNSCOPED]['compute.zones.list']['calls'])
+
+    def test_operation_dumped_to_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'metrics.json')
+        recorder = metrics.Recorder(path)
+
+        for operation in ('create', 'start'):
+            with recorder.operation(operation):
+                recorder.record('compute.instances.get', 200, 0.1)
+        with recorder.operation('stop'):
+            pass
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(['create', 'start'],
+                         [line['operation'] for line in lines])
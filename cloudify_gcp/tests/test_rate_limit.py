@@ -0,0 +1,124 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+
+from cloudify.exceptions import NonRecoverableError
+
+from cloudify_gcp import rate_limit
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def setUp(self):
+        super(TestRateLimit, self).setUp()
+        self.now = 1000.0
+        self.sleep = MagicMock()
+        self.limiter = rate_limit.RateLimiter(
+            rates={'compute': {'read': 10, 'write': 2}},
+            clock=lambda: self.now,
+            sleep=self.sleep)
+
+    def test_request_info(self):
+        self.assertEqual('read', rate_limit.request_class('GET'))
+        self.assertEqual('write', rate_limit.request_class('POST'))
+        self.assertEqual('p-1', rate_limit.get_project(
+            'https://compute.googleapis.com/compute/v1/projects/p-1/zones/z'))
+        self.assertIsNone(rate_limit.get_project(
+            'https://storage.googleapis.com/upload/storage/v1/b/bucket'))
+
+    def test_take(self):
+        bucket, wait = rate_limit.take(None, 2, 2, 1, 0)
+        self.assertEqual(((1, 0), 0), (bucket, wait))
+        bucket, wait = rate_limit.take(bucket, 2, 2, 3, 0)
+        self.assertEqual(((-2, 0), 1), (bucket, wait))
+        # Refilled, but never above the burst
+        bucket, wait = rate_limit.take(bucket, 2, 2, 1, 10)
+        self.assertEqual(((1, 10), 0), (bucket, wait))
+
+    def test_acquire(self):
+        for _ in range(2):
+            self.assertEqual(0, self.limiter.acquire('p', 'compute', 'write'))
+        self.assertEqual(0.5, self.limiter.acquire('p', 'compute', 'write'))
+        self.sleep.assert_called_once_with(0.5)
+
+        # Separate buckets per project and request class
+        self.assertEqual(0, self.limiter.acquire('q', 'compute', 'write'))
+        self.assertEqual(0, self.limiter.acquire('p', 'compute', 'read'))
+
+        self.now += 1.5
+        self.assertEqual(0, self.limiter.acquire('p', 'compute', 'write'))
+
+    def test_configure(self):
+        self.assertIsNone(self.limiter.rate('dns', 'read'))
+        self.assertEqual(0, self.limiter.acquire('p', 'dns', 'read', 100))
+
+        self.limiter.configure('p', {'default': {'read': 5}}, 'file')
+        self.assertEqual(5, self.limiter.rate('dns', 'read', 'p'))
+        self.assertIsNone(self.limiter.rate('compute', 'write', 'p'))
+        self.assertIsInstance(self.limiter.limits('p')[1],
+                              rate_limit.FileBackend)
+
+        # The limits of other projects are left alone
+        self.limiter.configure('q')
+        self.assertIsNone(self.limiter.rate('dns', 'read', 'q'))
+        self.assertEqual(2, self.limiter.rate('compute', 'write', 'q'))
+        self.assertIs(self.limiter.backend, self.limiter.limits('q')[1])
+        self.assertEqual(5, self.limiter.rate('dns', 'read', 'p'))
+
+        # A config without rates restores the rates of the limiter
+        self.limiter.configure('p')
+        self.assertIsNone(self.limiter.rate('dns', 'read', 'p'))
+
+    def test_unlimited_by_default(self):
+        limiter = rate_limit.RateLimiter(sleep=self.sleep)
+        self.assertIsNone(limiter.rate('compute', 'write', 'p'))
+        self.assertEqual(0, limiter.acquire('p', 'compute', 'write', 1000))
+        limiter.configure('p')
+        self.assertEqual(0, limiter.acquire('p', 'compute', 'write', 1000))
+        self.sleep.assert_not_called()
+
+    def test_configure_unknown_backend(self):
+        with self.assertRaises(NonRecoverableError):
+            self.limiter.configure('p', backend='redis')
+
+    def test_file_backend_is_shared(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'state', 'rate_limits.json')
+        first = rate_limit.FileBackend(path)
+        second = rate_limit.FileBackend(path)
+
+        key = ('p', 'compute', 'write')
+        self.assertEqual(0, first.reserve(key, 1, 1, 1, 0))
+        self.assertEqual(1, second.reserve(key, 1, 1, 1, 0))
+        self.assertEqual(2, first.reserve(key, 1, 1, 1, 0))
+
+    def test_file_backend_key_without_api(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        backend = rate_limit.FileBackend(os.path.join(directory, 'state'))
+        self.assertEqual(0, backend.reserve(('p', None, 'read'), 1, 1, 1, 0))
+        self.assertEqual(1, backend.reserve(('p', None, 'read'), 1, 1, 1, 0))
+
+    def test_file_backend_falls_back_to_memory(self):
+        backend = rate_limit.FileBackend('/dev/null/rate_limits.json')
+        key = ('p', 'compute', 'write')
+        self.assertEqual(0, backend.reserve(key, 1, 1, 1, 0))
+        self.assertEqual(1, backend.reserve(key, 1, 1, 1, 0))
@@ -0,0 +1,120 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from mock import MagicMock, patch
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from cloudify_gcp import retry
+
+
+def http_error(status, headers=None):
+    response = httplib2.Response(dict(headers or {}, status=status))
+    return HttpError(response, b'{}')
+
+
+class TestRetry(unittest.TestCase):
+
+    def setUp(self):
+        super(TestRetry, self).setUp()
+        self.sleep = MagicMock()
+        self.policy = retry.RetryPolicy(
+            max_attempts=4, base_delay=1, max_delay=8,
+            budget=retry.RetryBudget(max_tokens=3, token_ratio=0.5),
+            sleep=self.sleep)
+
+    def test_get_retry_after(self):
+        self.assertEqual(
+            2.5, retry.get_retry_after(httplib2.Response(
+                {'retry-after': '2.5'})))
+        self.assertEqual(
+            0, retry.get_retry_after(httplib2.Response(
+                {'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'})))
+        self.assertIsNone(retry.get_retry_after(httplib2.Response({})))
+        self.assertIsNone(retry.get_retry_after(httplib2.Response(
+            {'retry-after': 'soon'})))
+
+    def test_is_retryable(self):
+        self.assertTrue(retry.is_retryable(http_error(429), 'POST'))
+        self.assertTrue(retry.is_retryable(http_error(503), 'POST'))
+        self.assertTrue(retry.is_retryable(http_error(500), 'GET'))
+        self.assertFalse(retry.is_retryable(http_error(500), 'POST'))
+        self.assertFalse(retry.is_retryable(http_error(404), 'GET'))
+        self.assertFalse(retry.is_retryable(ValueError(), 'GET'))
+
+    @patch('cloudify_gcp.retry.random.uniform', side_effect=lambda a, b: b)
+    def test_execute_backs_off(self, *_):
+        send = MagicMock(side_effect=[
+            http_error(503), http_error(429), http_error(503), 'done'])
+
+        self.assertEqual(
+            'done', self.policy.execute('compute.instances.get', 'GET', send))
+        self.assertEqual(
+            [1, 2, 4], [c[0][0] for c in self.sleep.call_args_list])
+
+    def test_execute_honors_retry_after(self):
+        on_retry = MagicMock()
+        send = MagicMock(side_effect=[
+            http_error(429, {'retry-after': '3'}), 'done'])
+
+        self.policy.execute('compute.instances.get', 'GET', send, on_retry)
+        self.sleep.assert_called_once_with(3)
+        on_retry.assert_called_once()
+
+        send = MagicMock(side_effect=[
+            http_error(429, {'retry-after': '60'}), 'done'])
+        self.assertRaises(
+            HttpError,
+            self.policy.execute, 'compute.instances.get', 'GET', send)
+
+    def test_execute_gives_up(self):
+        send = MagicMock(side_effect=http_error(503))
+        self.assertRaises(
+            HttpError,
+            self.policy.execute, 'compute.instances.get', 'GET', send)
+        self.assertEqual(4, send.call_count)
+
+        send = MagicMock(side_effect=http_error(404))
+        self.assertRaises(
+            HttpError,
+            self.policy.execute, 'compute.instances.get', 'GET', send)
+        send.assert_called_once()
+
+    def test_budget(self):
+        send = MagicMock(side_effect=http_error(503))
+        self.assertRaises(
+            HttpError,
+            self.policy.execute, 'compute.instances.insert', 'POST', send)
+        self.assertEqual(0, self.policy.budget.tokens(
+            'compute.instances.insert'))
+
+        # No retries left for the method, other methods are not affected
+        send = MagicMock(side_effect=[http_error(503), 'done'])
+        self.assertRaises(
+            HttpError,
+            self.policy.execute, 'compute.instances.insert', 'POST', send)
+        self.assertEqual(
+            'done',
+            self.policy.execute('compute.instances.get', 'GET', send))
+
+        # Successful requests refill the budget
+        self.policy.execute(
+            'compute.instances.insert', 'POST', MagicMock())
+        self.policy.execute(
+            'compute.instances.insert', 'POST', MagicMock())
+        self.assertEqual(1, self.policy.budget.tokens(
+            'compute.instances.insert'))
@@ -12,9 +12,162 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
+import shutil
+import tempfile
+
+from mock import patch, MagicMock
+
 from cloudify_gcp import storage
+from cloudify_gcp.gcp import GCPError
 from . import TestGCP
 
+CONFIG = {
+    'auth': {},
+    'project': 'project',
+    'zone': 'zone',
+}
+DATA = b'0123456789'
+
+
+class TestCRC32C(TestGCP):
+
+    def test_crc32c(self):
+        self.assertEqual(storage.crc32c(b'123456789'), 0xE3069283)
+        self.assertEqual(storage.crc32c(b'6789', storage.crc32c(b'12345')),
+                         0xE3069283)
+        self.assertEqual(storage.encode_crc32c(0xE3069283), '4waSgw==')
+
+    def test_crc32c_combine(self):
+        first, second = b'hello' * 100, b'world' * 33
+        self.assertEqual(
+            storage.crc32c_combine(storage.crc32c(first),
+                                   storage.crc32c(second), len(second)),
+            storage.crc32c(first + second))
+        self.assertEqual(storage.crc32c_combine(1, 0, 0), 1)
+
+    def test_get_slices(self):
+        self.assertEqual(storage.get_slices(10, 4),
+                         [(0, 4), (4, 4), (8, 2)])
+        self.assertEqual(storage.get_slices(10, 1, max_components=3),
+                         [(0, 4), (4, 4), (8, 2)])
+        self.assertEqual(storage.get_slices(10, 100), [(0, 10)])
+
+    def test_file_slice(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(DATA)
+            file_slice = storage.FileSlice(f, 3, 5)
+            self.assertEqual(file_slice.seek(0, os.SEEK_END), 5)
+            file_slice.seek(1)
+            self.assertEqual(file_slice.read(2), b'45')
+            self.assertEqual(file_slice.tell(), 3)
+            self.assertEqual(file_slice.read(), b'67')
+            self.assertEqual(file_slice.read(), b'')
+
+
+get_slices = storage.get_slices
+
+
+@patch('cloudify_gcp.storage.NATIVE_CRC32C', True)
+@patch('cloudify_gcp.storage.get_slices',
+       side_effect=lambda size: get_slices(size, 4))
+@patch('cloudify_gcp.gcp.build')
+class TestCompositeUpload(TestGCP):
+
+    def setUp(self):
+        super(TestCompositeUpload, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'image.tar.gz')
+        with open(self.path, 'wb') as f:
+            f.write(DATA)
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def mock_objects(self, mock_build, corrupt=None):
+        objects = mock_build().objects()
+        uploads = {}
+
+        def insert(bucket, name, media_body):
+            data = media_body.getbytes(0, media_body.size())
+            uploads[name] = data
+            if name == corrupt:
+                data = data[::-1]
+            request = MagicMock()
+            request.next_chunk.return_value = (None, {
+                'crc32c': storage.encode_crc32c(storage.crc32c(data))})
+            return request
+
+        objects.insert.side_effect = insert
+        objects.compose().execute.return_value = {
+            'crc32c': storage.encode_crc32c(storage.crc32c(DATA)),
+            'selfLink': 'link'}
+        objects.compose.reset_mock()
+        return objects, uploads
+
+    def test_upload_to_bucket(self, mock_build, *_):
+        objects, uploads = self.mock_objects(mock_build)
+        obj = storage.Object(CONFIG, self.ctxmock.logger, 'image.tar.gz')
+        self.assertEqual(obj.upload_to_bucket(self.path, threshold=4),
+                         'link')
+        names = ['image.tar.gz.slice-{0}-of-3'.format(index)
+                 for index in range(3)]
+        self.assertEqual(uploads, dict(zip(names, [b'0123', b'4567', b'89'])))
+        objects.compose.assert_called_once_with(
+            destinationBucket='project',
+            destinationObject='image.tar.gz',
+            body={'sourceObjects': [{'name': name} for name in names],
+                  'destination': {'contentType': 'application/x-tar'}})
+        self.assertEqual(
+            sorted(call[1]['name'] for call in
+                   objects.delete.call_args_list),
+            names)
+
+    def test_upload_to_bucket_below_threshold(self, mock_build, *_):
+        objects = mock_build().objects()
+        objects.insert().next_chunk.return_value = (None, {'selfLink': 'link'})
+        obj = storage.Object(CONFIG, self.ctxmock.logger, 'image.tar.gz')
+        self.assertEqual(obj.upload_to_bucket(self.path, threshold=11),
+                         'link')
+        objects.compose.assert_not_called()
+
+    def test_upload_to_bucket_python_crc32c(self, mock_build, *_):
+        objects = mock_build().objects()
+        objects.insert().next_chunk.return_value = (None, {'selfLink': 'link'})
+        obj = storage.Object(CONFIG, self.ctxmock.logger, 'image.tar.gz')
+        with patch('cloudify_gcp.storage.NATIVE_CRC32C', False):
+            self.assertEqual(obj.upload_to_bucket(self.path, threshold=4),
+                             'link')
+        objects.compose.assert_not_called()
+        self.ctxmock.logger.getChild().warn.assert_called_once()
+
+    def test_composite_upload_failed_cleanup(self, mock_build, *_):
+        objects, _ = self.mock_objects(
+            mock_build, corrupt='image.tar.gz.slice-1-of-3')
+        objects.delete.side_effect = ValueError('cleanup')
+        obj = storage.Object(CONFIG, self.ctxmock.logger, 'image.tar.gz')
+        # The upload error is raised, not the one of the cleanup
+        with self.assertRaises(GCPError):
+            obj.composite_upload(self.path)
+        self.assertEqual(objects.delete.call_count, 3)
+
+    def test_composite_upload_corrupt_slice(self, mock_build, *_):
+        objects, _ = self.mock_objects(
+            mock_build, corrupt='image.tar.gz.slice-1-of-3')
+        obj = storage.Object(CONFIG, self.ctxmock.logger, 'image.tar.gz')
+        with self.assertRaises(GCPError):
+            obj.composite_upload(self.path)
+        objects.compose.assert_not_called()
+        self.assertEqual(objects.delete.call_count, 3)
+
+    def test_composite_upload_corrupt_object(self, mock_build, *_):
+        objects, _ = self.mock_objects(mock_build)
+        objects.compose().execute.return_value = {
+            'crc32c': storage.encode_crc32c(0), 'selfLink': 'link'}
+        obj = storage.Object(CONFIG, self.ctxmock.logger, 'image.tar.gz')
+        with self.assertRaises(GCPError):
+            obj.composite_upload(self.path)
+        objects.delete.assert_called_with(bucket='project',
+                                          name='image.tar.gz')
+
 
 class TestStorageWithCTX(TestGCP):
 
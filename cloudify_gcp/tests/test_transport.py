@@ -0,0 +1,107 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import threading
+import unittest
+
+from mock import MagicMock, patch
+
+from cloudify_gcp import transport
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_reuses_released_connection(self):
+        pool = transport.ConnectionPool(2, 60, factory=MagicMock)
+
+        http = pool.acquire()
+        pool.release(http)
+
+        self.assertIs(http, pool.acquire())
+        self.assertEqual(1, len(pool))
+
+    def test_closes_idle_connections(self):
+        pool = transport.ConnectionPool(2, 60, factory=MagicMock)
+        http = pool.acquire()
+        pool.release(http)
+
+        with patch('cloudify_gcp.transport.time.time',
+                   return_value=time.time() + 61):
+            self.assertIsNot(http, pool.acquire())
+        http.close.assert_called_once_with()
+        self.assertEqual(1, len(pool))
+
+    def test_blocks_when_exhausted(self):
+        pool = transport.ConnectionPool(1, 60, factory=MagicMock)
+        http = pool.acquire()
+        acquired = []
+
+        thread = threading.Thread(target=lambda: acquired.append(
+            pool.acquire()))
+        thread.start()
+        thread.join(0.1)
+        self.assertEqual([], acquired)
+
+        pool.release(http)
+        thread.join()
+        self.assertEqual([http], acquired)
+
+
+class TestPooledHttp(unittest.TestCase):
+
+    def test_request_uses_pool_per_host(self):
+        pooled = transport.PooledHttp(2, 60, factory=MagicMock)
+
+        pooled.request('https://compute.googleapis.com/a', 'GET')
+        pooled.request('https://compute.googleapis.com/b', 'POST', body='x')
+        pooled.request('https://dns.googleapis.com/c')
+
+        compute = pooled.pool('https://compute.googleapis.com/')
+        self.assertEqual(1, len(compute))
+        http = compute.acquire()
+        http.request.assert_called_with(
+            'https://compute.googleapis.com/b', 'POST',
+            body='x', headers=None, redirections=5, connection_type=None)
+        self.assertEqual(1, len(pooled.pool('https://dns.googleapis.com/')))
+
+    def test_connections_outlast_long_polls(self):
+        pooled = transport.PooledHttp(1, 60)
+
+        http = pooled.pool('https://compute.googleapis.com/').acquire()
+
+        self.assertEqual(transport.constants.HTTP_TIMEOUT, http.timeout)
+        self.assertGreater(http.timeout, 120)
+
+    def test_request_releases_on_error(self):
+        pooled = transport.PooledHttp(1, 60, factory=MagicMock)
+        pool = pooled.pool('https://compute.googleapis.com/')
+        http = pool.acquire()
+        http.request.side_effect = IOError()
+        pool.release(http)
+
+        with self.assertRaises(IOError):
+            pooled.request('https://compute.googleapis.com/a')
+
+        self.assertIs(http, pool.acquire())
+
+    def test_authorize(self):
+        pooled = transport.PooledHttp(1, 60, factory=MagicMock)
+        credentials = MagicMock()
+
+        http = pooled.authorize(credentials)
+
+        self.assertIs(pooled, http.http)
+        self.assertIs(credentials, http.credentials)
@@ -16,6 +16,7 @@
 
 import unittest
 import json
+import socket
 from functools import partial
 
 from mock import Mock, patch, PropertyMock, MagicMock
@@ -23,7 +24,7 @@ from mock import Mock, patch, PropertyMock, MagicMock
 from cloudify.state import current_ctx
 from cloudify.mocks import MockCloudifyContext
 from cloudify.manager import DirtyTrackingDict
-from cloudify.exceptions import NonRecoverableError
+from cloudify.exceptions import NonRecoverableError, OperationRetry
 
 from cloudify_gcp import utils
 from . import TestGCP
@@ -243,6 +244,97 @@ class TestUtilsWithCTX(TestGCP):
             self.ctxmock.instance.runtime_properties['resource_id'],
             'resource_id_in_runtime_props')
 
+    @patch('cloudify_gcp.utils.time')
+    def test_create_waits_for_resource(self, mock_time, *args):
+        mock_time.time.side_effect = [0, 0, 1, 2.5]
+        resource = Mock()
+        resource.create.return_value = {'name': 'created'}
+        not_found = utils.HttpError(NS(status=404), b'')
+        resource.get.side_effect = [not_found, not_found, {'name': 'created'}]
+
+        self.assertEqual({'name': 'created'}, utils.create(resource))
+
+        self.assertEqual(
+            [((1,),), ((1.5,),)], mock_time.sleep.call_args_list)
+        self.assertNotIn(
+            utils.CREATE_DEADLINE, self.ctxmock.instance.runtime_properties)
+
+    @patch('cloudify_gcp.utils.time')
+    def test_create_retries_operation(self, mock_time, *args):
+        mock_time.time.side_effect = [0, 0, 30, 61]
+        resource = Mock()
+        resource.get.side_effect = partial(raiser, 404)
+
+        with self.assertRaises(OperationRetry):
+            utils.create(resource)
+
+        props = self.ctxmock.instance.runtime_properties
+        self.assertEqual(1800, props[utils.CREATE_DEADLINE])
+        self.assertTrue(props[utils.CREATE_SENT])
+
+        # The retry waits for the resource without creating it again
+        mock_time.time.side_effect = [100, 100]
+        resource.reset_mock()
+        resource.get.side_effect = None
+        resource.get.return_value = {'name': 'created'}
+
+        self.assertEqual({'name': 'created'}, utils.create(resource))
+        resource.create.assert_not_called()
+        self.assertNotIn(utils.CREATE_DEADLINE, props)
+
+    @patch('cloudify_gcp.utils.time')
+    def test_create_after_failure(self, mock_time, *args):
+        mock_time.time.return_value = 0
+        resource = Mock()
+        resource.create.return_value = {'name': 'creating'}
+        resource.get.side_effect = partial(raiser, 500)
+
+        with self.assertRaises(utils.HttpError):
+            utils.create(resource)
+
+        props = self.ctxmock.instance.runtime_properties
+        self.assertNotIn(utils.CREATE_SENT, props)
+        self.assertNotIn(utils.CREATE_DEADLINE, props)
+
+        # A new install sends the create request again
+        mock_time.time.return_value = 3600
+        resource.reset_mock()
+        resource.get.side_effect = None
+        resource.get.return_value = {'name': 'created'}
+
+        self.assertEqual({'name': 'creating'}, utils.create(resource))
+        resource.create.assert_called_once_with()
+        self.assertNotIn(utils.CREATE_SENT, props)
+
+    @patch('cloudify_gcp.utils.time')
+    def test_create_ignores_stale_deadline(self, mock_time, *args):
+        mock_time.time.return_value = 3600
+        props = self.ctxmock.instance.runtime_properties
+        props[utils.CREATE_DEADLINE] = 10
+        resource = Mock()
+        resource.create.return_value = {'name': 'creating'}
+        resource.get.return_value = {'name': 'created'}
+
+        utils.create(resource)
+
+        resource.create.assert_called_once_with()
+        self.assertNotIn(utils.CREATE_DEADLINE, props)
+
+    @patch('cloudify_gcp.utils.time')
+    def test_wait_for_timeout(self, mock_time, *args):
+        self.ctxmock.instance.runtime_properties['deadline'] = 10
+        mock_time.time.side_effect = [5, 11]
+
+        with self.assertRaises(NonRecoverableError) as error:
+            utils.wait_for(lambda: None, 'Waiting.', 'deadline')
+
+        # The message reports the stored deadline, not the default timeout
+        self.assertEqual(
+            'Timed out, the deadline 1970-01-01 00:00:10 UTC passed: '
+            'Waiting.', str(error.exception))
+        mock_time.sleep.assert_not_called()
+        self.assertNotIn('deadline', self.ctxmock.instance.runtime_properties)
+
     def test_retry_on_failure_raises(self, *args):
 
         @utils.retry_on_failure('a message')
@@ -342,6 +434,53 @@ class TestUtilsWithCTX(TestGCP):
         with self.assertRaises(NonRecoverableError):
             utils.get_gcp_config()
 
+    def test_get_gcp_config_cached(self, *args):
+        self.ctxmock.node.properties['client_config'] = {
+            'zone': '3',
+            'auth': {'value': json.dumps({'project_id': 'p'})},
+        }
+        props = self.ctxmock.instance.runtime_properties
+
+        with patch('cloudify_gcp.utils.get_gcp_config_dict',
+                   side_effect=json.loads) as parse:
+            conf = utils.get_gcp_config()
+            conf['zone'] = 'changed by the caller'
+            props['gcp_zone'] = '4'
+            cached = utils.get_gcp_config()
+
+            self.assertEqual(1, parse.call_count)
+            self.assertEqual('p', cached['project'])
+            self.assertEqual('4', cached['zone'])
+            self.assertEqual(
+                '3', utils.get_gcp_config(requested_zone='3')['zone'])
+            self.assertEqual(
+                {'value': json.dumps({'project_id': 'p'})},
+                self.ctxmock.node.properties['client_config']['auth'])
+
+            # Changed properties are resolved again
+            self.ctxmock.node.properties['client_config']['auth'] = {
+                'value': json.dumps({'project_id': 'q'})}
+            self.assertEqual('q', utils.get_gcp_config()['project'])
+
+    @patch('cloudify_gcp.utils.rate_limiter')
+    def test_get_gcp_config_configures_rate_limits_once(self, limiter, *_):
+        self.ctxmock.node.properties['client_config'] = {
+            'zone': '3',
+            'project': 'p',
+            'auth': {},
+            'rate_limits': {'default': {'read': 5}},
+        }
+        utils.get_gcp_config()
+        utils.get_gcp_config()
+        limiter.configure.assert_called_once_with(
+            'p', {'default': {'read': 5}}, None)
+
+        # A changed config is configured again
+        self.ctxmock.node.properties['client_config']['rate_limits'] = None
+        utils.get_gcp_config()
+        limiter.configure.assert_called_with('p', None, None)
+        self.assertEqual(2, limiter.configure.call_count)
+
     def test_get_net_and_subnet(self, *args):
         self.assertEqual(
             ('projects/not really a project/'
@@ -384,3 +523,196 @@ class TestUtilsWithCTX(TestGCP):
         self.assertNotIn(
                 '_operation',
                 self.ctxmock.instance.runtime_properties)
+
+
+@patch('cloudify_gcp.gcp.service_account.Credentials.'
+       'from_service_account_info')
+@patch('cloudify_gcp.gcp.build')
+class TestOperation(unittest.TestCase):
+
+    def setUp(self):
+        super(TestOperation, self).setUp()
+        self.config = {'auth': {}, 'project': 'p', 'zone': 'z'}
+        self.sleep = Mock()
+
+    def test_wait_until_done_long_polls(self, mock_build, *args):
+        operation = utils.response_to_operation(
+            {'name': 'op', 'zone': 'zones/z'}, self.config, MagicMock())
+        waits = mock_build().zoneOperations().wait().execute
+        waits.side_effect = [
+            {'name': 'op', 'status': 'RUNNING'},
+            {'name': 'op', 'status': 'DONE'},
+        ]
+
+        with patch('cloudify_gcp.utils.time.time',
+                   side_effect=[0, 120, 120, 180]):
+            self.assertEqual(
+                {'name': 'op', 'status': 'DONE'},
+                operation.wait_until_done(self.sleep))
+
+        self.assertEqual(2, waits.call_count)
+        mock_build().zoneOperations().wait.assert_called_with(
+            project='p', zone='z', operation='op')
+        self.sleep.assert_not_called()
+
+    def test_wait_until_done_socket_timeout(self, mock_build, *args):
+        operation = utils.response_to_operation(
+            {'name': 'op', 'zone': 'zones/z'}, self.config, MagicMock())
+        waits = mock_build().zoneOperations().wait().execute
+        waits.side_effect = [
+            socket.timeout('timed out'),
+            {'name': 'op', 'status': 'DONE'},
+        ]
+
+        with patch('cloudify_gcp.utils.time.time',
+                   side_effect=[0, 60, 60, 120]):
+            self.assertEqual(
+                {'name': 'op', 'status': 'DONE'},
+                operation.wait_until_done(self.sleep))
+
+        # The operation is still running, it is long-polled again
+        self.assertEqual(2, waits.call_count)
+        mock_build().zoneOperations().get().execute.assert_not_called()
+        self.sleep.assert_not_called()
+
+    def test_wait_until_done_backs_off(self, mock_build, *args):
+        operation = utils.response_to_operation(
+            {'name': 'op', 'region': 'regions/r'}, self.config, MagicMock())
+        # The wait endpoint returns immediately without the operation done
+        mock_build().regionOperations().wait().execute.side_effect = [
+            {'name': 'op', 'status': 'RUNNING'},
+            {'name': 'op', 'status': 'RUNNING'},
+            {'name': 'op', 'status': 'DONE'},
+        ]
+
+        with patch('cloudify_gcp.utils.time.time', return_value=0):
+            operation.wait_until_done(self.sleep)
+
+        self.assertEqual(
+            [1, 1.5], [c[0][0] for c in self.sleep.call_args_list])
+
+    def test_wait_until_done_falls_back_to_get(self, mock_build, *args):
+        operation = utils.response_to_operation(
+            {'name': 'op'}, self.config, MagicMock())
+        mock_build().globalOperations().wait().execute.side_effect = \
+            partial(raiser, 404)
+        gets = mock_build().globalOperations().get().execute
+        gets.side_effect = [
+            {'name': 'op', 'status': 'RUNNING'},
+            {'name': 'op', 'status': 'DONE'},
+        ]
+
+        operation.wait_until_done(self.sleep)
+
+        self.assertEqual(2, gets.call_count)
+        mock_build().globalOperations().wait().execute.assert_called_once()
+        self.sleep.assert_called_once()
+
+    def test_wait_until_done_raises(self, mock_build, *args):
+        operation = utils.response_to_operation(
+            {'name': 'op'}, self.config, MagicMock())
+        mock_build().globalOperations().wait().execute.side_effect = \
+            partial(raiser, 403)
+
+        self.assertRaises(
+            utils.HttpError, operation.wait_until_done, self.sleep)
+
+    def test_multiplexer_polls_scope_once(self, mock_build, *args):
+        operations = [
+            utils.response_to_operation(
+                {'name': name, 'zone': 'zones/z'}, self.config, MagicMock())
+            for name in ('a', 'b', 'c')]
+        other = utils.response_to_operation(
+            {'name': 'd', 'zone': 'zones/y'}, self.config, MagicMock())
+        collection = mock_build().zoneOperations()
+        collection.list_next.return_value = None
+        collection.list().execute.return_value = {'items': [
+            {'name': 'a', 'status': 'DONE'},
+            {'name': 'b', 'status': 'RUNNING'},
+        ]}
+        collection.get().execute.return_value = {
+            'name': 'c', 'status': 'PENDING'}
+        collection.list.reset_mock()
+
+        multiplexer = utils.OperationMultiplexer(max_age=60)
+        multiplexer.track(operations + [other])
+        self.assertEqual(
+            ['DONE', 'RUNNING', 'PENDING'],
+            [multiplexer.poll(op)['status'] for op in operations])
+
+        collection.list.assert_called_once_with(
+            project='p', zone='z',
+            filter='(name = "a") OR (name = "b") OR (name = "c")')
+        collection.get().execute.assert_called_once()
+        # The finished operation is no longer refreshed
+        scope = multiplexer.scope(operations[0])
+        self.assertEqual(['b', 'c'], sorted(scope.pending))
+        self.assertEqual(['d'], list(multiplexer.scope(other).pending))
+
+    def test_multiplexer_isolates_errors(self, mock_build, *args):
+        operations = [
+            utils.response_to_operation(
+                {'name': name, 'zone': 'zones/z'}, self.config, MagicMock())
+            for name in ('a', 'gone')]
+        collection = mock_build().zoneOperations()
+        collection.list_next.return_value = None
+        collection.get().execute.side_effect = partial(raiser, 404)
+        multiplexer = utils.OperationMultiplexer(max_age=0)
+        scope = multiplexer.scope(operations[0])
+
+        def list_operations():
+            # The requests are sent without holding the lock of the scope
+            self.assertFalse(scope.lock.locked())
+            return {'items': [{'name': 'a', 'status': 'RUNNING'}]}
+
+        collection.list().execute.side_effect = list_operations
+        multiplexer.track(operations)
+        self.assertEqual('RUNNING', multiplexer.poll(operations[0])['status'])
+        self.assertRaises(utils.HttpError, multiplexer.poll, operations[1])
+
+        # The deleted operation is no longer fetched
+        self.assertEqual(['a'], list(scope.pending))
+        collection.get().execute.reset_mock()
+        self.assertEqual('RUNNING', multiplexer.poll(operations[0])['status'])
+        collection.get().execute.assert_not_called()
+
+    def test_has_finished_polls_multiplexer(self, mock_build, *args):
+        operation = utils.response_to_operation(
+            {'name': 'op'}, self.config, MagicMock())
+        collection = mock_build().globalOperations()
+        collection.list_next.return_value = None
+        collection.list().execute.return_value = {'items': [
+            {'name': 'op', 'status': 'DONE', 'error': 'failed'}]}
+
+        self.assertRaises(utils.GCPError, operation.has_finished)
+
+    def test_operation_handle(self, *args):
+        response = {
+            'kind': 'compute#operation',
+            'name': 'op',
+            'region': 'https://www.googleapis.com/compute/v1/projects/p/'
+                      'regions/r',
+            'status': 'RUNNING',
+            'progress': 50,
+            'targetLink': 'https://www.googleapis.com/compute/v1/...',
+        }
+        handle = utils.operation_handle(response)
+
+        self.assertEqual({
+            'kind': 'region',
+            'scope': 'r',
+            'name': 'op',
+            'status': 'RUNNING',
+            'progress': 50,
+        }, handle)
+        self.assertIs(handle, utils.operation_handle(handle))
+
+        operation = utils.response_to_operation(
+            handle, self.config, MagicMock())
+        self.assertIsInstance(operation, utils.RegionOperation)
+        self.assertEqual({'region': 'r'}, operation._scope())
+        self.assertIsInstance(
+            utils.response_to_operation(
+                {'name': 'op', 'kind': 'compute#operation'},
+                self.config, MagicMock()),
+            utils.GlobalOperation)
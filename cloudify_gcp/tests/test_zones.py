@@ -0,0 +1,82 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock
+
+from cloudify_gcp import zones
+
+REGION = 'https://www.googleapis.com/compute/v1/projects/p/regions/'
+ZONES = [
+    {'name': 'us-east1-b', 'region': REGION + 'us-east1', 'status': 'UP'},
+    {'name': 'us-east1-c', 'region': REGION + 'us-east1', 'status': 'DOWN'},
+    {'name': 'europe-west1-b', 'region': REGION + 'europe-west1',
+     'status': 'UP'},
+]
+
+
+class TestZoneCatalog(unittest.TestCase):
+
+    def setUp(self):
+        super(TestZoneCatalog, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.now = 1000
+        self.catalog = self.create_catalog()
+        self.fetch = MagicMock(return_value=ZONES)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(TestZoneCatalog, self).tearDown()
+
+    def create_catalog(self):
+        return zones.ZoneCatalog(self.path, ttl=60, clock=lambda: self.now)
+
+    def test_zones_cached(self):
+        catalog_zones = self.catalog.zones('p', self.fetch)
+        self.assertEqual(catalog_zones['us-east1-b']['region_name'],
+                         'us-east1')
+        self.assertEqual(self.catalog.zones('p', self.fetch), catalog_zones)
+        self.fetch.assert_called_once_with()
+        self.assertTrue(os.path.isfile(self.catalog.project_path('p')))
+
+        # Other processes read the zones from disk
+        self.assertEqual(self.create_catalog().zones('p', self.fetch),
+                         catalog_zones)
+        self.fetch.assert_called_once_with()
+
+        # Expired
+        self.now += 60
+        self.create_catalog().zones('p', self.fetch)
+        self.assertEqual(self.fetch.call_count, 2)
+
+        self.catalog.zones('p', self.fetch, refresh=True)
+        self.assertEqual(self.fetch.call_count, 3)
+
+    def test_available_zones(self):
+        self.assertEqual(self.catalog.available_zones('p', self.fetch),
+                         ['europe-west1-b', 'us-east1-b'])
+
+    def test_unwritable_catalog_keeps_zones_in_memory(self):
+        catalog = zones.ZoneCatalog(
+            os.path.join(self.path, 'file', 'zones'), ttl=60)
+        with open(os.path.join(self.path, 'file'), 'w'):
+            pass
+        catalog.zones('p', self.fetch)
+        catalog.zones('p', self.fetch)
+        self.fetch.assert_called_once_with()
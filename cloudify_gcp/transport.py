@@ -0,0 +1,151 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pooled, keep-alive HTTP transport shared by all GCP API clients of a worker.
+"""
+
+import time
+import threading
+
+import httplib2
+import google_auth_httplib2
+from six.moves.urllib.parse import urlparse
+from googleapiclient.http import build_http
+
+from . import constants
+
+
+class ConnectionPool(object):
+    """
+    Bounded pool of keep-alive httplib2.Http objects for one API host.
+
+    Each httplib2.Http keeps its connection open between requests, but may
+    only be used by one thread at a time. Callers block when all
+    connections of the pool are in use. Connections idle for longer than
+    idle_timeout are closed instead of being reused.
+    """
+    def __init__(self, size, idle_timeout, factory=build_http):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._factory = factory
+        self._condition = threading.Condition()
+        self._idle = []
+        self._created = 0
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                now = time.time()
+                while self._idle:
+                    # The most recently used connection is the last one, if
+                    # it timed out all the others did as well.
+                    http, last_used = self._idle.pop()
+                    if now - last_used < self.idle_timeout:
+                        return http
+                    http.close()
+                    self._created -= 1
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                self._condition.wait()
+        try:
+            return self._factory()
+        except Exception:
+            with self._condition:
+                self._created -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, http):
+        with self._condition:
+            self._idle.append((http, time.time()))
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            for http, _ in self._idle:
+                http.close()
+            self._created -= len(self._idle)
+            self._idle = []
+
+    def __len__(self):
+        return self._created
+
+
+class PooledHttp(object):
+    """
+    Thread-safe, httplib2.Http compatible transport borrowing a pooled
+    keep-alive connection to the requested host for every request.
+    The socket timeout of the connections is above the 2 minutes the
+    operations wait endpoint may take to answer.
+    """
+    def __init__(self,
+                 pool_size=constants.HTTP_POOL_SIZE,
+                 idle_timeout=constants.HTTP_POOL_IDLE_TIMEOUT,
+                 factory=build_http,
+                 timeout=constants.HTTP_TIMEOUT):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def pool(self, uri):
+        host = urlparse(uri).netloc
+        with self._lock:
+            if host not in self._pools:
+                self._pools[host] = ConnectionPool(
+                    self.pool_size, self.idle_timeout, self._connect)
+            return self._pools[host]
+
+    def _connect(self):
+        http = self._factory()
+        http.timeout = self.timeout
+        return http
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None, **kwargs):
+        """Implementation of httplib2's Http.request."""
+        pool = self.pool(uri)
+        http = pool.acquire()
+        try:
+            return http.request(uri, method,
+                                body=body,
+                                headers=headers,
+                                redirections=redirections,
+                                connection_type=connection_type,
+                                **kwargs)
+        finally:
+            pool.release(http)
+
+    def authorize(self, credentials):
+        """
+        Get http object authorizing requests sent through this transport.
+
+        :param credentials: google-auth credentials, already scoped
+        :return: google_auth_httplib2.AuthorizedHttp
+        """
+        return google_auth_httplib2.AuthorizedHttp(credentials, http=self)
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+
+
+default_transport = PooledHttp()
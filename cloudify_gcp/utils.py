@@ -17,9 +17,14 @@ import re
 import sys
 import time
 import json
-from functools import wraps
+import socket
+import threading
+from functools import wraps, partial
 from abc import abstractmethod
-from jsonschema import validate
+from copy import deepcopy
+from datetime import datetime
+from collections import OrderedDict
+from jsonschema.validators import validator_for
 from subprocess import check_output
 from os.path import basename, expanduser
 
@@ -31,15 +36,24 @@ from googleapiclient.errors import HttpError
 
 from cloudify import ctx
 from cloudify.context import CloudifyContext
-from cloudify.exceptions import NonRecoverableError, RecoverableError
+from cloudify.exceptions import (
+    NonRecoverableError,
+    OperationRetry,
+    RecoverableError,
+)
 from cloudify.utils import exception_to_error_cause
 
 from ._compat import text_type, ABC
 from . import constants
+from .metrics import recorder
+from .rate_limit import rate_limiter
 from .gcp import (
     GCPError,
     GoogleCloudPlatform,
+    auth_fingerprint,
     check_response,
+    then,
+    resolve,
     is_missing_resource_error,
     is_resource_used_error,
 )
@@ -52,6 +66,11 @@ except ImportError:
     NODE_INSTANCE = 'node-instance'
     RELATIONSHIP_INSTANCE = 'relationship-instance'
 
+# Runtime property with the deadline of waiting for a created resource
+CREATE_DEADLINE = '_create_deadline'
+# Runtime property marking that the create request of a resource was sent
+CREATE_SENT = '_create_sent'
+
 
 def generate_traceback_exception():
     _, exc_value, exc_traceback = sys.exc_info()
@@ -177,24 +196,89 @@ def create_resource(func):
     return wraps(func)(_decorator)
 
 
+def wait_for(condition, message, deadline_key,
+             timeout=constants.WAIT_TIMEOUT,
+             threshold=constants.WAIT_RETRY_THRESHOLD):
+    """
+    Wait until condition returns a value.
+
+    The condition is polled every second at first, then less and less
+    often. Once threshold seconds passed the operation is retried by
+    Cloudify instead of holding the worker. The deadline is kept in the
+    runtime properties, so it spans the retries of the operation.
+
+    :param condition: callable returning a true value once the wait is over
+    :param message: what is waited for, logged while waiting
+    :param deadline_key: runtime property holding the deadline of the wait
+    :param timeout: seconds until the wait fails
+    :param threshold: seconds until the operation is retried by Cloudify
+    :return: the value returned by condition
+    """
+    props = ctx.instance.runtime_properties
+    start = time.time()
+    deadline = props.get(deadline_key) or start + timeout
+    props[deadline_key] = deadline
+    interval = constants.WAIT_MIN_INTERVAL
+    while True:
+        result = condition()
+        if result:
+            props.pop(deadline_key, None)
+            return result
+        now = time.time()
+        if now >= deadline:
+            props.pop(deadline_key, None)
+            # The deadline may be the one of an earlier try of the operation
+            raise NonRecoverableError(
+                'Timed out, the deadline {0} UTC passed: {1}'.format(
+                    datetime.utcfromtimestamp(deadline).strftime(
+                        '%Y-%m-%d %H:%M:%S'), message))
+        if now - start >= threshold:
+            raise OperationRetry(message, int(interval))
+        ctx.logger.info(message)
+        time.sleep(min(interval, deadline - now))
+        interval = min(interval * constants.WAIT_FACTOR,
+                       constants.WAIT_MAX_INTERVAL)
+
+
 @create_resource
 def create(resource):
-    result = resource.create()
-    while True:
+    props = ctx.instance.runtime_properties
+    # An earlier try of the operation already sent the create request,
+    # unless it is an operation which is still running.
+    resumed = props.get(CREATE_SENT)
+    result = None
+    if not resumed:
+        # Left by a try which failed before sending the request
+        props.pop(CREATE_DEADLINE, None)
+    if not resumed or props.get('_operation'):
+        result = resource.create()
+        props[CREATE_SENT] = True
+
+    def _created():
         try:
-            created = resource.get()
-            if created:
-                break
+            return resource.get()
         except HttpError as e:
             if e.resp.status == http_client.NOT_FOUND:
-                ctx.logger.info('Waiting for the resource to exist.')
-                time.sleep(3)
-            else:
-                raise e
+                return None
+            raise e
         except Exception as error:
             ctx.logger.error('Error Message {0}'.format(error))
-            break
+            return True
 
+    try:
+        created = wait_for(
+            _created, 'Waiting for the resource to exist.', CREATE_DEADLINE)
+    except OperationRetry:
+        raise
+    except Exception:
+        # Runtime properties are stored when the operation fails, the next
+        # try starts from scratch
+        for key in CREATE_SENT, CREATE_DEADLINE:
+            props.pop(key, None)
+        raise
+    props.pop(CREATE_SENT, None)
+    if resumed and result is None and isinstance(created, dict):
+        return created
     return result
 
 
@@ -295,9 +379,7 @@ def sync_operation(func):
         response = func(resource, *args, **kwargs)
         operation = response_to_operation(
             response, resource.config, resource.logger)
-        while not operation.has_finished():
-            time.sleep(1)
-        return operation.last_response
+        return operation.wait_until_done()
 
     return wraps(func)(_decorator)
 
@@ -344,7 +426,7 @@ def async_operation(get=False):
             else:
                 # Actually run the method
                 response = func(self, *args, **kwargs)
-                props['_operation'] = response
+                props['_operation'] = operation_handle(response)
 
                 ctx.operation.retry('Operation started')
 
@@ -371,8 +453,16 @@ def retry_on_failure(msg, delay=constants.RETRY_DEFAULT_DELAY):
 
 def throw_cloudify_exceptions(func):
     def _decorator(*args, **kwargs):
+        func_ctx = kwargs.get('ctx', ctx)
+        if not recorder.enabled:
+            return _handle_exceptions(func_ctx, *args, **kwargs)
+        with recorder.operation(func_ctx.operation.name,
+                                func_ctx.logger,
+                                node_instance=get_instance_id(func_ctx)):
+            return _handle_exceptions(func_ctx, *args, **kwargs)
+
+    def _handle_exceptions(func_ctx, *args, **kwargs):
         try:
-            func_ctx = kwargs.get('ctx', ctx)
             result = func(*args, **kwargs)
             current_action = func_ctx.operation.name
 
@@ -422,7 +512,71 @@ def get_node(_ctx, target=False):
         return _ctx.node
 
 
-# flake8: noqa: C901
+def get_instance_id(_ctx):
+    if _ctx.type == RELATIONSHIP_INSTANCE:
+        return _ctx.source.instance.id
+    return _ctx.instance.id
+
+
+class GcpConfigCache(object):
+    """
+    Process-wide, size bounded cache of resolved client configs.
+
+    Resolving a config merges the plugin and node properties, parses the
+    credentials and validates them, which is repeated by every resource
+    object of an operation. Configs are cached per node, zone override and
+    fingerprint of the properties they were resolved from, so changed
+    properties resolve a new config.
+    """
+    def __init__(self, max_size=constants.GCP_CONFIG_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._configs = OrderedDict()
+
+    def get(self, key, factory):
+        """
+        Get a copy of the config for key, resolving it with factory on a
+        miss.
+
+        :param key: hashable (node id, zone, properties fingerprint) tuple
+        :param factory: callable returning the resolved config
+        :return: config dictionary owned by the caller
+        """
+        with self._lock:
+            config = self._configs.get(key)
+            if config is not None:
+                self._configs.move_to_end(key)
+        if config is None:
+            config = factory()
+            with self._lock:
+                self._configs[key] = config
+                while len(self._configs) > self.max_size:
+                    self._configs.popitem(last=False)
+        return deepcopy(config)
+
+    def clear(self):
+        with self._lock:
+            self._configs.clear()
+
+    def __len__(self):
+        return len(self._configs)
+
+
+gcp_config_cache = GcpConfigCache()
+
+
+def resolve_rate_limited_config(*args):
+    """
+    Resolve a config, and set the rate limits of its project, so they are
+    set once per distinct config.
+    """
+    gcp_config = resolve_gcp_config(*args)
+    rate_limiter.configure(gcp_config.get('project'),
+                           gcp_config.get('rate_limits'),
+                           gcp_config.get('rate_limit_backend'))
+    return gcp_config
+
+
 def get_gcp_config(node=None, requested_zone=None):
 
     node = node or get_node(ctx)
@@ -443,11 +597,36 @@ def get_gcp_config(node=None, requested_zone=None):
             'No valid client configuration key was found in node or '
             'source node properties. Valid keys: [client_config]')
 
-    gcp_config = getattr(ctx.plugin, 'properties', {})
+    plugin_properties = getattr(ctx.plugin, 'properties', None) or {}
     gcp_config_from_properties = _get_gcp_config_from_properties()
 
+    gcp_config = gcp_config_cache.get(
+        (node.id,
+         requested_zone,
+         auth_fingerprint([plugin_properties, gcp_config_from_properties])),
+        partial(resolve_rate_limited_config,
+                plugin_properties,
+                gcp_config_from_properties,
+                requested_zone))
+
+    if 'refresh_token' in gcp_config['auth'] or requested_zone:
+        return gcp_config
+    return update_zone(gcp_config)
+
+
+# flake8: noqa: C901
+def resolve_gcp_config(plugin_properties, gcp_config_from_properties,
+                       requested_zone=None):
+    """
+    Merge the plugin properties and the client config of a node, and
+    validate the result.
+
+    :return: client config, without the zone of the runtime properties
+    """
+    gcp_config = deepcopy(plugin_properties)
+
     if gcp_config_from_properties:
-        gcp_config.update(gcp_config_from_properties)
+        gcp_config.update(deepcopy(gcp_config_from_properties))
 
     # plugin properties
     if 'auth' not in gcp_config:
@@ -484,6 +663,7 @@ def get_gcp_config(node=None, requested_zone=None):
         except Exception as e:
             raise NonRecoverableError("invalid gcp_config provided: {}"
                                       .format(e))
+
     if gcp_config['auth'].get('private_key'):
         gcp_config['auth']['private_key'] = gcp_config['auth'][
             'private_key'].replace('\\n', '\n')
@@ -508,9 +688,7 @@ def get_gcp_config(node=None, requested_zone=None):
                                       .format(e))
         # If no network is specified, assume the GCP default network, 'default'
         gcp_config.setdefault('network', 'default')
-        if not requested_zone:
-            return update_zone(gcp_config)
-        else:
+        if requested_zone:
             gcp_config['zone'] = requested_zone
     return gcp_config
 
@@ -588,63 +766,363 @@ def get_agent_ssh_key_string():
     return full_key
 
 
-def response_to_operation(response, config, logger):
-    if 'zone' in response:
-        return ZoneOperation(config, logger, response)
-    elif 'region' in response:
-        return RegionOperation(config, logger, response)
+def is_operation_handle(response):
+    return response.get('kind') in OPERATION_KINDS
+
+
+def operation_handle(response):
+    """
+    Get the compact form of an operation response, which is kept in
+    runtime properties instead of the whole response.
+
+    :param response: operation response, or an operation handle
+    :return: dictionary with the kind (global, region or zone), scope
+    (region or zone name), name, status and progress of the operation
+    """
+    if is_operation_handle(response):
+        return response
+    for kind in ('zone', 'region'):
+        if kind in response:
+            scope = basename(response[kind])
+            break
     else:
-        return GlobalOperation(config, logger, response)
+        kind, scope = 'global', None
+    return {
+        'kind': kind,
+        'scope': scope,
+        'name': response['name'],
+        'status': response.get('status'),
+        'progress': response.get('progress'),
+    }
+
+
+def response_to_operation(response, config, logger):
+    """
+    :param response: operation response, or an operation handle
+    :return: Operation object of the operation's kind
+    """
+    handle = operation_handle(response)
+    return OPERATION_KINDS[handle['kind']](config, logger, handle)
 
 
 class Operation(GoogleCloudPlatform, ABC):
 
     def __init__(self, config, logger, response):
-        super(Operation, self).__init__(config, logger, response['name'])
-        for item in ('zone', 'region'):
-            if item in response:
-                setattr(self, item, response[item])
+        handle = operation_handle(response)
+        super(Operation, self).__init__(config, logger, handle['name'])
+        if handle['scope']:
+            setattr(self, handle['kind'], handle['scope'])
         self.last_response = None
         self.last_status = None
 
     def has_finished(self):
         if self.last_status != constants.GCP_OP_DONE:
-            self.get()
+            self.poll()
 
         return self.last_status == constants.GCP_OP_DONE
 
     @check_response
     def get(self):
-        self.last_response = self._get()
-        self.last_status = self.last_response['status']
+        return then(self._get(), self._update)
+
+    @check_response
+    def poll(self):
+        """
+        Refresh the operation through the operation multiplexer, sharing the
+        request with all pending operations of the same scope.
+        """
+        return self._update(operation_multiplexer.poll(self))
+
+    @check_response
+    def wait(self):
+        """
+        Long-poll the operation. The server returns when the operation is
+        done, or after up to 2 minutes.
+        """
+        return then(self._wait(), self._update)
+
+    def wait_until_done(self, sleep=time.sleep):
+        """
+        Block until the operation is done, long-polling it with wait().
+        If the wait endpoint is not available, or returns early, the
+        operation is polled with a growing delay instead. A wait which times
+        out on the socket means the operation is still running.
+
+        :return: last response of the operation
+        """
+        delay = constants.OPERATION_POLL_MIN_DELAY
+        long_poll = True
+        while self.last_status != constants.GCP_OP_DONE:
+            start = time.time()
+            if long_poll:
+                try:
+                    self.wait()
+                except socket.timeout:
+                    self.logger.debug(
+                        'Waiting for operation {0} timed out, it is still '
+                        'running'.format(self.name))
+                except HttpError as error:
+                    if error.resp.status not in (404, 501):
+                        raise
+                    long_poll = False
+                    self.get()
+            else:
+                self.get()
+            if self.last_status == constants.GCP_OP_DONE:
+                break
+            elapsed = time.time() - start
+            if elapsed < delay:
+                sleep(delay - elapsed)
+            delay = min(delay * constants.OPERATION_POLL_FACTOR,
+                        constants.OPERATION_POLL_MAX_DELAY)
         return self.last_response
 
-    @abstractmethod
-    def _get(self):
-        pass
+    def list_operations(self, names):
+        """
+        Get the operations of this object's scope with the given names.
 
+        :param names: operation names
+        :return: list of operation responses
+        """
+        return list(self.paginate(
+            self._collection(),
+            project=self.project,
+            filter=' OR '.join(
+                '(name = "{0}")'.format(name) for name in names),
+            **self._scope()))
+
+    def scope_key(self):
+        """
+        Identity of the credentials, project and scope of the operation.
+        """
+        return (self.credentials_key(),
+                self.project,
+                type(self).__name__,
+                tuple(sorted(self._scope().items())))
+
+    def _update(self, response):
+        self.last_response = response
+        self.last_status = response['status']
+        return response
 
-class GlobalOperation(Operation):
     def _get(self):
-        return self.discovery.globalOperations().get(
+        return self._collection().get(
+            project=self.project,
+            operation=self.name,
+            **self._scope()).execute()
+
+    def _wait(self):
+        return self._collection().wait(
             project=self.project,
-            operation=self.name).execute()
+            operation=self.name,
+            **self._scope()).execute()
+
+    @abstractmethod
+    def _collection(self):
+        """Operations collection of the discovery object"""
+
+    @abstractmethod
+    def _scope(self):
+        """Scope arguments of the operations collection methods"""
+
+
+class GlobalOperation(Operation):
+    def _collection(self):
+        return self.discovery.globalOperations()
+
+    def _scope(self):
+        return {}
 
 
 class RegionOperation(Operation):
-    def _get(self):
-        return self.discovery.regionOperations().get(
-            project=self.project,
-            region=basename(self.region),
-            operation=self.name).execute()
+    def _collection(self):
+        return self.discovery.regionOperations()
+
+    def _scope(self):
+        return {'region': basename(self.region)}
 
 
 class ZoneOperation(Operation):
-    def _get(self):
-        return self.discovery.zoneOperations().get(
-            project=self.project,
-            zone=basename(self.zone),
-            operation=self.name).execute()
+    def _collection(self):
+        return self.discovery.zoneOperations()
+
+    def _scope(self):
+        return {'zone': basename(self.zone)}
+
+
+OPERATION_KINDS = {
+    'global': GlobalOperation,
+    'region': RegionOperation,
+    'zone': ZoneOperation,
+}
+
+
+class OperationScope(object):
+    """
+    Pending operations of one scope and their latest responses.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refreshed = threading.Condition(self.lock)
+        # Whether a waiter is refreshing the scope, and the number of
+        # refreshes so far
+        self.refreshing = False
+        self.refreshes = 0
+        # name: (operation, time of the last poll by a waiter)
+        self.pending = {}
+        # name: (response, time it was fetched, error fetching it)
+        self.responses = {}
+
+
+class OperationMultiplexer(object):
+    """
+    Polls the pending operations of all waiters of the process together.
+
+    Operations are grouped per credentials, project and scope (global,
+    region or zone). Polling an operation refreshes all pending operations
+    of its scope with filtered list requests, so polling costs a request
+    per scope instead of per operation. Responses fetched within max_age
+    seconds are served to waiters without a request.
+    Operations not polled by any waiter for ttl seconds are dropped.
+    An error fetching an operation is only raised to its own waiters.
+    """
+    def __init__(self,
+                 max_age=constants.OPERATION_POLL_MIN_DELAY,
+                 ttl=constants.OPERATION_TRACK_TTL,
+                 chunk_size=constants.OPERATION_LIST_CHUNK_SIZE):
+        self.max_age = max_age
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._scopes = {}
+
+    def scope(self, operation):
+        key = operation.scope_key()
+        with self._lock:
+            if key not in self._scopes:
+                self._scopes[key] = OperationScope()
+            return self._scopes[key]
+
+    def track(self, operations):
+        """
+        Register pending operations, so the next poll of their scope
+        refreshes them as well.
+        """
+        now = time.time()
+        for operation in operations:
+            scope = self.scope(operation)
+            with scope.lock:
+                scope.pending[operation.name] = (operation, now)
+
+    def poll(self, operation):
+        """
+        Get the current response of an operation. Only one waiter of a
+        scope refreshes it at a time, the others wait for its responses.
+        The requests are sent without holding the lock of the scope.
+
+        :param operation: Operation object
+        :return: operation response
+        """
+        now = time.time()
+        scope = self.scope(operation)
+        with scope.lock:
+            refreshes = scope.refreshes
+            while True:
+                entry = scope.responses.get(operation.name)
+                if entry and (now - entry[1] <= self.max_age or
+                              scope.refreshes != refreshes):
+                    response, _, error = entry
+                    return self._result(response, error)
+                if not scope.refreshing:
+                    break
+                scope.refreshed.wait()
+            scope.pending[operation.name] = (operation, now)
+            scope.refreshing = True
+            operations = self._prune(scope, now)
+        fetched = {}
+        try:
+            fetched = self._fetch(operations)
+        finally:
+            with scope.lock:
+                self._store(scope, fetched, now)
+                scope.refreshing = False
+                scope.refreshes += 1
+                scope.refreshed.notify_all()
+        return self._result(*fetched[operation.name])
+
+    def _prune(self, scope, now):
+        """
+        Drop the operations no waiter polled for ttl seconds.
+
+        :return: the pending operations of the scope
+        """
+        for name, (_, polled) in list(scope.pending.items()):
+            if now - polled > self.ttl:
+                del scope.pending[name]
+        for name, (_, fetched, _) in list(scope.responses.items()):
+            if name not in scope.pending and now - fetched > self.max_age:
+                del scope.responses[name]
+        return [operation for operation, _ in scope.pending.values()]
+
+    def _fetch(self, operations):
+        """
+        :return: dictionary of (response, error) tuples by operation name
+        """
+        operations = sorted(operations, key=lambda operation: operation.name)
+        names = [operation.name for operation in operations]
+        fetched = {}
+        for start in range(0, len(names), self.chunk_size):
+            for item in operations[0].list_operations(
+                    names[start:start + self.chunk_size]):
+                fetched[item['name']] = (item, None)
+
+        # Operations missing in the list are fetched in a single batch
+        missing = [operation for operation in operations
+                   if operation.name not in fetched]
+        futures = {}
+        if missing:
+            try:
+                with missing[0].batch():
+                    for operation in missing:
+                        try:
+                            futures[operation.name] = operation._get()
+                        except Exception as error:
+                            fetched[operation.name] = (None, error)
+            except Exception:
+                # The futures of the requests which were not sent hold the
+                # error of the batch
+                pass
+        for name, future in futures.items():
+            try:
+                fetched[name] = (resolve(future), None)
+            except Exception as error:
+                fetched[name] = (None, error)
+        return fetched
+
+    @staticmethod
+    def _store(scope, fetched, now):
+        for name, (response, error) in fetched.items():
+            scope.responses[name] = (response, now, error)
+            if error is not None:
+                # Deleted operations are not fetched again
+                if isinstance(error, HttpError) and \
+                        error.resp.status == 404:
+                    scope.pending.pop(name, None)
+            elif response.get('status') == constants.GCP_OP_DONE:
+                scope.pending.pop(name, None)
+
+    @staticmethod
+    def _result(response, error):
+        if error is not None:
+            raise error
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+
+
+operation_multiplexer = OperationMultiplexer()
 
 
 def get_relationships(
@@ -735,7 +1213,11 @@ def get_resource_type(ctx):
     return ctx.instance.runtime_properties.get('kind')
 
 
+credentials_validator = validator_for(constants.GCP_CREDENTIALS_SCHEMA)(
+    constants.GCP_CREDENTIALS_SCHEMA)
+
+
 def get_gcp_config_dict(gcp_config_string):
     gcp_json = json.loads(gcp_config_string)
-    validate(instance=gcp_json, schema=constants.GCP_CREDENTIALS_SCHEMA)
+    credentials_validator.validate(gcp_json)
     return gcp_json
@@ -0,0 +1,204 @@
+# #######
+# Copyright (c) 2021 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of resource discovery against a local fake API.
+
+The fake API answers GKE cluster list requests of every zone, and of all
+locations, after a fixed latency. Requests are sent through the plugin's
+shared transport, rate limiter and retry policy, so the results compare
+the aggregated discovery with per zone discovery at several concurrency
+levels, 1 being the sequential discovery:
+
+    python -m cloudify_gcp.workflows.benchmark [--zones N] [--latency MS]
+        [--concurrency N [N ...]] [--rate RPS]
+"""
+
+from __future__ import print_function
+
+import re
+import json
+import time
+import logging
+import argparse
+import threading
+from functools import partial
+
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from googleapiclient.discovery import build_from_document
+from google.auth.credentials import AnonymousCredentials
+from cloudify.mocks import MockCloudifyContext
+from cloudify.state import current_ctx
+
+from .. import constants
+from ..gcp import BatchableHttpRequest, discovery_cache
+from ..discovery_store import discovery_store
+from ..container_engine.cluster import Cluster
+from .resources import get_resources
+from .registry import ResourceType, ResourceTypeRegistry, type_registry
+
+CLUSTERS_TYPE = 'projects.zones.clusters'
+CLUSTERS_PATH = re.compile(
+    r'/v1/projects/(?P<project>[^/]+)/zones/(?P<zone>[^/?]+)/clusters')
+ALL_CLUSTERS_PATH = re.compile(
+    r'/v1/projects/(?P<project>[^/]+)/locations/-/clusters')
+
+
+def fake_cluster(zone):
+    return {'name': 'cluster-{0}'.format(zone),
+            'zone': zone,
+            'location': zone}
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    """
+    Answers cluster list requests with one cluster per zone, of one zone
+    or of all locations.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        match = CLUSTERS_PATH.match(self.path)
+        status = 200
+        if match:
+            content = {'clusters': [fake_cluster(match.group('zone'))]}
+        elif ALL_CLUSTERS_PATH.match(self.path):
+            content = {'clusters': [fake_cluster(zone)
+                                    for zone in self.server.zones]}
+        else:
+            status = 404
+            content = {'error': {'code': 404, 'message': 'Not found'}}
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+class FakeApi(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency, zones):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeApiHandler)
+        self.latency = latency
+        self.zones = zones
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}/'.format(*self.server_address)
+
+
+class FakeApiCluster(Cluster):
+    """
+    Cluster interface sending its requests to the fake API.
+    """
+    root_url = None
+
+    def create_discovery(self, discovery, scope, api_version):
+        def _build():
+            document = discovery_store.load(discovery, api_version)[
+                'document']
+            document = dict(document, rootUrl=self.root_url)
+            return build_from_document(
+                document,
+                http=self.transport.authorize(AnonymousCredentials()),
+                requestBuilder=partial(BatchableHttpRequest,
+                                       api=(discovery, api_version)))
+
+        return discovery_cache.get(
+            (discovery, api_version, self.root_url), _build)
+
+
+def benchmark(zones, latency, concurrency_levels, rate=0):
+    """
+    Discover the clusters of the zones with the aggregated request, and per
+    zone with each concurrency level.
+
+    :param zones: number of zones
+    :param latency: seconds the fake API takes to answer a request
+    :param concurrency_levels: list of concurrency levels
+    :param rate: read requests per second allowed by the rate limiter,
+    0 for unlimited requests
+    :return: list of (mode, seconds, discovered clusters) tuples
+    """
+    zones = ['zone{0}-a'.format(index) for index in range(zones)]
+    server = FakeApi(latency, zones)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    FakeApiCluster.root_url = server.url
+    clusters = type_registry.get(CLUSTERS_TYPE)
+    registry = ResourceTypeRegistry([ResourceType(
+        CLUSTERS_TYPE, FakeApiCluster, clusters.listers,
+        index_fields=clusters.index_fields)])
+    logger = logging.getLogger('benchmark')
+    results = []
+    try:
+        for concurrency in [None] + list(concurrency_levels):
+            ctx = MockCloudifyContext(
+                node_id='gcp_account',
+                properties={'client_config': {
+                    'auth': {},
+                    'project': 'benchmark',
+                    'zone': zones[0],
+                    'rate_limits': {'default': {'read': rate}},
+                }})
+            current_ctx.set(ctx)
+            start = time.time()
+            resources = get_resources(
+                ctx.node, zones, [CLUSTERS_TYPE], logger,
+                concurrency=concurrency or 1,
+                registry=registry,
+                aggregated=concurrency is None)
+            results.append((concurrency or 'aggregated',
+                            time.time() - start,
+                            sum(len(zone_resources[CLUSTERS_TYPE])
+                                for zone_resources in resources.values())))
+    finally:
+        current_ctx.clear()
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark resource discovery against a local fake API.')
+    parser.add_argument('--zones', type=int, default=100,
+                        help='Number of zones to discover')
+    parser.add_argument('--latency', type=float, default=200,
+                        help='Milliseconds the fake API takes per request')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 4, constants.DISCOVERY_CONCURRENCY],
+                        help='Concurrency levels to compare')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Read requests per second, 0 for unlimited')
+    args = parser.parse_args(argv)
+
+    print('{0:<14}{1:>12}{2:>12}'.format('mode', 'seconds',
+                                         'clusters'))
+    for mode, seconds, clusters in benchmark(
+            args.zones, args.latency / 1000.0, args.concurrency, args.rate):
+        print('{0:<14}{1:>12.2f}{2:>12}'.format(mode, seconds, clusters))
+
+
+if __name__ == '__main__':
+    main()
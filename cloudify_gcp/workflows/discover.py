@@ -13,13 +13,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from cloudify.decorators import workflow
+from cloudify.state import current_workflow_ctx, NotInContext
 from cloudify.workflows import ctx as wtx
+from cloudify.manager import get_rest_client
 from cloudify.exceptions import NonRecoverableError
+from cloudify_rest_client.executions import Execution
 
+from .. import constants
 from .resources import (
     get_zones,
-    get_resources
+    select_resources,
+    diff_fingerprints,
+    get_resource_index,
+    get_inventory_name,
+    get_index_fingerprints,
 )
 from cloudify_common_sdk.utils import (
     create_deployments,
@@ -27,29 +39,87 @@ from cloudify_common_sdk.utils import (
 )
 
 GCP_TYPE = 'cloudify.nodes.gcp.Gcp'
+CHANGES = 'resource_changes'
+CHECKPOINT = 'deployment_checkpoint'
+PENDING = 'pending'
+CREATED = 'created'
+INSTALLING = 'installing'
 
 
 def discover_resources(node_id=None,
                        resource_types=None,
                        zones=None,
+                       incremental=False,
+                       save=True,
                        ctx=None,
                        **_):
+    """Discover the resources of the account node. The resources are
+    streamed into the inventory of the node instance, its runtime
+    properties keep their index.
+
+    :param node_id: The GCP_TYPE node template name.
+    :param resource_types: List of resource types.
+    :param zones: List of zones, defaults to the zones of the project.
+    :param incremental: Return only the resources added since the
+        previous discovery, and store the runtime properties right away.
+        The added, removed and changed resources are stored in the
+        resource_changes runtime property in any mode.
+    :param save: Store the runtime properties of an incremental discovery.
+        Callers which deploy the added resources store them together with
+        their checkpoint instead, so the next run does not skip them.
+    :param ctx:
+    :param _:
+    :return: The index entries of the discovered resources.
+    """
 
-    discovered_resources = {}
     ctx = ctx or wtx
-    node_id = node_id or get_gcp_account_node_id(ctx.nodes)
-    node = ctx.get_node(node_id)
-    for node_instance in node.instances:
-        if not isinstance(zones, list) and not zones:
-            zones = get_zones(node, ctx.deployment.id)
-        resources = get_resources(node, zones, resource_types, ctx.logger)
-        discovered_resources.update(resources)
-        node_instance._node_instance.runtime_properties['resources'] = \
-            resources
-        return discovered_resources
-    raise NonRecoverableError(
-        'No node instances of the provided node ID {n} exist. '
-        'Please install the account blueprint.'.format(n=node_id))
+    node, node_instance = get_account_node_instance(ctx, node_id)
+    if not isinstance(zones, list) and not zones:
+        zones = get_zones(node, ctx.deployment.id)
+    failures = []
+    runtime_properties = node_instance._node_instance.runtime_properties
+    previous = runtime_properties.get('resources') or {}
+    resources = get_resource_index(
+        get_inventory_name(ctx.deployment.id, node_instance.id),
+        node, zones, resource_types, ctx.logger, previous=previous,
+        failures=failures)
+    changes = diff_fingerprints(get_index_fingerprints(previous),
+                                get_index_fingerprints(resources))
+    runtime_properties['resources'] = resources
+    runtime_properties[CHANGES] = changes
+    if incremental:
+        log_changes(changes, ctx.logger)
+        if save:
+            save_runtime_properties(node_instance, ctx.logger)
+        resources = select_resources(resources, changes['added'])
+    return resources
+
+
+def log_changes(changes, logger):
+    for kind, zones in sorted(changes.items()):
+        count = sum(len(resource_ids) for resource_types in zones.values()
+                    for resource_ids in resource_types.values())
+        logger.info('Discovered {c} {k} resources: {z}'.format(
+            c=count, k=kind, z=zones))
+
+
+def save_runtime_properties(node_instance, logger):
+    """Store the runtime properties of the node instance, e.g. for the
+    next incremental discovery to compare against them.
+    """
+    try:
+        update_runtime_properties(node_instance)
+    except Exception as e:
+        logger.warn(
+            'Unable to store the runtime properties of {i}: {e}'.format(
+                i=node_instance.id, e=e))
+
+
+def update_runtime_properties(node_instance):
+    get_rest_client().node_instances.update(
+        node_instance.id,
+        runtime_properties=node_instance._node_instance.runtime_properties,
+        force=True)
 
 
 def deploy_resources(group_id,
@@ -83,16 +153,28 @@ def discover_and_deploy(node_id=None,
                         resource_types=None,
                         regions=None,
                         blueprint_id=None,
+                        incremental=False,
+                        chunk_size=constants.DEPLOY_CHUNK_SIZE,
+                        concurrency=constants.DEPLOY_CONCURRENCY,
                         ctx=None,
                         **_):
     """This workflow will check against the parent "Account" node for
     resources of the types found in resource_types in regions.
     Then we deploy child deployments of those resources.
 
+    The deployments are created and installed in chunks of a resource type,
+    each chunk in its own deployment group, by at most concurrency threads.
+    Chunks which are not installed yet are kept in the runtime properties
+    of the account node instance, so an interrupted run resumes with them.
+
     :param node_id: An AZURE_TYPE node template name.
     :param resource_types: List of crawlable types. (AWS::EKS::CLUSTER)
     :param regions: List of regions.
     :param blueprint_id: The blueprint ID to create child deployments with.
+    :param incremental: Only deploy resources added since the previous
+        discovery.
+    :param chunk_size: Maximum number of deployments of a chunk.
+    :param concurrency: Maximum number of chunks deployed at once.
     :param ctx:
     :param _:
     :return:
@@ -100,46 +182,245 @@ def discover_and_deploy(node_id=None,
 
     ctx = ctx or wtx
     blueprint_id = blueprint_id or ctx.blueprint.id
-    label_list = [{'csys-env-type': 'environment'},
-                  {'csys-obj-parent': ctx.deployment.id}]
     # Refresh the GCP_TYPE nodes list..
     resources = discover_resources(node_id=node_id,
                                    resource_types=resource_types,
                                    regions=regions,
+                                   incremental=incremental,
+                                   save=False,
                                    ctx=ctx)
-    # Loop over the resources to create new deployments from them.
-    resource_type = None
-    for zone, resource_types in resources.items():
-        deployment_ids_list = []
-        inputs_list = []
-        for resource_type, resources in resource_types.items():
-            for resource_id, _ in resources.items():
+    _, node_instance = get_account_node_instance(ctx, node_id)
+    checkpoint = DeploymentCheckpoint(node_instance, ctx.logger)
+    resumed = len(checkpoint.chunks)
+    if resumed:
+        ctx.logger.info(
+            'Resuming {n} chunks of the previous run.'.format(n=resumed))
+    # The discovered resources are stored in the same update as the chunks
+    # of the added ones.
+    checkpoint.add_chunks(ctx.deployment.id,
+                          get_deployment_jobs(ctx.deployment.id, resources),
+                          chunk_size)
+    deploy_chunks(ctx, blueprint_id, checkpoint, concurrency)
+
+
+def get_deployment_jobs(deployment_id, resources):
+    """Get the child deployments of discovered resources.
+
+    :param deployment_id: The parent deployment ID.
+    :param resources: The discovered resources.
+    :return: A list of (resource type, deployment ID, inputs) tuples.
+    """
+    jobs = []
+    for zone, resource_types in sorted(resources.items()):
+        for resource_type, type_resources in sorted(resource_types.items()):
+            for resource_id in sorted(type_resources):
                 # We are now at the resource level.
                 # Create the inputs and deployment ID for the new deployment.
-                inputs_list.append(
+                jobs.append((
+                    resource_type,
+                    generate_deployment_ids(deployment_id, resource_id),
                     {
                         'zone': zone,
                         'kubernetes_cluster_name': resource_id
-                    }
-                )
-                deployment_ids_list.append(
-                    generate_deployment_ids(
-                        ctx.deployment.id, resource_id)
-                )
-
-            if deployment_ids_list:
-                label_list.append({'csys-env-type': resource_type})
-                deploy_resources(ctx.deployment.id,
-                                 blueprint_id,
-                                 deployment_ids_list,
-                                 inputs_list,
-                                 label_list,
-                                 ctx)
-                del label_list[-1]
-            deployment_ids_list = []
-            inputs_list = []
-    if resources:
-        install_deployments(ctx.deployment.id)
+                    }))
+    return jobs
+
+
+class DeploymentCheckpoint(object):
+    """Chunks of child deployments which are not installed yet, stored in
+    the runtime properties of the account node instance.
+
+    A chunk is pending until its deployments are created, then created until
+    their install execution group is started, then installing until the
+    group finished, when it is removed. A chunk whose install failed is
+    created again, the next run installs it again.
+    """
+
+    def __init__(self, node_instance, logger):
+        self.node_instance = node_instance
+        self.logger = logger
+        self._lock = threading.Lock()
+        runtime_properties = node_instance._node_instance.runtime_properties
+        self.state = runtime_properties.setdefault(
+            CHECKPOINT, {'next_chunk': 0, 'chunks': {}})
+
+    @property
+    def chunks(self):
+        return self.state['chunks']
+
+    def add_chunks(self, deployment_id, jobs, chunk_size):
+        """Split the jobs into pending chunks of a resource type. Jobs of
+        deployments which are already in a chunk are skipped.
+
+        :param deployment_id: The parent deployment ID.
+        :param jobs: A list of (resource type, deployment ID, inputs) tuples.
+        :param chunk_size: Maximum number of deployments of a chunk.
+        """
+        known = set(child_id for chunk in self.chunks.values()
+                    for child_id in chunk['deployment_ids'])
+        jobs_by_type = {}
+        for resource_type, child_id, inputs in jobs:
+            if child_id not in known:
+                jobs_by_type.setdefault(resource_type, []).append(
+                    (child_id, inputs))
+        for resource_type, type_jobs in sorted(jobs_by_type.items()):
+            for start in range(0, len(type_jobs), max(1, chunk_size)):
+                chunk_jobs = type_jobs[start:start + max(1, chunk_size)]
+                group_id = '{0}-{1}'.format(
+                    deployment_id, self.state['next_chunk'])
+                self.state['next_chunk'] += 1
+                self.chunks[group_id] = {
+                    'state': PENDING,
+                    'resource_type': resource_type,
+                    'deployment_ids': [child_id for child_id, _ in chunk_jobs],
+                    'inputs': [inputs for _, inputs in chunk_jobs],
+                }
+        self.save()
+
+    def update(self, group_id, state=None, **fields):
+        """Set the state and fields of a chunk, or remove it if state is
+        None.
+        """
+        with self._lock:
+            if state:
+                self.chunks[group_id].update(fields, state=state)
+            else:
+                del self.chunks[group_id]
+            self.save()
+
+    def save(self):
+        """Store the checkpoint. Failures are retried, and fail the workflow
+        in the end: chunks which are not checkpointed would be deployed
+        again, or not at all, by the next run.
+        """
+        for attempt in range(1, constants.CHECKPOINT_SAVE_ATTEMPTS + 1):
+            try:
+                return update_runtime_properties(self.node_instance)
+            except Exception as e:
+                if attempt == constants.CHECKPOINT_SAVE_ATTEMPTS:
+                    raise NonRecoverableError(
+                        'Unable to store the deployment checkpoint of '
+                        '{i}: {e}'.format(i=self.node_instance.id, e=e))
+                self.logger.warn(
+                    'Unable to store the deployment checkpoint of {i}, '
+                    'retrying: {e}'.format(i=self.node_instance.id, e=e))
+                time.sleep(constants.CHECKPOINT_SAVE_INTERVAL)
+
+
+def deploy_chunks(ctx, blueprint_id, checkpoint, concurrency):
+    """Create and install the chunks of the checkpoint concurrently.
+    A failed chunk stays in the checkpoint, and the first error is raised
+    once the other chunks are deployed.
+    """
+    chunks = sorted(checkpoint.chunks.items())
+    if not chunks:
+        return
+    total = sum(len(chunk['deployment_ids']) for _, chunk in chunks)
+    workflow_context = get_workflow_context(ctx)
+    deployed = 0
+    errors = []
+    with ThreadPoolExecutor(
+            max_workers=max(1, min(concurrency, len(chunks)))) as executor:
+        futures = {
+            executor.submit(deploy_chunk, workflow_context, blueprint_id,
+                            group_id, chunk, checkpoint): (group_id, chunk)
+            for group_id, chunk in chunks}
+        for future in as_completed(futures):
+            group_id, chunk = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                ctx.logger.error('Unable to deploy chunk {g}: {e}'.format(
+                    g=group_id, e=e))
+                errors.append(e)
+                continue
+            deployed += len(chunk['deployment_ids'])
+            ctx.logger.info(
+                'Deployed {d}/{t} deployments, {c} chunks left.'.format(
+                    d=deployed, t=total, c=len(checkpoint.chunks)))
+    if errors:
+        raise errors[0]
+
+
+def deploy_chunk(ctx, blueprint_id, group_id, chunk, checkpoint):
+    """Create the deployments of a pending chunk in the group_id deployment
+    group, install the group and wait for the install executions.
+    """
+    # REST clients are configured from the context of the current thread
+    current_workflow_ctx.set(ctx)
+    try:
+        if chunk['state'] == PENDING:
+            labels = [{'csys-env-type': 'environment'},
+                      {'csys-obj-parent': ctx.deployment.id},
+                      {'csys-env-type': chunk['resource_type']}]
+            deploy_resources(group_id,
+                             blueprint_id,
+                             chunk['deployment_ids'],
+                             chunk['inputs'],
+                             labels,
+                             ctx)
+            checkpoint.update(group_id, CREATED)
+        if chunk['state'] != INSTALLING:
+            execution_group = install_deployments(group_id)
+            checkpoint.update(group_id, INSTALLING,
+                              execution_group_id=execution_group.id)
+        try:
+            wait_for_execution_group(chunk['execution_group_id'],
+                                     ctx.logger)
+        except NonRecoverableError:
+            # The next run installs the deployments again
+            checkpoint.update(group_id, CREATED)
+            raise
+        checkpoint.update(group_id)
+    finally:
+        current_workflow_ctx.clear()
+
+
+def wait_for_execution_group(execution_group_id, logger,
+                             timeout=constants.DEPLOY_INSTALL_TIMEOUT):
+    """Wait until all executions of an execution group ended.
+
+    :raise NonRecoverableError: if an execution did not succeed, or the
+        executions did not end within timeout seconds.
+    """
+    deadline = time.time() + timeout
+    while True:
+        status = get_rest_client().execution_groups.get(
+            execution_group_id, _include=['id', 'status']).status
+        if status == Execution.TERMINATED:
+            return
+        if status in Execution.END_STATES:
+            raise NonRecoverableError(
+                'Execution group {g} {s}.'.format(
+                    g=execution_group_id, s=status))
+        if time.time() >= deadline:
+            raise NonRecoverableError(
+                'Timed out after {t} seconds waiting for execution group '
+                '{g}.'.format(t=timeout, g=execution_group_id))
+        logger.debug('Execution group {g} is {s}.'.format(
+            g=execution_group_id, s=status))
+        time.sleep(constants.DEPLOY_POLL_INTERVAL)
+
+
+def get_workflow_context(ctx):
+    try:
+        return current_workflow_ctx.get_ctx()
+    except NotInContext:
+        return ctx
+
+
+def get_account_node_instance(ctx, node_id=None):
+    """Get the node and the node instance of the account node.
+
+    :return: A (node, node instance) tuple.
+    """
+    node_id = node_id or get_gcp_account_node_id(ctx.nodes)
+    node = ctx.get_node(node_id)
+    for node_instance in node.instances:
+        return node, node_instance
+    raise NonRecoverableError(
+        'No node instances of the provided node ID {n} exist. '
+        'Please install the account blueprint.'.format(n=node_id))
 
 
 def get_gcp_account_node_id(nodes):
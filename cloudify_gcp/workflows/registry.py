@@ -0,0 +1,314 @@
+# #######
+# Copyright (c) 2021 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Registry of the resource types which can be discovered.
+
+Every resource type declares the listers which can list it, each with a
+listing strategy:
+
+    aggregated  aggregatedList of the compute API, all zones or regions
+    wildcard    the '-' location of the API, all locations
+    global      resources of the project which have no location
+    regional    a request per region of the discovered zones
+    zonal       a request per discovered zone
+
+Discovery uses the lister of a type which needs the fewest requests for
+the discovered zones. Listers are generators of (location, resource)
+tuples, pages are requested while the resources are consumed.
+"""
+
+from abc import abstractmethod
+from os.path import basename
+
+from cloudify.exceptions import NonRecoverableError
+
+from .. import utils
+from .._compat import ABC
+from ..gcp import GoogleCloudPlatform
+from ..compute.disk import Disk
+from ..compute.instance import Instance
+from ..compute.network import Network
+from ..compute.subnetwork import SubNetwork
+from ..container_engine.cluster import Cluster
+from ..dns.dns import DNSZone
+from ..pubsub.topic import Topic
+
+AGGREGATED = 'aggregated'
+WILDCARD = 'wildcard'
+GLOBAL = 'global'
+REGIONAL = 'regional'
+ZONAL = 'zonal'
+# Location wildcard of the requests of all locations
+ALL_LOCATIONS = '-'
+DEFAULT_INDEX_FIELDS = ('name', 'selfLink')
+
+
+class Lister(ABC):
+    """
+    Lists the resources of a type with one strategy.
+
+    :param collection: callable getting the API collection from the
+    interface of the type, e.g. lambda iface: iface.discovery.disks()
+    :param items_key: key of the resources in a page
+    :param project_param: name of the project parameter of the list method
+    :param project_format: format of its value, e.g. projects/{0}
+    """
+    strategy = None
+    # Whether one request lists all locations of the project
+    all_locations = False
+
+    def __init__(self, collection, items_key='items',
+                 project_param='project', project_format='{0}'):
+        self.collection = collection
+        self.items_key = items_key
+        self.project_param = project_param
+        self.project_format = project_format
+
+    def scopes(self, zones, regions):
+        """
+        :param zones: discovered zones
+        :param regions: dictionary of the region of each zone, from the zone
+        catalog
+        :return: list of the scopes listed for the zones, a request each
+        """
+        return [None]
+
+    @abstractmethod
+    def list(self, iface, scope, missing):
+        """
+        :param iface: interface of the resource type
+        :param scope: one of the scopes
+        :param missing: list the zones which could not be reached are
+        appended to
+        :return: generator of (location, resource) tuples
+        """
+
+    def params(self, iface, **kwargs):
+        kwargs[self.project_param] = self.project_format.format(iface.project)
+        return kwargs
+
+
+class ZonalLister(Lister):
+    strategy = ZONAL
+
+    def __init__(self, collection, items_key='items', zone_param='zone',
+                 **kwargs):
+        super(ZonalLister, self).__init__(collection, items_key, **kwargs)
+        self.zone_param = zone_param
+
+    def scopes(self, zones, regions):
+        return list(zones)
+
+    def list(self, iface, scope, missing):
+        for resource in iface.paginate(
+                self.collection(iface), self.items_key,
+                **self.params(iface, **{self.zone_param: scope})):
+            yield scope, resource
+
+
+class RegionalLister(Lister):
+    strategy = REGIONAL
+
+    def scopes(self, zones, regions):
+        return sorted(set(regions[zone] for zone in zones if zone in regions))
+
+    def list(self, iface, scope, missing):
+        for resource in iface.paginate(
+                self.collection(iface), self.items_key,
+                **self.params(iface, region=scope)):
+            yield scope, resource
+
+
+class GlobalLister(Lister):
+    strategy = GLOBAL
+
+    def list(self, iface, scope, missing):
+        for resource in iface.paginate(
+                self.collection(iface), self.items_key,
+                **self.params(iface)):
+            yield GLOBAL, resource
+
+
+class AggregatedLister(Lister):
+    """
+    Lists with aggregatedList, whose pages group the resources by scope,
+    e.g. {'zones/us-east1-b': {'instances': [...]}}.
+    """
+    strategy = AGGREGATED
+    all_locations = True
+
+    def list(self, iface, scope, missing):
+        for response in iface.pages(self.collection(iface), 'aggregatedList',
+                                    **self.params(iface)):
+            for location, scoped in response.get('items', {}).items():
+                for resource in scoped.get(self.items_key, []):
+                    yield basename(location), resource
+            missing.extend(basename(location) for location in
+                           response.get('unreachables', []))
+
+
+class WildcardLister(Lister):
+    """
+    Lists the '-' location, the location of every resource is in its
+    location_key.
+    """
+    strategy = WILDCARD
+    all_locations = True
+
+    def __init__(self, collection, items_key='items',
+                 location_key='location', missing_key='missingZones',
+                 **kwargs):
+        kwargs.setdefault('project_param', 'parent')
+        kwargs.setdefault('project_format',
+                          'projects/{{0}}/locations/{0}'.format(ALL_LOCATIONS))
+        super(WildcardLister, self).__init__(collection, items_key, **kwargs)
+        self.location_key = location_key
+        self.missing_key = missing_key
+
+    def list(self, iface, scope, missing):
+        for response in iface.pages(self.collection(iface),
+                                    **self.params(iface)):
+            for resource in response.get(self.items_key, []):
+                yield resource.get(self.location_key), resource
+            missing.extend(response.get(self.missing_key, []))
+
+
+class ResourceType(object):
+    """
+    A resource type which can be discovered.
+
+    :param name: resource type, e.g. projects.zones.clusters
+    :param class_decl: class of the resource, its interface lists the
+    resources
+    :param listers: listers of the resources, preferred first
+    :param resource_key: key of the resource ID in a resource
+    :param index_fields: fields of the resources kept in the index of the
+    runtime properties
+    :param interface_kwargs: additional arguments of the class
+    """
+    def __init__(self, name, class_decl, listers, resource_key='name',
+                 index_fields=DEFAULT_INDEX_FIELDS, interface_kwargs=None):
+        self.name = name
+        self.class_decl = class_decl
+        self.listers = listers
+        self.resource_key = resource_key
+        self.index_fields = index_fields
+        self.interface_kwargs = interface_kwargs or {}
+
+    def interface(self, node, logger):
+        gcp_config = utils.get_gcp_config(node, requested_zone=ALL_LOCATIONS)
+        return self.class_decl(gcp_config, logger, 'foo',
+                               **self.interface_kwargs)
+
+    def lister(self, zones, regions, all_locations=True):
+        """
+        :param zones: discovered zones
+        :param regions: dictionary of the region of each zone
+        :param all_locations: whether listers of all locations may be used
+        :return: the lister with the fewest requests for the zones
+        """
+        listers = [lister for lister in self.listers
+                   if all_locations or not lister.all_locations]
+        if not listers:
+            return None
+        return min(listers,
+                   key=lambda lister: len(lister.scopes(zones, regions)))
+
+    def fallback(self, zones, regions):
+        """
+        :return: the lister of the zones an all locations lister could not
+        list, or None
+        """
+        return self.lister(zones, regions, all_locations=False)
+
+
+class ResourceTypeRegistry(object):
+    def __init__(self, resource_types=()):
+        self._types = {}
+        for resource_type in resource_types:
+            self.register(resource_type)
+
+    def register(self, resource_type):
+        self._types[resource_type.name] = resource_type
+        return resource_type
+
+    def get(self, name):
+        try:
+            return self._types[name]
+        except KeyError:
+            # Note that a resource type needs to be registered here for
+            # discovering it.
+            raise NonRecoverableError(
+                'Unsupported resource type: {t}.'.format(t=name))
+
+    def names(self):
+        return sorted(self._types)
+
+    def __contains__(self, name):
+        return name in self._types
+
+
+type_registry = ResourceTypeRegistry([
+    ResourceType(
+        'projects.zones.clusters', Cluster,
+        [WildcardLister(
+            lambda iface: iface.discovery.projects().locations().clusters(),
+            'clusters'),
+         ZonalLister(
+             lambda iface: iface.discovery_container.clusters(),
+             'clusters', project_param='projectId')],
+        index_fields=('name', 'location', 'status', 'currentMasterVersion',
+                      'selfLink')),
+    ResourceType(
+        'projects.zones.instances', Instance,
+        [AggregatedLister(lambda iface: iface.discovery.instances(),
+                          'instances'),
+         ZonalLister(lambda iface: iface.discovery.instances())],
+        index_fields=('name', 'zone', 'status', 'machineType', 'selfLink')),
+    ResourceType(
+        'projects.zones.disks', Disk,
+        [AggregatedLister(lambda iface: iface.discovery.disks(), 'disks'),
+         ZonalLister(lambda iface: iface.discovery.disks())],
+        index_fields=('name', 'zone', 'status', 'sizeGb', 'selfLink')),
+    ResourceType(
+        'projects.global.networks', Network,
+        [GlobalLister(lambda iface: iface.discovery.networks())],
+        index_fields=('name', 'autoCreateSubnetworks', 'selfLink')),
+    ResourceType(
+        'projects.regions.subnetworks', SubNetwork,
+        [AggregatedLister(lambda iface: iface.discovery.subnetworks(),
+                          'subnetworks'),
+         RegionalLister(lambda iface: iface.discovery.subnetworks())],
+        index_fields=('name', 'region', 'network', 'ipCidrRange',
+                      'selfLink'),
+        interface_kwargs={'region': None}),
+    # FirewallRule needs the context of an operation, the resources are
+    # listed with the compute API of the base class.
+    ResourceType(
+        'projects.global.firewalls', GoogleCloudPlatform,
+        [GlobalLister(lambda iface: iface.discovery.firewalls())],
+        index_fields=('name', 'network', 'direction', 'selfLink')),
+    ResourceType(
+        'projects.topics', Topic,
+        [GlobalLister(lambda iface: iface.discovery_pubsub.topics(),
+                      'topics', project_format='projects/{0}')],
+        index_fields=('name',)),
+    ResourceType(
+        'projects.managedZones', DNSZone,
+        [GlobalLister(lambda iface: iface.discovery.managedZones(),
+                      'managedZones')],
+        index_fields=('name', 'dnsName', 'visibility')),
+])
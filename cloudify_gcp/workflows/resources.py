@@ -1,17 +1,21 @@
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
 from cloudify import ctx as _ctx
 from cloudify.context import NodeContext
 from cloudify.decorators import operation
-from cloudify.exceptions import NonRecoverableError
 from cloudify_common_sdk.utils import desecretize_client_config
 
 from .. import utils
-from ..container_engine.cluster import Cluster
+from .. import constants
+from ..gcp import GCPError, GoogleCloudPlatform
+from ..zones import zone_catalog
+from ..inventory import inventory_store
+from .registry import ALL_LOCATIONS, GLOBAL, REGIONAL, type_registry
 
-TYPES_MATRIX = {
-    'projects.zones.clusters': (
-        Cluster, 'gke', 'name'
-    )
-}
+FINGERPRINT = 'fingerprint'
+OFFSET = 'offset'
 
 
 @operation
@@ -33,167 +37,371 @@ def initialize(resource_config=None, zones=None, ctx=None, **_):
     resource_types = resource_config.get('resource_types', [])
     ctx.logger.info('Checking for these resource types: {t}.'.format(
         t=resource_types))
-    zones = zones or get_zones()
-    ctx.instance.runtime_properties['resources'] = get_resources(
+    zones = zones or get_zones(ctx.node)
+    ctx.instance.runtime_properties['resources'] = get_resource_index(
+        get_inventory_name(ctx.deployment.id, ctx.instance.id),
         ctx.node, zones, resource_types, ctx.logger)
 
 
 @operation
 def deinitialize(ctx, **_):
-    """Delete the resources runtime property. """
+    """Delete the resources runtime property and their inventory. """
     ctx = ctx or _ctx
     del ctx.instance.runtime_properties['resources']
+    inventory_store.delete(
+        get_inventory_name(ctx.deployment.id, ctx.instance.id))
 
 
-def get_resources(node, zones, resource_types, logger):
-    """Get a dict of resources in the following structure:
+def get_resources(node, zones, resource_types, logger, **kwargs):
+    """Get a dict of resources of the zones.
 
     :param node: ctx.node
     :param zones: list of GCP zones, i.e. asia-east1-a
     :param resource_types: List of resource types,
         i.e. projects.zones.clusters.
     :param logger: ctx logger
+    :param kwargs: options of iter_resources
     :return: a dictionary of resources in the structure:
         {
-            'projects.zones.clusters': {
-                'asia-east1-a': {
+            'asia-east1-a': {
+                'projects.zones.clusters': {
                     'resource_id': resource
                 }
             }
         }
     """
+    # The structure goes resources.location.resource_type.resource, so we
+    # start with location, then resource type.
+    resources = {}
+    for zone, resource_type, resource_id, resource in iter_resources(
+            node, zones, resource_types, logger, **kwargs):
+        resources.setdefault(zone, {}).setdefault(
+            resource_type, {})[resource_id] = resource
+    return resources
+
+
+def iter_resources(node, zones, resource_types, logger,
+                   concurrency=constants.DISCOVERY_CONCURRENCY,
+                   registry=None,
+                   aggregated=True,
+                   failures=None):
+    """Iterate over the resources of the zones, as they are listed.
+
+    Every type is listed with its lister which needs the fewest requests
+    for the zones, e.g. with one request of all locations, or a request per
+    zone. The requests are sent concurrently, by at most concurrency
+    threads. The zones a request of all locations could not reach, or all
+    zones if it failed, are listed again with the next lister of the type.
+    A request which fails is logged and skipped, the error is raised only
+    if no request succeeded.
+
+    :param node: ctx.node
+    :param zones: list of GCP zones, i.e. asia-east1-a
+    :param resource_types: List of resource types,
+        i.e. projects.zones.clusters.
+    :param logger: ctx logger
+    :param concurrency: maximum number of concurrent list requests
+    :param registry: ResourceTypeRegistry of the supported resource types,
+        defaults to the plugin's registry
+    :param aggregated: use listers of all locations, False to list every
+        zone, region or the project
+    :param failures: optional list the (location, resource type) tuples
+        which could not be listed are appended to
+    :return: generator of (location, resource type, resource_id, resource)
+        tuples, the location is a zone, a region or global
+    """
 
+    registry = registry or type_registry
     logger.info('Checking for these resource types: {t}.'.format(
         t=resource_types))
-    resources = {}
-    # The structure goes resources.location.resource_type.resource, so we start
-    # with location.
-    # then resource type.
-    for zone in zones:
-        logger.info('Checking in this zone: {z}'.format(z=zone))
-        for resource_type in resource_types:
-            logger.info(
-                'Checking for this resource type: {t}.'.format(
-                    t=resource_type))
-            # Get the class callable, the service name, and resource_id key.
-            class_decl, service_name, resource_key = TYPES_MATRIX.get(
-                resource_type)
-            # Note that the service_name needs to be updated in the Cloudify
-            # GCP plugin resource module class for supporting new types.
-            if not class_decl:
-                # It means that we don't support whatever they provided.
-                raise NonRecoverableError(
-                    'Unsupported resource type: {t}.'.format(t=resource_type))
-            iface = get_resource_interface(node, zone, class_decl, logger)
-            # Get the resource response from the API.
-            # Clean it up for context serialization.
-            # Add this stuff to the resources dict.
-            for resource in iface.list():
-                resource_id = resource[resource_key]
-                resource_entry = {resource_id: resource}
-                if zone not in resources:
-                    resources[zone] = {
-                        resource_type: resource_entry
-                    }
-                elif resource_type not in resources[resource['location']]:
-                    resources[zone][resource_type] = resource_entry
-                else:
-                    resources[zone][resource_type][resource_id] = resource
-    return resources
+    types = [registry.get(resource_type) for resource_type in resource_types]
+    resolve_client_config(node)
 
+    regions = get_zone_regions(node, zones, types, logger)
+    locations = set(zones) | set(regions.values())
+    locations.add(GLOBAL)
+    tasks = get_list_tasks(node, types, zones, regions, logger, aggregated)
+    if not tasks:
+        return
+    errors = []
+    listed = 0
+    with ThreadPoolExecutor(
+            max_workers=max(1, min(concurrency, len(tasks)))) as executor:
+        while tasks:
+            futures = [executor.submit(list_resources, logger, *task)
+                       for task in tasks]
+            retries = []
+            for task, future in zip(tasks, futures):
+                resource_type, lister, _, scope, missing = task
+                try:
+                    items = future.result()
+                except Exception as e:
+                    logger.error('Unable to list {t} in {s}: {e}'.format(
+                        t=resource_type.name, s=scope or 'all locations',
+                        e=e))
+                    errors.append(e)
+                    missing = zones if lister.all_locations else []
+                    if not retry_tasks(task, missing, regions, retries) and \
+                            failures is not None:
+                        failures.extend(
+                            (location, resource_type.name) for location in
+                            failed_locations(lister, scope, zones))
+                    continue
+                listed += 1
+                for location, resource in items:
+                    if location in locations:
+                        yield (location, resource_type.name,
+                               resource[resource_type.resource_key], resource)
+                retry_tasks(task, [zone for zone in zones
+                                   if zone in missing or
+                                   regions.get(zone) in missing],
+                            regions, retries)
+            tasks = retries
+    if errors and not listed:
+        raise errors[0]
 
-def get_resource_interface(node, zone, class_decl, logger):
+
+def get_resource_index(name, node, zones, resource_types, logger,
+                       store=None, previous=None, **kwargs):
+    """Stream the resources of the zones into an inventory of the store,
+    and get their compact index.
+
+    :param name: inventory name, e.g. the node instance ID
+    :param store: InventoryStore, defaults to the plugin's inventory store
+    :param previous: index of the previous discovery, the entries of the
+        (zone, resource type) tuples which could not be listed are kept,
+        and their resources copied from the previous inventory
+    :param kwargs: options of iter_resources
+    :return: a dictionary of index entries in the structure of
+        get_resources, each entry has the index fields of its resource type,
+        the fingerprint of the resource and its offset in the inventory
+    """
+    store = store or inventory_store
+    registry = kwargs.get('registry') or type_registry
+    failures = kwargs.setdefault('failures', [])
+    index = {}
+    with store.writer(name, logger) as writer:
+        for zone, resource_type, resource_id, resource in iter_resources(
+                node, zones, resource_types, logger, **kwargs):
+            entry = dict(
+                (field, resource[field]) for field in
+                registry.get(resource_type).index_fields
+                if field in resource)
+            entry[FINGERPRINT] = fingerprint(resource)
+            entry[OFFSET] = writer.add(
+                zone, resource_type, resource_id, resource)
+            index.setdefault(zone, {}).setdefault(
+                resource_type, {})[resource_id] = entry
+        if previous:
+            def copy(zone, resource_type, resource_id, offset):
+                # The previous inventory is replaced when the block exits
+                resource = store.get(name, offset)
+                if resource is None:
+                    return None
+                return writer.add(zone, resource_type, resource_id, resource)
+
+            keep_failed_entries(previous, index, failures, copy)
+    return index
+
+
+def get_inventory_name(deployment_id, node_instance_id):
+    return '{0}.{1}'.format(deployment_id, node_instance_id)
+
+
+def get_index_fingerprints(index):
+    """Get the fingerprints of the resources of an index.
+
+    :param index: dictionary of index entries, as returned by
+        get_resource_index
+    :return: dictionary of the same structure, with fingerprints instead of
+        index entries
+    """
+    return {
+        zone: {
+            resource_type: {
+                resource_id: entry.get(FINGERPRINT)
+                for resource_id, entry in entries.items()
+            }
+            for resource_type, entries in zone_entries.items()
+        }
+        for zone, zone_entries in index.items()
+    }
+
+
+def keep_failed_entries(previous, index, failures, copy=None):
+    """Copy the index entries of the (zone, resource type) tuples which
+    could not be listed from the previous index.
+
+    :param copy: callable copying a resource from the previous inventory
+        into the new one, with the zone, resource type, resource ID and
+        previous offset of the resource, returning its new offset. Without
+        it the entries have no offset.
+    """
+    for zone, resource_type in failures:
+        for resource_id, entry in previous.get(zone, {}).get(
+                resource_type, {}).items():
+            offset = copy(zone, resource_type, resource_id,
+                          entry.get(OFFSET)) if copy else None
+            index.setdefault(zone, {}).setdefault(
+                resource_type, {})[resource_id] = dict(entry, offset=offset)
+
+
+def fingerprint(resource):
+    return hashlib.sha256(json.dumps(
+        resource, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def diff_fingerprints(previous, current, failures=()):
+    """Compare the fingerprints of two discoveries.
+
+    :param previous: fingerprints of the previous discovery
+    :param current: fingerprints of the current discovery, the fingerprints
+        of the failures are copied from previous
+    :param failures: (zone, resource type) tuples which could not be listed,
+        their resources are not reported as removed
+    :return: dictionary of added, removed and changed resources, each in
+        the structure {zone: {resource_type: [resource_id]}}
+    """
+    for zone, resource_type in failures:
+        if resource_type in previous.get(zone, {}):
+            current.setdefault(zone, {})[resource_type] = \
+                previous[zone][resource_type]
+    changes = {'added': {}, 'removed': {}, 'changed': {}}
+    for zone in set(previous) | set(current):
+        previous_zone = previous.get(zone, {})
+        current_zone = current.get(zone, {})
+        for resource_type in set(previous_zone) | set(current_zone):
+            old = previous_zone.get(resource_type, {})
+            new = current_zone.get(resource_type, {})
+            for kind, ids in (
+                    ('added', set(new) - set(old)),
+                    ('removed', set(old) - set(new)),
+                    ('changed', set(resource_id for resource_id in new
+                                    if resource_id in old and
+                                    old[resource_id] != new[resource_id]))):
+                if ids:
+                    changes[kind].setdefault(zone, {})[resource_type] = \
+                        sorted(ids)
+    return changes
+
+
+def select_resources(resources, selection):
+    """Get the resources of a selection.
+
+    :param resources: dictionary of resources, as returned by get_resources
+    :param selection: dictionary of {zone: {resource_type: [resource_id]}}
+    :return: dictionary of the selected resources
+    """
+    selected = {}
+    for zone, resource_types in selection.items():
+        for resource_type, resource_ids in resource_types.items():
+            for resource_id in resource_ids:
+                selected.setdefault(zone, {}).setdefault(
+                    resource_type, {})[resource_id] = \
+                    resources[zone][resource_type][resource_id]
+    return selected
+
+
+def resolve_client_config(node):
     if not isinstance(node, NodeContext):
         node.properties['client_config'] = desecretize_client_config(
             node.properties['client_config'])
+
+
+def get_zone_regions(node, zones, types, logger):
+    """Get the regions of the zones from the zone catalog, if a type is
+    listed per region.
+
+    :param types: list of ResourceType
+    :return: dictionary of the region of each zone, zones the catalog of
+    the project does not know are left out
+    """
+    if not zones or not any(lister.strategy == REGIONAL
+                            for resource_type in types
+                            for lister in resource_type.listers):
+        return {}
+    iface = get_resource_interface(
+        node, ALL_LOCATIONS, GoogleCloudPlatform, logger)
+    regions = {}
+    for zone in zones:
+        try:
+            regions[zone] = iface.get_region(zone)
+        except GCPError as e:
+            logger.warn('{0}, its region is not listed.'.format(e))
+    return regions
+
+
+def get_list_tasks(node, types, zones, regions, logger, aggregated=True):
+    """Get the list requests of a discovery.
+
+    :param types: list of ResourceType
+    :param regions: dictionary of the region of each zone
+    :param aggregated: use listers of all locations
+    :return: list of (resource type, lister, interface, scope, missing)
+    tuples, missing collects the locations the request could not reach
+    """
+    # The interfaces are created here, as the client config is resolved
+    # with the operation context of this thread. The requests of a type
+    # share its interface, and its discovery object is built before the
+    # threads need it, so only the list requests are sent from the pool.
+    tasks = []
+    for resource_type in types:
+        lister = resource_type.lister(zones, regions, aggregated)
+        if lister is None:
+            continue
+        iface = resource_type.interface(node, logger)
+        iface.discovery
+        tasks.extend((resource_type, lister, iface, scope, [])
+                     for scope in lister.scopes(zones, regions))
+    return tasks
+
+
+def retry_tasks(task, zones, regions, retries):
+    """Add the tasks listing the zones a request of all locations could not
+    list to retries.
+
+    :return: whether the zones are listed again
+    """
+    resource_type, lister, iface, _, _ = task
+    if not zones or not lister.all_locations:
+        return False
+    fallback = resource_type.fallback(zones, regions)
+    if fallback is None:
+        return False
+    retries.extend((resource_type, fallback, iface, scope, [])
+                   for scope in fallback.scopes(zones, regions))
+    return True
+
+
+def failed_locations(lister, scope, zones):
+    if lister.all_locations:
+        return zones
+    return [scope or GLOBAL]
+
+
+def list_resources(logger, resource_type, lister, iface, scope, missing):
+    """Get the resources of a list request from the API.
+
+    :return: list of (location, resource) tuples
+    """
+    logger.debug('Checking {t} in {s} with the {l} lister.'.format(
+        t=resource_type.name, s=scope or 'all locations', l=lister.strategy))
+    return list(lister.list(iface, scope, missing))
+
+
+def get_resource_interface(node, zone, class_decl, logger):
     gcp_config = utils.get_gcp_config(node, requested_zone=zone)
     return class_decl(gcp_config, logger, 'foo')
 
 
-def get_zones(*_, **__):
-    return ['asia-east1-a',
-            'asia-east1-b',
-            'asia-east1-c',
-            'asia-east2-a',
-            'asia-east2-b',
-            'asia-east2-c',
-            'asia-northeast1-a',
-            'asia-northeast1-b',
-            'asia-northeast1-c',
-            'asia-northeast2-a',
-            'asia-northeast2-b',
-            'asia-northeast2-c',
-            'asia-northeast3-a',
-            'asia-northeast3-b',
-            'asia-northeast3-c',
-            'asia-south1-a',
-            'asia-south1-b',
-            'asia-south1-c',
-            'asia-south2-a',
-            'asia-south2-b',
-            'asia-south2-c',
-            'asia-southeast1-a',
-            'asia-southeast1-b',
-            'asia-southeast1-c',
-            'asia-southeast2-a',
-            'asia-southeast2-b',
-            'asia-southeast2-c',
-            'australia-southeast1-a',
-            'australia-southeast1-b',
-            'australia-southeast1-c',
-            'australia-southeast2-a',
-            'australia-southeast2-b',
-            'australia-southeast2-c',
-            'europe-central2-a',
-            'europe-central2-b',
-            'europe-central2-c',
-            'europe-north1-a',
-            'europe-north1-b',
-            'europe-north1-c',
-            'europe-west1-b',
-            'europe-west1-c',
-            'europe-west1-d',
-            'europe-west2-a',
-            'europe-west2-b',
-            'europe-west2-c',
-            'europe-west3-a',
-            'europe-west3-b',
-            'europe-west3-c',
-            'europe-west4-a',
-            'europe-west4-b',
-            'europe-west4-c',
-            'europe-west6-a',
-            'europe-west6-b',
-            'europe-west6-c',
-            'northamerica-northeast1-a',
-            'northamerica-northeast1-b',
-            'northamerica-northeast1-c',
-            'northamerica-northeast2-a',
-            'northamerica-northeast2-b',
-            'northamerica-northeast2-c',
-            'southamerica-east1-a',
-            'southamerica-east1-b',
-            'southamerica-east1-c',
-            'us-central1-a',
-            'us-central1-b',
-            'us-central1-c',
-            'us-central1-f',
-            'us-east1-b',
-            'us-east1-c',
-            'us-east1-d',
-            'us-east4-a',
-            'us-east4-b',
-            'us-east4-c',
-            'us-west1-a',
-            'us-west1-b',
-            'us-west1-c',
-            'us-west2-a',
-            'us-west2-b',
-            'us-west2-c',
-            'us-west3-a',
-            'us-west3-b',
-            'us-west3-c',
-            'us-west4-a',
-            'us-west4-b',
-            'us-west4-c'
-            ]
+def get_zones(node=None, *_, **__):
+    """Get the zones of the project of a node which are up.
+
+    :param node: ctx.node, defaults to the node of the current operation
+    :return: sorted list of zone names, from the zone catalog
+    """
+    node = node or _ctx.node
+    resolve_client_config(node)
+    iface = get_resource_interface(
+        node, ALL_LOCATIONS, GoogleCloudPlatform, _ctx.logger)
+    return zone_catalog.available_zones(iface.project, iface.list_zones)
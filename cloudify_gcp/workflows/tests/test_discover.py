@@ -3,7 +3,12 @@ from mock import patch, call, MagicMock
 
 from ..._compat import PY2
 from .. import resources, discover
+from ...gcp import GCPError
+from ...inventory import inventory_store
 from cloudify.state import current_ctx
+from cloudify.exceptions import NonRecoverableError
+
+CLUSTERS = 'projects.zones.clusters'
 
 
 @patch('cloudify_gcp.gcp.service_account.Credentials.'
@@ -43,15 +48,17 @@ class GCPeWorkflowTests(TestCase):
         mock_rest_client.deployment_groups = mock_deployment_groups_client
         return mock_rest_client
 
-    @patch('cloudify_gcp.workflows.discover.get_resources')
-    def test_discover_resources(self, mock_get_resources, *_):
+    @patch('cloudify_gcp.workflows.resources.iter_resources')
+    def test_discover_resources(self, mock_iter_resources, *_):
         mock_ctx = MagicMock()
+        mock_ctx.deployment.id = 'dep'
         node = MagicMock()
-        node_instance = MagicMock()
+        node_instance = MagicMock(id='account')
         node_instance._node_instance = MagicMock(
             runtime_properties={'resources': {}})
-        result = {'foo': 'bar'}
-        mock_get_resources.return_value = result
+        resource = {'name': 'foo', 'status': 'RUNNING', 'nodePools': []}
+        mock_iter_resources.return_value = [
+            ('zone', CLUSTERS, 'foo', resource)]
         node_instances = [node_instance]
         node.instances = node_instances
         mock_ctx.get_node.return_value = node
@@ -63,7 +70,19 @@ class GCPeWorkflowTests(TestCase):
             'zones': ['taco'],
             'ctx': mock_ctx
         }
-        self.assertEqual(discover.discover_resources(**params), result)
+        result = discover.discover_resources(**params)
+        entry = result['zone'][CLUSTERS]['foo']
+        self.assertEqual(entry['name'], 'foo')
+        self.assertNotIn('nodePools', entry)
+        self.assertEqual(
+            node_instance._node_instance.runtime_properties['resources'],
+            result)
+        # The resource is read from the inventory of the node instance
+        self.assertEqual(
+            inventory_store.get(
+                resources.get_inventory_name('dep', 'account'),
+                entry['offset']),
+            resource)
 
     @patch('cloudify_common_sdk.utils.get_rest_client')
     def test_deploy_resources(self, get_rest_client, *_):
@@ -86,20 +105,33 @@ class GCPeWorkflowTests(TestCase):
         self.assertTrue(
             mock_rest_client.deployment_groups.add_deployments.called)
 
-    @patch('cloudify_common_sdk.utils.get_rest_client')
-    @patch('cloudify_gcp.workflows.discover.deploy_resources')
-    @patch('cloudify_gcp.workflows.discover.discover_resources')
-    def test_discover_and_deploy(self, mock_discover, mock_deploy, *_):
+    def get_account_ctx(self, runtime_properties=None):
         mock_ctx = MagicMock()
         mock_ctx.deployment = MagicMock(id='foo')
         mock_ctx.blueprint = MagicMock(id='bar')
         mock_ctx.plugin = MagicMock(properties={})
+        node_instance = MagicMock(id='account')
+        node_instance._node_instance = MagicMock(
+            runtime_properties=runtime_properties or {})
+        mock_ctx.get_node.return_value.instances = [node_instance]
+        return mock_ctx, node_instance._node_instance.runtime_properties
+
+    @patch('cloudify_gcp.workflows.discover.get_rest_client')
+    @patch('cloudify_gcp.workflows.discover.install_deployments')
+    @patch('cloudify_gcp.workflows.discover.deploy_resources')
+    @patch('cloudify_gcp.workflows.discover.discover_resources')
+    def test_discover_and_deploy(self, mock_discover, mock_deploy,
+                                 mock_install, mock_rest_client, *_):
+        mock_rest_client().execution_groups.get.return_value.status = \
+            'terminated'
+        mock_ctx, runtime_properties = self.get_account_ctx()
         current_ctx.set(mock_ctx)
         params = {
             'node_id': 'foo',
             'resource_types': ['bar', 'baz'],
             'zones': ['taco'],
             'blueprint_id': 'foo',
+            'chunk_size': 2,
             'ctx': mock_ctx
         }
         mock_discover.return_value = {
@@ -119,33 +151,186 @@ class GCPeWorkflowTests(TestCase):
             }
         }
         discover.discover_and_deploy(**params)
+        # The snapshot is stored with the checkpoint of the chunks
+        self.assertFalse(mock_discover.call_args[1]['save'])
         self.assertEqual(mock_deploy.call_count, 3)
         expected_calls = [
-            call('foo', 'foo', ['foo-resource1', 'foo-resource2'],
+            call('foo-0', 'foo', ['foo-resource1', 'foo-resource2'],
                  [{'kubernetes_cluster_name': 'resource1',
                    'zone': 'region1'},
                   {'kubernetes_cluster_name': 'resource2',
                    'zone': 'region1'}],
                  [{'csys-env-type': 'environment'},
-                  {'csys-obj-parent': 'foo'}],
+                  {'csys-obj-parent': 'foo'},
+                  {'csys-env-type': 'resource_type1'}],
                  mock_ctx),
-            call('foo', 'foo', ['foo-resource3'], [
-                {'kubernetes_cluster_name': 'resource3', 'zone': 'region1'}],
-                 [{'csys-env-type': 'environment'},
-                  {'csys-obj-parent': 'foo'}],
-                 mock_ctx),
-            call('foo', 'foo', ['foo-resource4'],
+            call('foo-1', 'foo', ['foo-resource4'],
                  [{'kubernetes_cluster_name': 'resource4',
                    'zone': 'region2'}],
                  [{'csys-env-type': 'environment'},
-                  {'csys-obj-parent': 'foo'}],
+                  {'csys-obj-parent': 'foo'},
+                  {'csys-env-type': 'resource_type1'}],
+                 mock_ctx),
+            call('foo-2', 'foo', ['foo-resource3'], [
+                {'kubernetes_cluster_name': 'resource3', 'zone': 'region1'}],
+                 [{'csys-env-type': 'environment'},
+                  {'csys-obj-parent': 'foo'},
+                  {'csys-env-type': 'resource_type2'}],
                  mock_ctx)]
         if PY2:
             return
-        mock_deploy.assert_has_calls(expected_calls)
+        mock_deploy.assert_has_calls(expected_calls, any_order=True)
+        self.assertEqual(sorted(c[0][0] for c in mock_install.call_args_list),
+                         ['foo-0', 'foo-1', 'foo-2'])
+        self.assertEqual(
+            runtime_properties[discover.CHECKPOINT],
+            {'next_chunk': 3, 'chunks': {}})
+
+    @patch('cloudify_gcp.workflows.discover.get_rest_client')
+    @patch('cloudify_gcp.workflows.discover.install_deployments')
+    @patch('cloudify_gcp.workflows.discover.deploy_resources')
+    @patch('cloudify_gcp.workflows.discover.discover_resources')
+    def test_discover_and_deploy_resume(self, mock_discover, mock_deploy,
+                                        mock_install, mock_rest_client, *_):
+        mock_rest_client().execution_groups.get.return_value.status = \
+            'terminated'
+        mock_ctx, runtime_properties = self.get_account_ctx({
+            discover.CHECKPOINT: {
+                'next_chunk': 2,
+                'chunks': {
+                    'foo-0': {
+                        'state': discover.CREATED,
+                        'resource_type': 'resource_type1',
+                        'deployment_ids': ['foo-resource1'],
+                        'inputs': [{'kubernetes_cluster_name': 'resource1',
+                                    'zone': 'region1'}],
+                    },
+                    'foo-1': {
+                        'state': discover.PENDING,
+                        'resource_type': 'resource_type1',
+                        'deployment_ids': ['foo-resource2'],
+                        'inputs': [{'kubernetes_cluster_name': 'resource2',
+                                    'zone': 'region1'}],
+                    },
+                },
+            },
+        })
+        current_ctx.set(mock_ctx)
+        mock_discover.return_value = {
+            'region1': {
+                'resource_type1': {
+                    'resource1': MagicMock(),
+                    'resource2': MagicMock(),
+                    'resource3': MagicMock(),
+                },
+            },
+        }
+        mock_install.side_effect = [
+            MagicMock(id='install-0'), MagicMock(id='install-1'),
+            RuntimeError('failed')]
+        with self.assertRaises(RuntimeError):
+            discover.discover_and_deploy(node_id='foo',
+                                         blueprint_id='foo',
+                                         concurrency=1,
+                                         ctx=mock_ctx)
+        # The created chunk is only installed, and the new resource is
+        # deployed in a new chunk.
+        self.assertEqual(sorted(c[0][0] for c in mock_deploy.call_args_list),
+                         ['foo-1', 'foo-2'])
+        self.assertEqual(mock_install.call_count, 3)
+        # The failed chunk is resumed by the next run.
+        self.assertEqual(
+            runtime_properties[discover.CHECKPOINT],
+            {'next_chunk': 3,
+             'chunks': {'foo-2': {
+                 'state': discover.CREATED,
+                 'resource_type': 'resource_type1',
+                 'deployment_ids': ['foo-resource3'],
+                 'inputs': [{'kubernetes_cluster_name': 'resource3',
+                             'zone': 'region1'}]}}})
+
+    def get_installing_checkpoint(self):
+        return self.get_account_ctx({
+            discover.CHECKPOINT: {
+                'next_chunk': 1,
+                'chunks': {
+                    'foo-0': {
+                        'state': discover.INSTALLING,
+                        'execution_group_id': 'install-0',
+                        'resource_type': 'resource_type1',
+                        'deployment_ids': ['foo-resource1'],
+                        'inputs': [{'kubernetes_cluster_name': 'resource1',
+                                    'zone': 'region1'}],
+                    },
+                },
+            },
+        })
+
+    @patch('cloudify_gcp.workflows.discover.time.sleep')
+    @patch('cloudify_gcp.workflows.discover.get_rest_client')
+    @patch('cloudify_gcp.workflows.discover.install_deployments')
+    @patch('cloudify_gcp.workflows.discover.deploy_resources')
+    @patch('cloudify_gcp.workflows.discover.discover_resources')
+    def test_discover_and_deploy_resume_installing(
+            self, mock_discover, mock_deploy, mock_install,
+            mock_rest_client, mock_sleep, *_):
+        groups = mock_rest_client().execution_groups
+        groups.get.side_effect = [MagicMock(status='started'),
+                                  MagicMock(status='terminated')]
+        mock_ctx, runtime_properties = self.get_installing_checkpoint()
+        current_ctx.set(mock_ctx)
+        mock_discover.return_value = {}
+        discover.discover_and_deploy(node_id='foo', blueprint_id='foo',
+                                     ctx=mock_ctx)
+        # The started install is waited for, not started again
+        mock_deploy.assert_not_called()
+        mock_install.assert_not_called()
+        groups.get.assert_called_with('install-0',
+                                      _include=['id', 'status'])
+        mock_sleep.assert_called_once_with(
+            discover.constants.DEPLOY_POLL_INTERVAL)
+        self.assertEqual(runtime_properties[discover.CHECKPOINT]['chunks'],
+                         {})
+
+    @patch('cloudify_gcp.workflows.discover.get_rest_client')
+    @patch('cloudify_gcp.workflows.discover.install_deployments')
+    @patch('cloudify_gcp.workflows.discover.deploy_resources')
+    @patch('cloudify_gcp.workflows.discover.discover_resources')
+    def test_discover_and_deploy_install_failed(
+            self, mock_discover, mock_deploy, mock_install,
+            mock_rest_client, *_):
+        mock_rest_client().execution_groups.get.return_value.status = \
+            'failed'
+        mock_ctx, runtime_properties = self.get_installing_checkpoint()
+        current_ctx.set(mock_ctx)
+        mock_discover.return_value = {}
+        with self.assertRaises(NonRecoverableError):
+            discover.discover_and_deploy(node_id='foo', blueprint_id='foo',
+                                         ctx=mock_ctx)
+        # The next run installs the chunk again
+        chunk = runtime_properties[discover.CHECKPOINT]['chunks']['foo-0']
+        self.assertEqual(chunk['state'], discover.CREATED)
+
+    @patch('cloudify_gcp.workflows.discover.time.sleep')
+    @patch('cloudify_gcp.workflows.discover.get_rest_client')
+    def test_checkpoint_save(self, mock_rest_client, mock_sleep, *_):
+        mock_ctx, _ = self.get_account_ctx()
+        node_instance = mock_ctx.get_node.return_value.instances[0]
+        checkpoint = discover.DeploymentCheckpoint(node_instance,
+                                                   mock_ctx.logger)
+        update = mock_rest_client().node_instances.update
+        update.side_effect = [RuntimeError('unavailable'), None]
+        checkpoint.save()
+        self.assertEqual(update.call_count, 2)
+
+        update.side_effect = RuntimeError('unavailable')
+        with self.assertRaises(NonRecoverableError):
+            checkpoint.save()
 
     @patch('cloudify_gcp.container_engine.cluster')
-    def test_get_resources(self, *_):
+    def test_get_resources(self, _, mock_build, *__):
+        mock_build().projects().locations().clusters().list().execute\
+            .return_value = {}
         mock_ctx = MagicMock()
         node = MagicMock(
             properties={
@@ -173,8 +358,9 @@ class GCPeWorkflowTests(TestCase):
         }
         self.assertEqual(resources.get_resources(**params), {})
 
-    @patch('cloudify_gcp.container_engine.cluster.Cluster.list')
-    def test_initialize(self, *_):
+    def test_initialize(self, mock_build, *_):
+        mock_build().projects().locations().clusters().list().execute\
+            .return_value = {}
         mock_ctx = MagicMock()
         mock_ctx.node = MagicMock(
             properties={
@@ -198,3 +384,305 @@ class GCPeWorkflowTests(TestCase):
         resources.initialize(**params)
         self.assertIn('resources',
                       mock_ctx.instance.runtime_properties)
+
+    def test_get_resources_isolates_zone_errors(self, mock_build, *_):
+        def list_zone(projectId, zone):
+            if zone == 'region2':
+                raise GCPError('zone is not available')
+            request = MagicMock()
+            request.execute.return_value = {
+                'clusters': [{'name': 'cluster-{0}'.format(zone)}]}
+            return request
+
+        clusters = mock_build().projects().zones().clusters()
+        clusters.list.side_effect = list_zone
+        clusters.list_next = None
+        logger = MagicMock()
+        node = MagicMock(
+            id='foo',
+            properties={
+                'client_config': {
+                    'auth': {'foo': 'bar'},
+                    'project': 'foo',
+                    'zone': 'bar'
+                }
+            }
+        )
+        mock_ctx = MagicMock()
+        mock_ctx.plugin = MagicMock(properties={})
+        current_ctx.set(mock_ctx)
+        failures = []
+        self.assertEqual(
+            resources.get_resources(
+                node, ['region1', 'region2', 'region3'],
+                ['projects.zones.clusters'], logger, concurrency=2,
+                aggregated=False, failures=failures),
+            {
+                'region1': {'projects.zones.clusters': {
+                    'cluster-region1': {'name': 'cluster-region1'}}},
+                'region3': {'projects.zones.clusters': {
+                    'cluster-region3': {'name': 'cluster-region3'}}},
+            })
+        self.assertEqual(clusters.list.call_count, 3)
+        logger.error.assert_called_once()
+        self.assertEqual(failures,
+                         [('region2', 'projects.zones.clusters')])
+
+        clusters.list.side_effect = GCPError('invalid credentials')
+        with self.assertRaises(GCPError):
+            resources.get_resources(
+                node, ['region1', 'region2'],
+                ['projects.zones.clusters'], logger, aggregated=False)
+
+    def test_get_resources_aggregated(self, mock_build, *_):
+        all_clusters = mock_build().projects().locations().clusters()
+        all_clusters.list_next = None
+        all_clusters.list().execute.return_value = {
+            'clusters': [
+                {'name': 'a', 'location': 'region1'},
+                {'name': 'b', 'location': 'region1'},
+                {'name': 'c', 'location': 'region3'},
+                {'name': 'd', 'location': 'elsewhere'},
+            ],
+            'missingZones': ['region2'],
+        }
+        clusters = mock_build().projects().zones().clusters()
+        clusters.list_next = None
+        clusters.list().execute.return_value = {'clusters': [{'name': 'e'}]}
+        clusters.list.reset_mock()
+        node = MagicMock(
+            id='foo',
+            properties={
+                'client_config': {
+                    'auth': {'foo': 'bar'},
+                    'project': 'foo',
+                    'zone': 'bar'
+                }
+            }
+        )
+        mock_ctx = MagicMock()
+        mock_ctx.plugin = MagicMock(properties={})
+        current_ctx.set(mock_ctx)
+        result = resources.get_resources(
+            node, ['region1', 'region2', 'region3'],
+            ['projects.zones.clusters'], MagicMock())
+        all_clusters.list.assert_called_with(parent='projects/foo/locations/-')
+        self.assertEqual(
+            {zone: sorted(result[zone]['projects.zones.clusters'])
+             for zone in result},
+            {'region1': ['a', 'b'], 'region2': ['e'], 'region3': ['c']})
+        # Only the zone the aggregated request missed is listed
+        clusters.list.assert_called_once_with(projectId='foo', zone='region2')
+
+        # Falls back to listing every zone
+        all_clusters.list().execute.side_effect = GCPError('not allowed')
+        clusters.list.reset_mock()
+        failures = []
+        result = resources.get_resources(
+            node, ['region1', 'region2'],
+            ['projects.zones.clusters'], MagicMock(), failures=failures)
+        self.assertEqual(clusters.list.call_count, 2)
+        self.assertEqual(sorted(result), ['region1', 'region2'])
+        self.assertEqual(failures, [])
+
+    def test_get_resources_strategies(self, mock_build, *_):
+        instances = mock_build().instances()
+        instances.aggregatedList_next = None
+        instances.aggregatedList().execute.return_value = {
+            'items': {
+                'zones/us-east1-b': {'instances': [{'name': 'vm'}]},
+                'zones/us-west1-a': {'instances': [{'name': 'other'}]},
+                'zones/us-east1-c': {'warning': {'code': 'NO_RESULTS'}},
+            },
+        }
+        networks = mock_build().networks()
+        networks.list_next = None
+        networks.list().execute.return_value = {'items': [{'name': 'net'}]}
+        networks.list.reset_mock()
+        node = MagicMock(
+            id='foo',
+            properties={
+                'client_config': {
+                    'auth': {'foo': 'bar'},
+                    'project': 'foo',
+                    'zone': 'bar'
+                }
+            }
+        )
+        mock_ctx = MagicMock()
+        mock_ctx.plugin = MagicMock(properties={})
+        current_ctx.set(mock_ctx)
+        result = resources.get_resources(
+            node, ['us-east1-b', 'us-east1-c'],
+            ['projects.zones.instances', 'projects.global.networks'],
+            MagicMock())
+        self.assertEqual(result, {
+            'us-east1-b': {'projects.zones.instances': {
+                'vm': {'name': 'vm'}}},
+            'global': {'projects.global.networks': {
+                'net': {'name': 'net'}}},
+        })
+        instances.aggregatedList.assert_called_with(project='foo')
+        networks.list.assert_called_once_with(project='foo')
+
+    def test_get_resources_catalog_regions(self, mock_build, *_):
+        zones = mock_build().zones()
+        zones.list_next = None
+        zones.list().execute.return_value = {'items': [
+            {'name': 'us-east1-b', 'region': 'regions/us-east1'},
+            {'name': 'edge-b', 'region': 'regions/us-west2'},
+        ]}
+        subnetworks = mock_build().subnetworks()
+        subnetworks.list_next = None
+        subnetworks.list().execute.return_value = {
+            'items': [{'name': 'subnet'}]}
+        subnetworks.list.reset_mock()
+        node = MagicMock(
+            id='foo',
+            properties={
+                'client_config': {
+                    'auth': {'foo': 'bar'},
+                    'project': 'foo',
+                    'zone': 'bar'
+                }
+            }
+        )
+        mock_ctx = MagicMock()
+        mock_ctx.plugin = MagicMock(properties={})
+        current_ctx.set(mock_ctx)
+        logger = MagicMock()
+        result = resources.get_resources(
+            node, ['us-east1-b', 'edge-b', 'gone-b'],
+            ['projects.regions.subnetworks'], logger, aggregated=False)
+        # The regions of the zones are the ones of the zone catalog
+        self.assertEqual(sorted(result), ['us-east1', 'us-west2'])
+        self.assertEqual(
+            sorted(kwargs['region'] for _, kwargs in
+                   subnetworks.list.call_args_list),
+            ['us-east1', 'us-west2'])
+        logger.warn.assert_called_once()
+
+    def test_get_resources_unsupported_type(self, *_):
+        with self.assertRaises(NonRecoverableError):
+            resources.get_resources(
+                MagicMock(), ['region1'], ['projects.zones.taco'],
+                MagicMock())
+
+    def test_get_zones(self, mock_build, *_):
+        mock_build().zones().list().execute.return_value = {
+            'items': [
+                {'name': 'b-zone', 'region': 'regions/b', 'status': 'UP'},
+                {'name': 'a-zone', 'region': 'regions/a', 'status': 'UP'},
+                {'name': 'c-zone', 'region': 'regions/c', 'status': 'DOWN'},
+            ]
+        }
+        node = MagicMock(
+            id='foo',
+            properties={
+                'client_config': {
+                    'auth': {'foo': 'bar'},
+                    'project': 'foo',
+                    'zone': 'bar'
+                }
+            }
+        )
+        mock_ctx = MagicMock()
+        mock_ctx.plugin = MagicMock(properties={})
+        current_ctx.set(mock_ctx)
+        self.assertEqual(resources.get_zones(node, 'deployment'),
+                         ['a-zone', 'b-zone'])
+
+    def test_diff_fingerprints(self, *_):
+        previous = {
+            'zone1': {'type': {'a': '1', 'b': '1'}},
+            'zone2': {'type': {'c': '1'}},
+            'zone3': {'type': {'d': '1'}},
+        }
+        current = {
+            'zone1': {'type': {'a': '2', 'e': '1'}},
+        }
+        changes = resources.diff_fingerprints(
+            previous, current, [('zone3', 'type')])
+        self.assertEqual(changes, {
+            'added': {'zone1': {'type': ['e']}},
+            'removed': {'zone1': {'type': ['b']},
+                        'zone2': {'type': ['c']}},
+            'changed': {'zone1': {'type': ['a']}},
+        })
+        # Resources of zones which could not be listed are kept
+        self.assertEqual(current['zone3'], previous['zone3'])
+
+    @patch('cloudify_gcp.workflows.resources.iter_resources')
+    def test_resource_index_keeps_failures(self, mock_iter_resources, *_):
+        mock_iter_resources.return_value = [
+            ('zone1', CLUSTERS, 'a', {'name': 'a'}),
+            ('zone2', CLUSTERS, 'b', {'name': 'b'})]
+        previous = resources.get_resource_index(
+            'inventory', MagicMock(), ['zone1', 'zone2'], [CLUSTERS],
+            MagicMock())
+
+        def iter_resources(*args, **kwargs):
+            kwargs['failures'].append(('zone2', CLUSTERS))
+            return [('zone1', CLUSTERS, 'a', {'name': 'a', 'v': 2})]
+
+        mock_iter_resources.side_effect = iter_resources
+        index = resources.get_resource_index(
+            'inventory', MagicMock(), ['zone1', 'zone2'], [CLUSTERS],
+            MagicMock(), previous=previous)
+        # The resource of the zone which could not be listed is copied
+        # into the new inventory
+        self.assertEqual(
+            inventory_store.get('inventory',
+                                index['zone2'][CLUSTERS]['b']['offset']),
+            {'name': 'b'})
+        self.assertEqual(
+            inventory_store.get('inventory',
+                                index['zone1'][CLUSTERS]['a']['offset']),
+            {'name': 'a', 'v': 2})
+
+    @patch('cloudify_gcp.workflows.discover.get_rest_client')
+    @patch('cloudify_gcp.workflows.resources.iter_resources')
+    def test_discover_resources_incremental(self, mock_iter_resources,
+                                            mock_rest_client, *_):
+        runtime_properties = {}
+        node_instance = MagicMock(id='account')
+        node_instance._node_instance = MagicMock(
+            runtime_properties=runtime_properties)
+        mock_ctx = MagicMock()
+        mock_ctx.get_node.return_value = MagicMock(
+            instances=[node_instance])
+        current_ctx.set(mock_ctx)
+        params = {
+            'node_id': 'foo',
+            'resource_types': [CLUSTERS],
+            'zones': ['zone'],
+            'incremental': True,
+            'ctx': mock_ctx
+        }
+
+        mock_iter_resources.return_value = [
+            ('zone', CLUSTERS, 'a', {'name': 'a', 'v': 1})]
+        self.assertEqual(
+            list(discover.discover_resources(**params)['zone'][CLUSTERS]),
+            ['a'])
+        mock_rest_client().node_instances.update.assert_called_once_with(
+            'account', runtime_properties=runtime_properties, force=True)
+
+        mock_iter_resources.return_value = [
+            ('zone', CLUSTERS, 'a', {'name': 'a', 'v': 2}),
+            ('zone', CLUSTERS, 'b', {'name': 'b', 'v': 1})]
+        self.assertEqual(
+            list(discover.discover_resources(**params)['zone'][CLUSTERS]),
+            ['b'])
+        self.assertEqual(runtime_properties[discover.CHANGES], {
+            'added': {'zone': {CLUSTERS: ['b']}},
+            'removed': {},
+            'changed': {'zone': {CLUSTERS: ['a']}},
+        })
+        self.assertEqual(
+            sorted(runtime_properties['resources']['zone'][CLUSTERS]),
+            ['a', 'b'])
+
+        mock_rest_client().node_instances.update.reset_mock()
+        discover.discover_resources(save=False, **params)
+        mock_rest_client().node_instances.update.assert_not_called()
@@ -0,0 +1,96 @@
+from unittest import TestCase
+from mock import MagicMock
+
+from cloudify.exceptions import NonRecoverableError
+
+from .. import registry
+
+
+def page(response, next_page=None):
+    request = MagicMock()
+    request.execute.return_value = dict(response, nextPageToken=next_page)
+    return request
+
+
+class RegistryTest(TestCase):
+
+    def test_lister(self):
+        zones = ['a-1-b', 'a-1-c', 'a-2-b']
+        regions = {'a-1-b': 'a-1', 'a-1-c': 'a-1', 'a-2-b': 'a-2'}
+        clusters = registry.type_registry.get('projects.zones.clusters')
+        self.assertEqual(
+            clusters.lister(zones[:2], regions).strategy, registry.WILDCARD)
+        self.assertEqual(
+            clusters.lister(['a-1-b'], regions, all_locations=False).strategy,
+            registry.ZONAL)
+        # No zones need no requests
+        self.assertEqual(clusters.lister([], {}).strategy, registry.ZONAL)
+
+        subnetworks = registry.type_registry.get(
+            'projects.regions.subnetworks')
+        fallback = subnetworks.fallback(zones, regions)
+        self.assertEqual(fallback.strategy, registry.REGIONAL)
+        self.assertEqual(fallback.scopes(zones, regions), ['a-1', 'a-2'])
+        # The regions are the ones of the zone catalog, not of the names
+        self.assertEqual(fallback.scopes(zones, dict(regions, **{
+            'a-2-b': 'b-3'})), ['a-1', 'b-3'])
+
+        networks = registry.type_registry.get('projects.global.networks')
+        self.assertEqual(networks.lister(['a-1-b'], regions).strategy,
+                         registry.GLOBAL)
+
+    def test_lister_is_abstract(self):
+        with self.assertRaises(TypeError):
+            registry.Lister(lambda iface: iface.discovery.disks())
+
+    def test_unsupported_type(self):
+        self.assertNotIn('projects.zones.taco', registry.type_registry)
+        with self.assertRaises(NonRecoverableError):
+            registry.type_registry.get('projects.zones.taco')
+
+    def test_aggregated_lister(self):
+        iface = MagicMock(project='foo')
+        iface.pages.return_value = iter([
+            {'items': {
+                'zones/a-1-b': {'instances': [{'name': 'a'}]},
+                'zones/a-1-c': {'warning': {'code': 'NO_RESULTS_ON_PAGE'}},
+            }},
+            {'items': {'zones/a-1-b': {'instances': [{'name': 'b'}]}},
+             'unreachables': ['zones/a-2-b']},
+        ])
+        lister = registry.AggregatedLister(
+            lambda iface: iface.discovery.instances(), 'instances')
+        missing = []
+        self.assertEqual(
+            list(lister.list(iface, None, missing)),
+            [('a-1-b', {'name': 'a'}), ('a-1-b', {'name': 'b'})])
+        self.assertEqual(missing, ['a-2-b'])
+        iface.pages.assert_called_once_with(
+            iface.discovery.instances(), 'aggregatedList', project='foo')
+
+    def test_wildcard_lister(self):
+        collection = MagicMock()
+        collection.list.return_value = page(
+            {'clusters': [{'name': 'a', 'location': 'a-1-b'}],
+             'missingZones': ['a-1-c']})
+        iface = MagicMock(project='foo')
+        iface.pages.side_effect = lambda collection, **kwargs: iter(
+            [collection.list(**kwargs).execute()])
+        lister = registry.WildcardLister(lambda _: collection, 'clusters')
+        missing = []
+        self.assertEqual(list(lister.list(iface, None, missing)),
+                         [('a-1-b', {'name': 'a', 'location': 'a-1-b'})])
+        self.assertEqual(missing, ['a-1-c'])
+        collection.list.assert_called_with(parent='projects/foo/locations/-')
+
+    def test_global_lister(self):
+        iface = MagicMock(project='foo')
+        topic = {'name': 'projects/foo/topics/t'}
+        iface.paginate.return_value = iter([topic])
+        lister = registry.GlobalLister(
+            lambda iface: iface.discovery_pubsub.topics(), 'topics',
+            project_format='projects/{0}')
+        self.assertEqual(list(lister.list(iface, None, [])),
+                         [(registry.GLOBAL, topic)])
+        iface.paginate.assert_called_once_with(
+            iface.discovery_pubsub.topics(), 'topics', project='projects/foo')
@@ -0,0 +1,117 @@
+########
+# Copyright (c) 2014-2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Catalog of the zones, and their regions, available to a project.
+
+The zones of a project are listed once per TTL and kept in a JSON file per
+project under the plugin files directory, so all worker processes of the
+host share them instead of listing the zones for every object.
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+from os.path import basename
+
+from . import constants
+
+ZONE_UP = 'UP'
+
+
+def catalog_entry(zones):
+    """
+    :param zones: zone resources listed from the compute API
+    :return: dictionary of zones by name, with the region_name of each zone
+    """
+    entry = {}
+    for zone in zones:
+        entry[zone['name']] = dict(zone, region_name=basename(zone['region']))
+    return entry
+
+
+class ZoneCatalog(object):
+    """
+    Zones of projects, cached in memory and on disk for ttl seconds.
+    The catalog is only an optimization, hosts where the plugin files
+    directory is not writable keep the zones in memory.
+    """
+    def __init__(self, path=constants.ZONE_CATALOG_PATH,
+                 ttl=constants.ZONE_CATALOG_TTL,
+                 clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def project_path(self, project):
+        return os.path.join(self.path, '{0}.json'.format(project))
+
+    def zones(self, project, fetch, refresh=False):
+        """
+        Get the zones of a project.
+
+        :param project: project ID
+        :param fetch: callable listing the zone resources of the project
+        :param refresh: list the zones even if the cached ones are fresh
+        :return: dictionary of zones by name, each zone has a region_name
+        """
+        if not refresh:
+            entry = self._entries.get(project) or self._read(project)
+            if entry and self._clock() - entry['updated'] < self.ttl:
+                return entry['zones']
+        entry = {'updated': self._clock(), 'zones': catalog_entry(fetch())}
+        with self._lock:
+            self._entries[project] = entry
+        self._write(project, entry)
+        return entry['zones']
+
+    def available_zones(self, project, fetch):
+        """
+        :return: sorted names of the zones of the project which are up
+        """
+        return sorted(name for name, zone in self.zones(project, fetch).items()
+                      if zone.get('status', ZONE_UP) == ZONE_UP)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _read(self, project):
+        try:
+            with open(self.project_path(project)) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        with self._lock:
+            self._entries[project] = entry
+        return entry
+
+    def _write(self, project, entry):
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fd, temp_path = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.rename(temp_path, self.project_path(project))
+        except (IOError, OSError):
+            pass
+
+
+zone_catalog = ZoneCatalog()
@@ -33,7 +33,8 @@ install_requires = [
     'oauth2client==4.1.3',
     'google-auth==2.15.0',
     'jsonschema==3.0.0',
-    'httplib2>=0.18.0'
+    'httplib2>=0.18.0',
+    'google-crc32c>=1.1.2',
 ]
 
 